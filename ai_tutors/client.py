@@ -1,7 +1,8 @@
+import json
 import requests
 from IPython.display import Markdown, display
 from IPython import get_ipython
-from typing import Optional
+from typing import Iterator, Optional, Union
 
 # Jupyter notebook print function
 def printmd(string: str) -> None:
@@ -13,7 +14,8 @@ class AITutor:
     This provides a simple interface for users who install the package to interact with their tutor.
     """
     
-    def __init__(self, access_code: str, base_url: Optional[str] = None, verbose: bool = True):
+    def __init__(self, access_code: str, base_url: Optional[str] = None, verbose: bool = True,
+                 use_sessions: bool = True):
         """
         Initialize the AI Tutor client.
         
@@ -21,6 +23,7 @@ class AITutor:
             access_code (str): Your AI Tutor access code
             base_url (str): The base URL of the API
             verbose (bool): Whether to print responses to console
+            use_sessions (bool): Whether to keep the conversation on the server so that each turn only sends the new prompt
         """
         if base_url is None:
             # Simple adjustment to automatically handle Heroku and non-Heroku URLs
@@ -36,6 +39,10 @@ class AITutor:
         self.base_url = base_url
         self.message_history = []
         self.verbose = verbose
+        self.use_sessions = use_sessions
+        self.session_id = None
+        # Summary of the earlier conversation, kept by the server when using sessions
+        self.conversation_summary = None
         
         # Tutor information attributes
         self.instructions = ""
@@ -105,16 +112,17 @@ class AITutor:
             print(f"Error in load_tutor_info: {str(e)}")
             raise
     
-    def get_response(self, prompt: str, restart_chat: bool = False) -> str:
+    def get_response(self, prompt: str, restart_chat: bool = False, stream: bool = False) -> Union[str, Iterator[str]]:
         """
         Send a question or prompt to your AI Tutor and get a response.
         
         Args:
             prompt (str): The question or prompt for your tutor
             restart_chat (bool): If True, restart the conversation from scratch
+            stream (bool): If True, return an iterator that yields chunks of the response as they arrive
             
         Returns:
-            str: The tutor's response
+            str: The tutor's response (or an iterator of response chunks if stream=True)
             
         Raises:
             requests.exceptions.HTTPError: If the API request fails
@@ -127,6 +135,8 @@ class AITutor:
                 else:
                     print('\n\nAI Tutor:\n\n'+ self.introduction)
             self.message_history = []
+            self.conversation_summary = None
+            self._end_session()
 
         if self.verbose:
             if self.is_notebook:
@@ -134,9 +144,22 @@ class AITutor:
                 print(prompt)
             else:
                 print('\n\nStudent: ' + prompt)
-        
-        # API endpoint for querying the model
-        url = f"{self.base_url}/query"
+
+        if self.use_sessions:
+            # Only the new prompt is sent, the conversation is kept on the server
+            if stream:
+                return self._stream_response("query/stream", {"user_prompt": prompt}, session_prompt=prompt)
+            result = self._session_request("query", {"user_prompt": prompt})
+            ai_response = result["response"]
+            self.message_history.append({"role": "user", "content": prompt})
+            self.message_history.append({"role": "assistant", "content": ai_response})
+
+            if self.verbose:
+                if self.is_notebook:
+                    printmd('\n\n**AI Tutor:**\n\n'+ ai_response)
+                else:
+                    print('\n\nAI Tutor:\n\n'+ ai_response)
+            return ai_response
         
         # Prepare tutor info
         tutor_info = {
@@ -155,8 +178,15 @@ class AITutor:
             "user_prompt": prompt,
             "access_code": self.access_code,
             "message_history": self.message_history,
-            "tutor_info": tutor_info
+            "tutor_info": tutor_info,
+            "conversation_summary": self.conversation_summary
         }
+
+        if stream:
+            return self._stream_response("query/stream", payload)
+
+        # API endpoint for querying the model
+        url = f"{self.base_url}/query"
         
         # Send request to API
         response = requests.post(
@@ -174,6 +204,7 @@ class AITutor:
         # Get the response text
         ai_response = result["response"]
         self.message_history = result["message_history"]
+        self.conversation_summary = result.get("conversation_summary")
 
         if self.verbose:
             if self.is_notebook:
@@ -181,6 +212,106 @@ class AITutor:
             else:
                 print('\n\nAI Tutor:\n\n'+ ai_response)
         return ai_response
+
+    def _start_session(self) -> None:
+        """
+        Start a conversation on the server, resuming from the local message history if there is one.
+        """
+        response = requests.post(
+            f"{self.base_url}/sessions",
+            json={"access_code": self.access_code, "message_history": self.message_history or None},
+            headers={"Content-Type": "application/json"}
+        )
+        response.raise_for_status()
+        result = response.json()
+        self.session_id = result["session_id"]
+        self.message_history = result["message_history"]
+
+    def _end_session(self) -> None:
+        """
+        End the conversation on the server (if there is one).
+        """
+        if self.session_id is not None:
+            try:
+                requests.delete(f"{self.base_url}/sessions/{self.session_id}")
+            except requests.exceptions.RequestException:
+                # The session will expire on its own
+                pass
+            self.session_id = None
+
+    def _post_to_session(self, endpoint: str, payload: dict, **kwargs) -> requests.Response:
+        """
+        Send a request to the current session, starting a new one if needed.
+        If the session has expired on the server, it is restarted from the local message history.
+        """
+        if self.session_id is None:
+            self._start_session()
+        response = requests.post(f"{self.base_url}/sessions/{self.session_id}/{endpoint}", json=payload,
+                                 headers={"Content-Type": "application/json"}, **kwargs)
+        if response.status_code == 404:
+            # Session expired, so resume the conversation in a new one
+            response.close()
+            self._start_session()
+            response = requests.post(f"{self.base_url}/sessions/{self.session_id}/{endpoint}", json=payload,
+                                     headers={"Content-Type": "application/json"}, **kwargs)
+        # Raise exception if request failed
+        response.raise_for_status()
+        return response
+
+    def _session_request(self, endpoint: str, payload: dict) -> dict:
+        """
+        Send a request to the current session and return the parsed response.
+        """
+        return self._post_to_session(endpoint, payload).json()
+
+    def _stream_response(self, endpoint: str, payload: dict, session_prompt: Optional[str] = None) -> Iterator[str]:
+        """
+        Send a query to a streaming endpoint and yield chunks of the response as they arrive.
+        The message history is updated once the final event has been received.
+
+        Args:
+            endpoint (str): The streaming endpoint (relative to the base URL, or to the session if session_prompt is given)
+            payload (dict): The request payload
+            session_prompt (str): The prompt being sent to the current session (None when not using sessions)
+        """
+        if session_prompt is not None:
+            response = self._post_to_session(endpoint, payload, stream=True)
+        else:
+            response = requests.post(f"{self.base_url}/{endpoint}", json=payload, stream=True,
+                                     headers={"Content-Type": "application/json", "Accept": "text/event-stream"})
+            # Raise exception if request failed
+            response.raise_for_status()
+
+        with response:
+            if self.verbose:
+                if self.is_notebook:
+                    printmd('\n\n**AI Tutor:**\n\n')
+                else:
+                    print('\n\nAI Tutor:\n')
+
+            # Parse the Server-Sent Events
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith('event:'):
+                    event = line[len('event:'):].strip()
+                elif line.startswith('data:'):
+                    data = json.loads(line[len('data:'):].strip())
+                    if event == 'token':
+                        if self.verbose:
+                            print(data["delta"], end='', flush=True)
+                        yield data["delta"]
+                    elif event == 'done':
+                        if "message_history" in data:
+                            self.message_history = data["message_history"]
+                            self.conversation_summary = data.get("conversation_summary")
+                        else:
+                            self.message_history.append({"role": "user", "content": session_prompt})
+                            self.message_history.append({"role": "assistant", "content": data["response"]})
+                    elif event == 'error':
+                        raise requests.exceptions.HTTPError(f"Error while streaming response: {data['detail']}")
+
+        if self.verbose:
+            print()
         
     def get_message_history(self):
         """
@@ -196,6 +327,8 @@ class AITutor:
         Reset the conversation history and display the initial greeting.
         """
         self.message_history = []
+        self.conversation_summary = None
+        self._end_session()
         if self.verbose:
             if self.is_notebook:
                 printmd('\n\n**AI Tutor:**\n\n'+ self.introduction)
@@ -1,6 +1,10 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
+import asyncio
+import json
 import logging
 import sys
 
@@ -9,13 +13,28 @@ print(f"API module imported by: {__name__}", file=sys.stderr)
 
 # Import the tutor module - Fix import path
 from api.tutor import load_tutor_info
+from api.sessions import SessionStore
 from llms.tutor_llm import TutorChain
 from llama_index.core.llms import ChatMessage
+from utils.config import open_config
+from utils.tracing import span, turn
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Limit the number of LLM calls that can be in flight at once in this worker
+max_concurrent_llm_calls = open_config()['api']['max_concurrent_llm_calls']
+llm_semaphore = asyncio.Semaphore(max_concurrent_llm_calls)
+
+# Responses are moderated like in the app unless a request opts out
+moderate_responses = open_config()['api'].get('moderate_responses', True)
+max_moderations = open_config()['llm']['max_moderations']
+
+# Conversations held on the server so that clients only need to send new prompts
+session_store = SessionStore(max_sessions=open_config()['api']['max_sessions'],
+                             ttl_seconds=open_config()['api']['session_ttl_minutes'] * 60)
+
 # Define FastAPI app with metadata
 app = FastAPI(
     title="AI Tutors API",
@@ -29,6 +48,19 @@ class PromptRequest(BaseModel):
     access_code: str
     message_history: Optional[list]
     tutor_info: Optional[Dict[str, Any]]
+    moderate: Optional[bool] = None
+    # Rolling summary returned with the previous response, so that long conversations are not summarized again
+    conversation_summary: Optional[Dict[str, Any]] = None
+
+# Define a schema for creating a session
+class SessionRequest(BaseModel):
+    access_code: str
+    message_history: Optional[list] = None
+
+# Define a prompt schema for an existing session
+class SessionPromptRequest(BaseModel):
+    user_prompt: str
+    moderate: Optional[bool] = None
 
 # Utility functions for message conversion
 def dict_to_chat_message(msg_dict: Dict[str, str]) -> ChatMessage:
@@ -58,8 +90,8 @@ async def get_tutor_info(access_code: str):
         All tutor information needed to instantiate a tutor
     """
     try:
-        # Load tutor info using the provided access code
-        tutor_info = load_tutor_info(access_code)
+        # Load tutor info using the provided access code (blocking S3 reads run in a worker thread)
+        tutor_info = await run_in_threadpool(load_tutor_info, access_code)
         
         # Return all tutor information including the initial request
         return tutor_info
@@ -70,11 +102,127 @@ async def get_tutor_info(access_code: str):
         logger.error(f"Error in get_tutor_info: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def build_tutor(access_code: str, tutor_info: Optional[Dict[str, Any]] = None,
+                      message_history: Optional[list] = None, conversation_summary: Optional[Dict[str, Any]] = None):
+    """
+    Create a TutorChain from the tutor info (loaded from the access code if not provided), message history
+    and the summary of the earlier conversation (as returned by `summary_to_dict`)
+    """
+    # Use the provided tutor_info if available, otherwise load it
+    if not tutor_info:
+        tutor_info = await run_in_threadpool(load_tutor_info, access_code)
+
+    # Create a TutorChain instance from the tutor info
+    # (compiling the prompts and loading the knowledge index is blocking work, so it runs in a worker thread)
+    tutor = await run_in_threadpool(
+        TutorChain,
+        instructions=tutor_info.get("instructions", ""),
+        guidelines=tutor_info.get("guidelines", ""),
+        introduction=tutor_info.get("introduction", ""),
+        knowledge=tutor_info.get("knowledge", "")
+    )
+
+    if message_history:
+        # Convert JSON message history to ChatMessage objects
+        chat_messages = [dict_to_chat_message(msg) for msg in message_history]
+        tutor.tutor_llm.message_history = chat_messages
+
+        context = tutor.tutor_llm.context
+        if conversation_summary and context is not None:
+            # Only the messages that left the window since the previous request are summarized
+            context.summary = conversation_summary.get("summary", "")
+            context.num_summarized = min(max(int(conversation_summary.get("num_summarized", 0)), 0),
+                                         len(chat_messages) - 1)
+
+    return tutor, tutor_info
+
+def summary_to_dict(tutor: TutorChain) -> Optional[Dict[str, Any]]:
+    """The rolling summary of the conversation, for the client to send with its next request"""
+    context = tutor.tutor_llm.context
+    if context is None:
+        return None
+    return {"summary": context.summary, "num_summarized": context.num_summarized}
+
+def should_moderate(moderate: Optional[bool]) -> bool:
+    return moderate_responses if moderate is None else moderate
+
+async def tutor_response(tutor: TutorChain, user_prompt: str, moderate: bool) -> str:
+    """Get the tutor's response to a prompt, moderated (and corrected if needed) unless `moderate` is False"""
+    # One correlation id for the whole turn (run_in_threadpool carries it into the worker thread)
+    with turn('api.tutor_response', moderate=moderate):
+        with span('api.wait_for_llm'):
+            await llm_semaphore.acquire()
+        try:
+            if moderate:
+                # The moderated pipeline is synchronous, so it runs in a worker thread
+                return await run_in_threadpool(tutor.get_response, user_prompt, True, max_moderations)
+            # Await the LLM without blocking other requests handled by this worker
+            with span('tutor.draft'):
+                return await tutor.tutor_llm.aget_response(user_prompt)
+        finally:
+            llm_semaphore.release()
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format a Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def tutor_event_stream(tutor: TutorChain, user_prompt: str, include_history: bool = True,
+                             moderate: bool = False):
+    """
+    Stream the tutor's response as Server-Sent Events.
+
+    Each `token` event carries a `delta` with the next chunk of the response.
+    The final `done` event carries the full `response` (and the updated `message_history` and
+    `conversation_summary` if requested).
+    If `moderate` is True, the draft is not streamed: it is moderated (and corrected if needed) first and the
+    final response is sent as a single `token` event. `moderated` in the `done` event tells whether it differs
+    from the draft.
+    An `error` event is sent instead if something goes wrong after streaming has started.
+    """
+    # One correlation id for the whole turn, like tutor_response
+    with turn('api.tutor_event_stream', moderate=moderate, history=include_history):
+        try:
+            chunks = []
+            response = ''
+            if user_prompt:
+                async with llm_semaphore:
+                    with span('tutor.draft', stream=True):
+                        async for delta in tutor.tutor_llm.astream_response(user_prompt):
+                            chunks.append(delta)
+                            # A draft the moderator may reject must not reach the student
+                            if not moderate:
+                                yield sse_event("token", {"delta": delta})
+                    response = ''.join(chunks)
+                    if moderate:
+                        response = await run_in_threadpool(tutor.moderate_response, max_moderations)
+                        yield sse_event("token", {"delta": response})
+
+            # Finish with the full response and (optionally) the serialized message history
+            result = {"response": response}
+            if moderate:
+                result["moderated"] = response != ''.join(chunks)
+            if include_history:
+                result["message_history"] = [chat_message_to_dict(msg) for msg in tutor.tutor_llm.message_history]
+                result["conversation_summary"] = summary_to_dict(tutor)
+            yield sse_event("done", result)
+        except Exception as e:
+            logger.error(f"Error while streaming response: {str(e)}")
+            yield sse_event("error", {"detail": str(e)})
+
+def event_stream_response(events) -> StreamingResponse:
+    """Wrap a Server-Sent Event generator in an unbuffered streaming response"""
+    return StreamingResponse(events, media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # Endpoint to call the LLM
 @app.post("/query", summary="Send a query to the AI tutor")
 async def query_model(request: PromptRequest):
     """
-    Send a query to the AI tutor and get a response.
+    Send a query to the AI tutor and get a response (moderated unless `moderate` is false).
+
+    Once a conversation outgrows the token budget, its older messages are replaced by a rolling summary.
+    Send the `conversation_summary` of each response with the next request so that only the messages
+    that left the window since then are summarized (otherwise the whole older conversation is summarized again).
     
     Args:
         request: Request object containing user prompt, access code, tutor info, and optional message history
@@ -83,36 +231,22 @@ async def query_model(request: PromptRequest):
         The tutor's response and updated message history
     """
     try:
-        # Use the provided tutor_info if available, otherwise load it
-        tutor_info = request.tutor_info
-        if not tutor_info:
-            tutor_info = load_tutor_info(request.access_code)
-        
-        # Create a TutorChain instance from the tutor info
-        tutor = TutorChain(
-            instructions=tutor_info.get("instructions", ""),
-            guidelines=tutor_info.get("guidelines", ""),
-            introduction=tutor_info.get("introduction", ""),
-            knowledge=tutor_info.get("knowledge", "")
-        )
-
-        if request.message_history:
-            # Convert JSON message history to ChatMessage objects
-            chat_messages = [dict_to_chat_message(msg) for msg in request.message_history]
-            tutor.tutor_llm.message_history = chat_messages
+        tutor, _ = await build_tutor(request.access_code, request.tutor_info, request.message_history,
+                                     request.conversation_summary)
             
         if request.user_prompt:
-            response = tutor.tutor_llm.get_response(request.user_prompt)
+            response = await tutor_response(tutor, request.user_prompt, should_moderate(request.moderate))
         else:
             response = ''
         
         # Convert ChatMessage objects to serializable dictionaries
         serialized_history = [chat_message_to_dict(msg) for msg in tutor.tutor_llm.message_history]
         
-        # Return the response along with the serialized message history
+        # Return the response along with the serialized message history and summary
         return {
             "response": response,
-            "message_history": serialized_history
+            "message_history": serialized_history,
+            "conversation_summary": summary_to_dict(tutor)
         }
     except HTTPException as e:
         # Re-raise HTTP exceptions
@@ -121,6 +255,154 @@ async def query_model(request: PromptRequest):
         logger.error(f"Error in query_model: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Endpoint to stream the LLM response
+@app.post("/query/stream", summary="Stream a response from the AI tutor")
+async def stream_query_model(request: PromptRequest):
+    """
+    Send a query to the AI tutor and stream the response as Server-Sent Events.
+
+    Each `token` event carries a `delta` with the next chunk of the response.
+    The final `done` event carries the full `response` and the updated `message_history`.
+    Moderated responses (the default) are sent in one `token` event once moderation has finished.
+    
+    Args:
+        request: Request object containing user prompt, access code, tutor info, and optional message history
+    """
+    try:
+        tutor, _ = await build_tutor(request.access_code, request.tutor_info, request.message_history,
+                                     request.conversation_summary)
+    except HTTPException as e:
+        # Re-raise HTTP exceptions
+        raise e
+    except Exception as e:
+        logger.error(f"Error in stream_query_model: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return event_stream_response(tutor_event_stream(tutor, request.user_prompt,
+                                                    moderate=should_moderate(request.moderate)))
+
+def get_session(session_id: str):
+    """Look up a session or raise a 404 if it does not exist or has expired"""
+    session = session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session does not exist or has expired")
+    return session
+
+# Endpoint to start a conversation held on the server
+@app.post("/sessions", summary="Start a conversation with the AI tutor")
+async def create_session(request: SessionRequest):
+    """
+    Start a conversation that is stored on the server.
+    Later turns only need to send the session id and the new prompt.
+    
+    Args:
+        request: Request object containing the access code and an optional message history to resume from
+        
+    Returns:
+        The session id, the tutor's introduction and the initial message history
+    """
+    try:
+        tutor, tutor_info = await build_tutor(request.access_code, message_history=request.message_history)
+        session_id = session_store.create(tutor, tutor_info.get("tool_name", ""))
+
+        return {
+            "session_id": session_id,
+            "introduction": tutor.compiled_tutor.introduction,
+            "message_history": [chat_message_to_dict(msg) for msg in tutor.tutor_llm.message_history]
+        }
+    except HTTPException as e:
+        # Re-raise HTTP exceptions
+        raise e
+    except Exception as e:
+        logger.error(f"Error in create_session: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Endpoint to continue a conversation held on the server
+@app.post("/sessions/{session_id}/query", summary="Send a query within a conversation")
+async def query_session(session_id: str, request: SessionPromptRequest):
+    """
+    Send a query to the AI tutor within an existing conversation.
+    
+    Args:
+        session_id: The id returned by POST /sessions
+        request: Request object containing the user prompt
+        
+    Returns:
+        The tutor's response
+    """
+    session = get_session(session_id)
+    # Process one turn at a time within a conversation
+    async with session.lock:
+        message_history = session.tutor.tutor_llm.message_history
+        history_length = len(message_history)
+        try:
+            if request.user_prompt:
+                response = await tutor_response(session.tutor, request.user_prompt, should_moderate(request.moderate))
+            else:
+                response = ''
+            return {"response": response}
+        except Exception as e:
+            # Drop the incomplete turn so that the conversation can continue
+            del message_history[history_length:]
+            logger.error(f"Error in query_session: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+# Endpoint to stream a response within a conversation held on the server
+@app.post("/sessions/{session_id}/query/stream", summary="Stream a response within a conversation")
+async def stream_query_session(session_id: str, request: SessionPromptRequest):
+    """
+    Send a query to the AI tutor within an existing conversation and stream the response as Server-Sent Events.
+    The final `done` event carries the full `response`.
+    
+    Args:
+        session_id: The id returned by POST /sessions
+        request: Request object containing the user prompt
+    """
+    session = get_session(session_id)
+
+    async def events():
+        # Process one turn at a time within a conversation
+        async with session.lock:
+            message_history = session.tutor.tutor_llm.message_history
+            history_length = len(message_history)
+            completed = False
+            try:
+                async for event in tutor_event_stream(session.tutor, request.user_prompt, include_history=False,
+                                                      moderate=should_moderate(request.moderate)):
+                    completed = event.startswith("event: done")
+                    yield event
+            finally:
+                if not completed:
+                    # Drop the incomplete turn (error or client disconnect) so that the conversation can continue
+                    del message_history[history_length:]
+
+    return event_stream_response(events())
+
+# Endpoint to get the message history of a conversation held on the server
+@app.get("/sessions/{session_id}/history", summary="Get the message history of a conversation")
+async def get_session_history(session_id: str):
+    """
+    Get the full message history of a conversation.
+    
+    Args:
+        session_id: The id returned by POST /sessions
+    """
+    session = get_session(session_id)
+    return {"message_history": [chat_message_to_dict(msg) for msg in session.tutor.tutor_llm.message_history]}
+
+# Endpoint to end a conversation held on the server
+@app.delete("/sessions/{session_id}", summary="End a conversation")
+async def delete_session(session_id: str):
+    """
+    End a conversation and free it on the server.
+    
+    Args:
+        session_id: The id returned by POST /sessions
+    """
+    if not session_store.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session does not exist or has expired")
+    return {"deleted": session_id}
+
 # Root endpoint that returns API info
 @app.get("/", summary="API info")
 async def root():
@@ -130,6 +412,12 @@ async def root():
         "version": "1.0.2",
         "endpoints": {
             "/query": "POST - Send a prompt to the AI tutor",
+            "/query/stream": "POST - Send a prompt to the AI tutor and stream the response (Server-Sent Events)",
+            "/sessions": "POST - Start a conversation held on the server",
+            "/sessions/{session_id}/query": "POST - Send a prompt within a conversation",
+            "/sessions/{session_id}/query/stream": "POST - Send a prompt within a conversation and stream the response",
+            "/sessions/{session_id}/history": "GET - Get the message history of a conversation",
+            "/sessions/{session_id}": "DELETE - End a conversation",
             "/tutor_info": "GET - Get all tutor information",
             "/init_request": "GET - Get the initial greeting message from the tutor (deprecated)"
         }
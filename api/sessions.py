@@ -0,0 +1,79 @@
+import asyncio
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from llms.tutor_llm import TutorChain
+
+class TutorSession:
+    """
+    A conversation held on the server.
+
+    Attributes:
+        tutor (TutorChain): The tutor, including the message history of the conversation.
+            The tutor's prompts and knowledge base are shared with every other session using the same tutor.
+        tool_name (str): Name of the tutor.
+        last_access (float): Time (from time.monotonic) of the last request that used this session.
+        lock (asyncio.Lock): Ensures that turns within one conversation are processed one at a time.
+    """
+
+    def __init__(self, tutor: TutorChain, tool_name: str):
+        self.tutor = tutor
+        self.tool_name = tool_name
+        self.last_access = time.monotonic()
+        self.lock = asyncio.Lock()
+
+class SessionStore:
+    """
+    Bounded in-memory store of conversation sessions.
+
+    Sessions expire after `ttl_seconds` without use. When the store is full,
+    the least recently used session is evicted to make room for a new one.
+    """
+
+    def __init__(self, max_sessions: int, ttl_seconds: float):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _evict_expired(self, now: float) -> None:
+        # Sessions are ordered from least to most recently used
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_access < self.ttl_seconds:
+                break
+            del self._sessions[session_id]
+
+    def create(self, tutor: TutorChain, tool_name: str) -> str:
+        """Store a new session and return its id"""
+        session_id = secrets.token_urlsafe(16)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            # Make room by evicting the least recently used sessions
+            while len(self._sessions) >= self.max_sessions:
+                self._sessions.popitem(last=False)
+            self._sessions[session_id] = TutorSession(tutor, tool_name)
+        return session_id
+
+    def get(self, session_id: str) -> Optional[TutorSession]:
+        """Return the session (refreshing its TTL), or None if it does not exist or has expired"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_access = now
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        """Remove a session. Returns True if the session existed"""
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
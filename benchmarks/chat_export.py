@@ -0,0 +1,48 @@
+"""
+Measure the time to export a chat (markdown_to_html and generate_pdf in utils/save_to_html.py)
+as the conversation grows. Messages mix text, inline and display math and code blocks, like real chats.
+
+    python benchmarks/chat_export.py --turns 10 50 200 --repeats 3
+"""
+import argparse
+import time
+
+from harness import run_info, summarize, write_results
+
+from utils.save_to_html import convert_messages_to_markdown, generate_pdf, markdown_to_html
+
+def make_messages(num_turns):
+    messages = [{"role": "assistant", "content": "Hi! What are you working on today?"}]
+    for i in range(num_turns):
+        messages.append({"role": "user", "content": f"How do I solve question {i}: $x^2 + {i}x = 0$?"})
+        messages.append({"role": "assistant", "content":
+                         f"Let's factor it first. What do you get if you take $x$ out?\n\n"
+                         f"$$x(x + {i}) = 0$$\n\n"
+                         f"You can check your answer with:\n\n```python\nx = -{i}\nprint(x**2 + {i}*x)\n```"})
+    return messages
+
+def run(turns=(10, 50, 200), repeats=3):
+    results = {}
+    for num_turns in turns:
+        messages = make_messages(num_turns)
+        html_times = []
+        pdf_times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            html = markdown_to_html(convert_messages_to_markdown(messages), "Benchmark Tutor")
+            html_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            pdf = generate_pdf(html)
+            pdf_times.append(time.perf_counter() - start)
+        results[str(num_turns)] = {"markdown_to_html": summarize(html_times), "generate_pdf": summarize(pdf_times),
+                                   "html_chars": len(html), "pdf_bytes": len(pdf)}
+    return {"params": {"turns": list(turns), "repeats": repeats}, "results": results}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 50, 200], help="Conversation lengths")
+    parser.add_argument("--repeats", type=int, default=3, help="Exports per conversation length")
+    parser.add_argument("--output", help="JSON file for the results (printed if not given)")
+    args = parser.parse_args()
+    write_results({"run": run_info(), "chat_export": run(args.turns, args.repeats)}, args.output)
@@ -0,0 +1,322 @@
+"""
+Simulate a class of students redeeming the same access code at the start of a lesson.
+
+Each student opens the tutor, reads the introduction and then sends a few messages with some think time
+in between. Students arrive following a ramp-up profile:
+    burst: all at once
+    linear: evenly over --ramp-seconds
+    poisson: at random (exponential gaps) over about --ramp-seconds
+Think time before each message is none, constant, exponential or lognormal with mean --think-seconds.
+
+Targets:
+    api: the REST API. Stages are tutor_info (access code lookup), start_session (TutorChain and
+         introduction) and query. In process by default, or a running server with --url and --code.
+    app: the Streamlit app through streamlit.testing.v1.AppTest (in process). Stages are open_code
+         (main.py?code=..., i.e. use_code and load_data), tutor_page (TutorChain and introduction) and message.
+         AppTest runs one script at a time per process, so the students' script runs are serialized:
+         "queued" is the time spent waiting for other students' runs.
+
+In process, the LLM is the fake LLM (llms/fake_llm.py) and the bucket a temporary directory with one tutor.
+The report (JSON) has the latency and error rate of each stage and the memory (RSS) of the process serving
+the students (use --pid for a server running elsewhere on this machine).
+
+    python benchmarks/classroom_burst.py --target api --students 120 --ramp poisson --ramp-seconds 60
+    python benchmarks/classroom_burst.py --target app --students 30 --ramp burst --think lognormal
+    python benchmarks/classroom_burst.py --target api --url http://localhost:8000 --code ABC123 --pid 4242
+"""
+import argparse
+import asyncio
+import contextlib
+import logging
+import math
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from harness import run_info, summarize, use_fake_llm, use_local_bucket, write_results
+
+import yaml
+
+from tutor_lookup import TUTORS_FN, make_tables
+from utils.access_code_index import ACCESS_CODES_FN
+from utils.object_cache import get_fs
+from utils.tutor_data import write_csv
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def arrival_times(num_students, profile, ramp_seconds, rng):
+    """Seconds after the start of the lesson at which each student opens the tutor"""
+    if profile == 'burst' or num_students <= 1:
+        return [0.0] * num_students
+    if profile == 'linear':
+        return [ramp_seconds * i / (num_students - 1) for i in range(num_students)]
+    if profile == 'poisson':
+        rate = num_students / ramp_seconds if ramp_seconds > 0 else math.inf
+        times = [0.0]
+        for _ in range(num_students - 1):
+            times.append(times[-1] + (rng.expovariate(rate) if rate != math.inf else 0.0))
+        return times
+    raise ValueError(f"Unknown ramp-up profile: {profile}")
+
+def think_time(model, mean_seconds, rng):
+    """Seconds a student takes to read the last response and write the next message"""
+    if model == 'none' or mean_seconds <= 0:
+        return 0.0
+    if model == 'constant':
+        return mean_seconds
+    if model == 'exponential':
+        return rng.expovariate(1 / mean_seconds)
+    if model == 'lognormal':
+        # Median of half the mean with a long tail (sigma 1 gives a mean of median * e^0.5)
+        return rng.lognormvariate(math.log(mean_seconds / math.exp(0.5)), 1.0)
+    raise ValueError(f"Unknown think time model: {model}")
+
+def rss_bytes(pid=None):
+    """Resident memory of a process (this one by default), from /proc or, failing that, the peak of this process"""
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class RSSSampler:
+    """Samples the RSS of a process in a background thread to find its peak"""
+
+    def __init__(self, pid=None, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.start_bytes = rss_bytes(pid)
+        self.peak_bytes = self.start_bytes
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_bytes = max(self.peak_bytes, rss_bytes(self.pid))
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.end_bytes = rss_bytes(self.pid)
+        self.peak_bytes = max(self.peak_bytes, self.end_bytes)
+
+    def report(self, num_students):
+        return {"start_mb": round(self.start_bytes / 1e6, 1),
+                "end_mb": round(self.end_bytes / 1e6, 1),
+                "peak_mb": round(self.peak_bytes / 1e6, 1),
+                "growth_mb": round((self.end_bytes - self.start_bytes) / 1e6, 1),
+                "growth_kb_per_student": round((self.end_bytes - self.start_bytes) / 1e3 / max(num_students, 1), 1)}
+
+class StageRecorder:
+    """Latencies and errors of each stage, shared by all simulated students"""
+
+    def __init__(self, stages):
+        self.stages = stages
+        self.lock = threading.Lock()
+        self.latencies = {stage: [] for stage in stages}
+        self.errors = {stage: [] for stage in stages}
+
+    def record(self, stage, seconds=None, error=None):
+        with self.lock:
+            if error is None:
+                self.latencies[stage].append(seconds)
+            else:
+                self.errors[stage].append(error)
+
+    def report(self):
+        report = {}
+        for stage in self.stages:
+            num_errors = len(self.errors[stage])
+            attempts = len(self.latencies[stage]) + num_errors
+            report[stage] = {"latency": summarize(self.latencies[stage]),
+                             "errors": num_errors,
+                             "error_rate": round(num_errors / attempts, 4) if attempts else 0.0,
+                             # A few distinct messages are enough to diagnose a failure
+                             "error_samples": sorted(set(self.errors[stage]))[:5]}
+        return report
+
+def seed_bucket(bucket_dir, knowledge_chars):
+    """A local bucket with one tutor, its access code and an empty users file. Returns the access code."""
+    use_local_bucket(bucket_dir)
+    tutors, codes = make_tables(1)
+    tutors.loc[0, "Knowledge Base"] = ("Notes for the unit. " * (knowledge_chars // 20 + 1))[:knowledge_chars]
+    write_csv(TUTORS_FN, tutors)
+    write_csv(ACCESS_CODES_FN, codes)
+    with get_fs().open('ai-tutors/users.yaml', 'wt') as f:
+        f.write(yaml.dump({"credentials": {"usernames": {}}}))
+    return codes["Code"].iloc[0]
+
+async def api_student(client, student, code, num_messages, think, rng_lock, rng, recorder):
+    async def stage(name, request):
+        start = time.perf_counter()
+        try:
+            response = await request
+            response.raise_for_status()
+        except Exception as e:
+            recorder.record(name, error=f"{type(e).__name__}: {e}"[:200])
+            return None
+        recorder.record(name, time.perf_counter() - start)
+        return response
+
+    if await stage("tutor_info", client.get("/tutor_info", params={"access_code": code})) is None:
+        return
+    response = await stage("start_session", client.post("/sessions", json={"access_code": code}))
+    if response is None:
+        return
+    session_id = response.json()["session_id"]
+    for i in range(num_messages):
+        with rng_lock:
+            delay = think(rng)
+        await asyncio.sleep(delay)
+        if await stage("query", client.post(f"/sessions/{session_id}/query",
+                                            json={"user_prompt": f"Student {student}: can you help with question {i}?"})) is None:
+            return
+
+async def run_api(url, code, arrivals, num_messages, think, rng, recorder):
+    import httpx
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    if url:
+        transport = None
+    else:
+        import api.app
+        transport = httpx.ASGITransport(app=api.app.app)
+    rng_lock = threading.Lock()
+
+    async with httpx.AsyncClient(transport=transport, base_url=url or "http://classroom", timeout=None) as client:
+        async def arrive(student, delay):
+            await asyncio.sleep(delay)
+            await api_student(client, student, code, num_messages, think, rng_lock, rng, recorder)
+
+        await asyncio.gather(*[arrive(student, delay) for student, delay in enumerate(arrivals)])
+
+# AppTest has one runtime per process, so only one student's script runs at a time
+_app_lock = threading.Lock()
+
+def app_student(student, code, delay, num_messages, think, rng_lock, rng, recorder, timeout):
+    from streamlit.testing.v1 import AppTest
+    time.sleep(delay)
+
+    def stage(name, run):
+        queued = time.perf_counter()
+        with _app_lock:
+            start = time.perf_counter()
+            recorder.record("queued", start - queued)
+            try:
+                at = run()
+                if at.exception:
+                    raise RuntimeError(at.exception[0].message)
+            except Exception as e:
+                recorder.record(name, error=f"{type(e).__name__}: {e}"[:200])
+                return None
+            recorder.record(name, time.perf_counter() - start)
+        return at
+
+    at = AppTest.from_file(os.path.join(REPO_DIR, 'main.py'), default_timeout=timeout)
+    at.query_params["code"] = code
+    if stage("open_code", at.run) is None:
+        return at
+    at.switch_page('pages/tutor.py')
+    if stage("tutor_page", at.run) is None:
+        return at
+    for i in range(num_messages):
+        with rng_lock:
+            delay = think(rng)
+        time.sleep(delay)
+        prompt = f"Student {student}: can you help with question {i}?"
+        if stage("message", lambda: at.chat_input(key='chat_input_text').set_value(prompt).run()) is None:
+            break
+    return at
+
+def run_app(code, arrivals, num_messages, think, rng, recorder, timeout):
+    """Returns the students' sessions (kept until their memory has been measured)"""
+    rng_lock = threading.Lock()
+    with ThreadPoolExecutor(max_workers=len(arrivals)) as executor:
+        futures = [executor.submit(app_student, student, code, delay, num_messages, think, rng_lock, rng,
+                                   recorder, timeout)
+                   for student, delay in enumerate(arrivals)]
+        return [future.result() for future in futures]
+
+STAGES = {"api": ("tutor_info", "start_session", "query"),
+          "app": ("open_code", "tutor_page", "message", "queued")}
+
+def run(target='api', num_students=60, ramp='burst', ramp_seconds=60.0, think='exponential', think_seconds=20.0,
+        num_messages=3, url=None, code=None, pid=None, latency=1.0, reject_draft=0.3, knowledge_chars=20000,
+        timeout=120, seed=0):
+    if target not in STAGES:
+        raise ValueError(f"Unknown target: {target}")
+    if url and not code:
+        raise ValueError("An access code (--code) is needed to load test a running server")
+    rng = random.Random(seed)
+    arrivals = arrival_times(num_students, ramp, ramp_seconds, rng)
+    recorder = StageRecorder(STAGES[target])
+
+    with tempfile.TemporaryDirectory() as bucket_dir:
+        if not url:
+            use_fake_llm(latency, 'lognormal', 0.4, reject_draft=reject_draft, seed=seed)
+            code = seed_bucket(bucket_dir, knowledge_chars)
+
+        start = time.perf_counter()
+        with RSSSampler(pid if url else None) as rss:
+            if target == 'api':
+                asyncio.run(run_api(url, code, arrivals, num_messages,
+                                    lambda r: think_time(think, think_seconds, r), rng, recorder))
+            else:
+                sessions = run_app(code, arrivals, num_messages, lambda r: think_time(think, think_seconds, r),
+                                   rng, recorder, timeout)
+        elapsed = time.perf_counter() - start
+        if target == 'app':
+            del sessions
+
+    stages = recorder.report()
+    # Waiting for the app lock is not a request of its own
+    requests = [stage for name, stage in stages.items() if name != "queued"]
+    num_errors = sum(stage["errors"] for stage in requests)
+    num_attempts = num_errors + sum(stage["latency"]["n"] for stage in requests)
+    return {"params": {"target": target, "students": num_students, "ramp": ramp, "ramp_seconds": ramp_seconds,
+                       "think": think, "think_seconds": think_seconds, "messages": num_messages,
+                       "url": url, "latency": None if url else latency,
+                       "reject_draft": None if url else reject_draft, "knowledge_chars": None if url else knowledge_chars},
+            "results": {"seconds": round(elapsed, 2),
+                        "stages": stages,
+                        "error_rate": round(num_errors / num_attempts, 4) if num_attempts else 0.0,
+                        "rss": rss.report(num_students) if (pid or not url) else None}}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=list(STAGES), default='api', help="What the students use")
+    parser.add_argument("--students", type=int, default=60, help="Students in the class")
+    parser.add_argument("--ramp", choices=['burst', 'linear', 'poisson'], default='burst', help="Ramp-up profile")
+    parser.add_argument("--ramp-seconds", type=float, default=60, help="Time over which students arrive")
+    parser.add_argument("--think", choices=['none', 'constant', 'exponential', 'lognormal'], default='exponential',
+                        help="Think time model")
+    parser.add_argument("--think-seconds", type=float, default=20, help="Mean think time before each message")
+    parser.add_argument("--messages", type=int, default=3, help="Messages sent by each student")
+    parser.add_argument("--url", help="Base URL of a running API server (api target only)")
+    parser.add_argument("--code", help="Access code to redeem on the running server")
+    parser.add_argument("--pid", type=int, help="Process id of the running server, to report its memory")
+    parser.add_argument("--latency", type=float, default=1.0, help="Median seconds the fake LLM takes per call")
+    parser.add_argument("--reject-draft", type=float, default=0.3, help="Probability that a draft is rejected")
+    parser.add_argument("--knowledge-chars", type=int, default=20000, help="Size of the tutor's knowledge base")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds an app script run may take")
+    parser.add_argument("--output", help="JSON file for the results (printed if not given)")
+    args = parser.parse_args()
+    if args.url and args.target != 'api':
+        parser.error("--url can only be used with the api target")
+    # Keep stdout for the results (the moderator prints its feedback)
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run(args.target, args.students, args.ramp, args.ramp_seconds, args.think, args.think_seconds,
+                      args.messages, args.url, args.code, args.pid, args.latency, args.reject_draft,
+                      args.knowledge_chars, args.timeout)
+    write_results({"run": run_info(), "classroom_burst": results}, args.output)
@@ -0,0 +1,47 @@
+"""
+Compare two results files written by run_suite.py (or a single benchmark) metric by metric.
+
+    python benchmarks/compare.py results-old.json results-new.json --filter p50_ms requests_per_second
+"""
+import argparse
+import json
+
+def flatten(results, prefix=''):
+    """Numeric metrics of a results file as {'benchmark.path.metric': value}"""
+    metrics = {}
+    for key, value in results.items():
+        if key == 'run':
+            continue
+        path = f'{prefix}.{key}' if prefix else key
+        if isinstance(value, dict):
+            metrics.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[path] = value
+    return metrics
+
+def main(old_fn, new_fn, filters):
+    with open(old_fn) as f:
+        old = json.load(f)
+    with open(new_fn) as f:
+        new = json.load(f)
+    old_metrics = flatten(old)
+    new_metrics = flatten(new)
+
+    print(f"old: {old.get('run', {}).get('commit')}  new: {new.get('run', {}).get('commit')}")
+    print(f"{'metric':<70} {'old':>12} {'new':>12} {'change':>8}")
+    for name, new_value in new_metrics.items():
+        if '.params.' in f'.{name}' or name not in old_metrics:
+            continue
+        if filters and not any(name.endswith(f) for f in filters):
+            continue
+        old_value = old_metrics[name]
+        change = f"{(new_value - old_value) / old_value:+.0%}" if old_value else ''
+        print(f"{name:<70} {old_value:>12,.3f} {new_value:>12,.3f} {change:>8}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("old", help="Results of the baseline run")
+    parser.add_argument("new", help="Results of the run to compare")
+    parser.add_argument("--filter", nargs="+", default=[], help="Only show metrics ending with these names")
+    args = parser.parse_args()
+    main(args.old, args.new, args.filter)
@@ -0,0 +1,69 @@
+"""
+Shared setup for the benchmarks: the fake LLM, a local directory standing in for the S3 bucket,
+latency summaries and the JSON results file.
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import llms.tutor_llm
+import utils.object_cache
+import utils.storage
+from llms.fake_llm import FakeLLM, LatencyDistribution
+
+def use_fake_llm(latency=0.0, distribution='constant', sigma=0.5, reject_draft=0.0, reject_correction=0.0,
+                 tokens_per_second=0, seed=0):
+    """Makes every tutor in this process use a new fake LLM (see llms/fake_llm.py) and returns it"""
+    fake_llm = FakeLLM(latency=LatencyDistribution(distribution, median_seconds=latency, sigma=sigma),
+                       tokens_per_second=tokens_per_second, reject_draft=reject_draft,
+                       reject_correction=reject_correction, seed=seed)
+    llms.tutor_llm.get_llm = lambda: fake_llm
+    return fake_llm
+
+def use_local_bucket(bucket_dir):
+    """Stores tables and knowledge bases in a local directory instead of S3 (with an in-memory object cache)"""
+    utils.object_cache._fs = utils.object_cache.create_fs({'local_bucket_dir': bucket_dir})
+    utils.object_cache._cache = utils.object_cache.ObjectCache(memory_max_bytes=128 * 1024 * 1024)
+    utils.storage._storage = utils.storage.S3Storage()
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+def summarize(seconds):
+    """Latency summary (in milliseconds) of a list of durations in seconds"""
+    if not seconds:
+        return {"n": 0}
+    return {"n": len(seconds),
+            "mean_ms": round(statistics.mean(seconds) * 1000, 3),
+            "p50_ms": round(percentile(seconds, 50) * 1000, 3),
+            "p95_ms": round(percentile(seconds, 95) * 1000, 3),
+            "max_ms": round(max(seconds) * 1000, 3)}
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_info():
+    return {"commit": git_commit(),
+            "time": datetime.now(tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+            "python": platform.python_version(),
+            "platform": platform.platform()}
+
+def write_results(results, output=None):
+    """Writes the results as JSON to a file (or stdout if no file is given)"""
+    text = json.dumps(results, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
@@ -0,0 +1,67 @@
+"""
+Compare per-message latency of the moderation strategies (sequential, parallel) and
+modes (two_call: separate verdict and correction calls, combined: one call for both).
+
+The LLM is replaced with the fake LLM (llms/fake_llm.py) with a fixed latency per call. The moderator
+approves each response with probability --pass-rate, so the numbers show how many round trips
+each configuration waits for rather than how fast Gemini is. "passed" is the share of
+messages answered with an uncorrected draft.
+
+    python benchmarks/moderation_latency.py --latency 0.2 --pass-rate 0.7 --messages 50 --output moderation.json
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import io
+import time
+
+from harness import run_info, summarize, use_fake_llm, write_results
+
+import llms.tutor_llm
+from llms.fake_llm import DRAFT_PREFIX
+
+def run_strategy(strategy, mode, latency, pass_rate, num_messages, num_drafts, max_moderations):
+    fake_llm = use_fake_llm(latency, reject_draft=1 - pass_rate, reject_correction=1 - pass_rate)
+    tutor = llms.tutor_llm.TutorChain("You are a helpful tutor.", "1. Do not give away answers.",
+                                      "Hi! What are you working on today?", "")
+    tutor.moderation_strategy = strategy
+    tutor.num_drafts = num_drafts
+    tutor.moderator_llm.mode = mode
+
+    latencies = []
+    num_passed = 0
+    for i in range(num_messages):
+        start = time.perf_counter()
+        # The moderator's feedback is printed for every rejected draft
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = tutor.get_response(f"Can you help me with question {i}?", max_moderations=max_moderations)
+        latencies.append(time.perf_counter() - start)
+        num_passed += response.startswith(DRAFT_PREFIX)
+        # Count the calls of losing drafts that were still finishing when the response was returned
+        concurrent.futures.wait(tutor.draft_futures)
+    stats = fake_llm.stats()
+    return {"latency": summarize(latencies),
+            "passed": round(num_passed / num_messages, 3),
+            "llm_calls_per_message": round(sum(stats["calls"].values()) / num_messages, 3),
+            "input_chars_per_message": round(stats["input_chars"] / num_messages)}
+
+def run(latency=0.2, pass_rate=0.7, num_messages=50, num_drafts=3, max_moderations=3):
+    results = {strategy: {mode: run_strategy(strategy, mode, latency, pass_rate, num_messages, num_drafts, max_moderations)
+                          for mode in ['two_call', 'combined']}
+               for strategy in ['sequential', 'parallel']}
+    return {"params": {"latency": latency, "pass_rate": pass_rate, "messages": num_messages,
+                       "drafts": num_drafts, "max_moderations": max_moderations},
+            "results": results}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds the fake LLM takes per call")
+    parser.add_argument("--pass-rate", type=float, default=0.7, help="Probability that the moderator approves a draft")
+    parser.add_argument("--messages", type=int, default=50, help="Student messages sent with each strategy")
+    parser.add_argument("--drafts", type=int, default=3, help="Drafts generated by the parallel strategy")
+    parser.add_argument("--max-moderations", type=int, default=3, help="Moderation rounds of the sequential strategy")
+    parser.add_argument("--output", help="JSON file for the results (printed if not given)")
+    args = parser.parse_args()
+    write_results({"run": run_info(),
+                   "moderation_latency": run(args.latency, args.pass_rate, args.messages, args.drafts,
+                                             args.max_moderations)}, args.output)
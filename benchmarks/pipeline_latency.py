@@ -0,0 +1,78 @@
+"""
+Measure TutorChain.get_response latency grouped by moderation outcome.
+
+The LLM is the fake LLM (llms/fake_llm.py) with lognormal latencies. The moderator rejects drafts with
+probability --reject-draft and corrections with probability --reject-correction, and each message is
+grouped by the number of moderation rounds it took: "passed" (the first draft was approved),
+"corrected_1" (one correction), and so on. The counters of the formatting rules (llms/format_rules.py),
+including the LLM calls they avoided, and of the verdict cache (llms/verdict_cache.py) are reported
+for each mode.
+
+    python benchmarks/pipeline_latency.py --latency 0.05 --messages 100 --output pipeline.json
+"""
+import argparse
+import contextlib
+import io
+import time
+
+from harness import run_info, summarize, use_fake_llm, write_results
+
+import llms.format_rules
+import llms.tutor_llm
+import llms.verdict_cache
+
+def outcome(num_rounds):
+    return "passed" if num_rounds <= 1 else f"corrected_{num_rounds - 1}"
+
+def run(latency=0.05, sigma=0.4, reject_draft=0.3, reject_correction=0.1, num_messages=100, max_moderations=3):
+    results = {}
+    for mode in ['two_call', 'combined']:
+        fake_llm = use_fake_llm(latency, 'lognormal', sigma, reject_draft, reject_correction)
+        # Count the formatting fixes and cached verdicts of this mode only
+        llms.format_rules._stats = llms.format_rules.FormatRuleStats()
+        llms.verdict_cache._cache = None
+        tutor = llms.tutor_llm.TutorChain("You are a helpful tutor.", "1. Do not give away answers.",
+                                          "Hi! What are you working on today?", "")
+        tutor.moderation_strategy = 'sequential'
+        tutor.moderator_llm.mode = mode
+
+        latencies = {}
+        for i in range(num_messages):
+            calls = fake_llm.stats()["calls"]
+            rounds_before = calls.get('moderation', 0) + calls.get('review', 0)
+            start = time.perf_counter()
+            # The moderator's feedback is printed for every rejected draft
+            with contextlib.redirect_stdout(io.StringIO()):
+                tutor.get_response(f"Can you help me with question {i}?", max_moderations=max_moderations)
+            elapsed = time.perf_counter() - start
+            calls = fake_llm.stats()["calls"]
+            num_rounds = calls.get('moderation', 0) + calls.get('review', 0) - rounds_before
+            latencies.setdefault(outcome(num_rounds), []).append(elapsed)
+
+        all_latencies = [elapsed for values in latencies.values() for elapsed in values]
+        results[mode] = {"all": summarize(all_latencies),
+                         "by_outcome": {name: summarize(values) for name, values in sorted(latencies.items())},
+                         "llm_calls_per_message": round(sum(fake_llm.stats()["calls"].values()) / num_messages, 3),
+                         "format_rules": llms.format_rules.get_format_rule_stats().stats()}
+        verdict_cache = llms.verdict_cache.get_verdict_cache()
+        results[mode]["verdict_cache"] = verdict_cache.stats() if verdict_cache else None
+
+    return {"params": {"latency": latency, "sigma": sigma, "reject_draft": reject_draft,
+                       "reject_correction": reject_correction, "messages": num_messages,
+                       "max_moderations": max_moderations},
+            "results": results}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.05, help="Median seconds the fake LLM takes per call")
+    parser.add_argument("--sigma", type=float, default=0.4, help="Spread of the lognormal LLM latency")
+    parser.add_argument("--reject-draft", type=float, default=0.3, help="Probability that a draft is rejected")
+    parser.add_argument("--reject-correction", type=float, default=0.1,
+                        help="Probability that a corrected response is rejected")
+    parser.add_argument("--messages", type=int, default=100, help="Student messages sent in each mode")
+    parser.add_argument("--max-moderations", type=int, default=3, help="Moderation rounds per message")
+    parser.add_argument("--output", help="JSON file for the results (printed if not given)")
+    args = parser.parse_args()
+    write_results({"run": run_info(),
+                   "pipeline_latency": run(args.latency, args.sigma, args.reject_draft, args.reject_correction,
+                                           args.messages, args.max_moderations)}, args.output)
@@ -0,0 +1,80 @@
+"""
+Measure /query throughput and per-request latency as the number of concurrent clients grows.
+
+The LLM is replaced with the fake LLM (llms/fake_llm.py) with a fixed latency, so the numbers
+reflect how well the API overlaps requests rather than how fast Gemini is.
+Responses are moderated as configured in config/api.yaml (the moderator approves every draft).
+
+    python benchmarks/query_concurrency.py --latency 0.1 --requests 400 --levels 1 10 50 200
+"""
+import argparse
+import asyncio
+import contextlib
+import logging
+import sys
+import time
+
+from harness import run_info, summarize, use_fake_llm, write_results
+
+import httpx
+
+import api.app
+
+tutor_info = {
+    "instructions": "You are a helpful tutor.",
+    "guidelines": "1. Do not give away answers.",
+    "introduction": "Hi! What are you working on today?",
+    "knowledge": "",
+}
+
+async def run_level(client, concurrency, num_requests):
+    # Each client sends requests back-to-back until the shared budget is used up
+    remaining = iter(range(num_requests))
+    latencies = []
+
+    async def worker():
+        for i in remaining:
+            start = time.perf_counter()
+            response = await client.post("/query", json={"user_prompt": f"Help me with question {i}.",
+                                                          "access_code": "BENCH",
+                                                          "message_history": None,
+                                                          "tutor_info": tutor_info})
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return time.perf_counter() - start, latencies
+
+async def run_levels(latency, num_requests, levels):
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    use_fake_llm(latency)
+
+    results = {}
+    transport = httpx.ASGITransport(app=api.app.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for concurrency in levels:
+            elapsed, latencies = await run_level(client, concurrency, max(num_requests, concurrency))
+            results[str(concurrency)] = {"seconds": round(elapsed, 3),
+                                         "requests_per_second": round(len(latencies) / elapsed, 2),
+                                         "latency": summarize(latencies)}
+    return results
+
+def run(latency=0.1, num_requests=400, levels=(1, 2, 5, 10, 20, 50, 100, 200)):
+    return {"params": {"latency": latency, "requests": num_requests, "levels": list(levels),
+                       "max_concurrent_llm_calls": api.app.max_concurrent_llm_calls,
+                       "moderate_responses": api.app.moderate_responses},
+            "results": asyncio.run(run_levels(latency, num_requests, levels))}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds the fake LLM takes per call")
+    parser.add_argument("--requests", type=int, default=400, help="Requests sent at each concurrency level")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 5, 10, 20, 50, 100, 200],
+                        help="Numbers of concurrent clients")
+    parser.add_argument("--output", help="JSON file for the results (printed if not given)")
+    args = parser.parse_args()
+    # Keep stdout for the results (the moderator prints its feedback)
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run(args.latency, args.requests, args.levels)
+    write_results({"run": run_info(), "query_concurrency": results}, args.output)
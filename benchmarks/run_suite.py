@@ -0,0 +1,64 @@
+"""
+Run the benchmark suite and write the results (with the commit they were measured on) as one JSON file.
+
+    python benchmarks/run_suite.py --output results-$(git rev-parse --short HEAD).json
+    python benchmarks/run_suite.py --quick --only pipeline_latency tutor_lookup
+    python benchmarks/compare.py results-old.json results-new.json
+
+Everything runs offline: the LLM is the fake LLM (llms/fake_llm.py) and the bucket a temporary directory.
+A benchmark whose dependencies are not installed (e.g. weasyprint for chat_export) is reported as skipped.
+"""
+import argparse
+import contextlib
+import importlib
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from harness import run_info, write_results
+
+# Parameters of each benchmark for a full run and a quick run (e.g. to check the suite still works)
+BENCHMARKS = {
+    "pipeline_latency": ({"num_messages": 200}, {"latency": 0.005, "num_messages": 20}),
+    "moderation_latency": ({"latency": 0.05}, {"latency": 0.005, "num_messages": 10}),
+    "session_memory": ({}, {"num_sessions": 10, "knowledge_chars": 20000, "turns": (0, 10)}),
+    "query_concurrency": ({"num_requests": 400}, {"latency": 0.01, "num_requests": 20, "levels": (1, 10, 200)}),
+    "tutor_lookup": ({"sizes": (10, 100, 1000, 10000)}, {"sizes": (10, 1000), "num_lookups": 20}),
+    "chat_export": ({"turns": (10, 50, 200)}, {"turns": (10,), "repeats": 1}),
+    "classroom_burst": ({"num_students": 120, "ramp": "poisson", "ramp_seconds": 30, "think_seconds": 5, "latency": 0.5},
+                        {"num_students": 30, "think": "none", "latency": 0.01}),
+}
+
+def run_benchmark(name, params):
+    try:
+        module = importlib.import_module(name)
+    except ImportError as e:
+        return {"skipped": str(e)}
+    start = time.perf_counter()
+    # Keep stdout for the results (the moderator prints its feedback)
+    with contextlib.redirect_stdout(sys.stderr):
+        results = module.run(**params)
+    results["seconds"] = round(time.perf_counter() - start, 2)
+    return results
+
+def main(names, quick, output):
+    results = {"run": run_info()}
+    # Each benchmark runs in a new process, so caches, patched modules, event loops and memory
+    # are not carried over from the previous one
+    context = multiprocessing.get_context('spawn')
+    for name in names:
+        full_params, quick_params = BENCHMARKS[name]
+        print(f"Running {name}...", file=sys.stderr)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results[name] = executor.submit(run_benchmark, name, quick_params if quick else full_params).result()
+    write_results(results, output)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS),
+                        help="Benchmarks to run")
+    parser.add_argument("--quick", action="store_true", help="Small parameters (seconds instead of minutes)")
+    parser.add_argument("--output", help="JSON file for the results (printed if not given)")
+    args = parser.parse_args()
+    main(args.only, args.quick, args.output)
@@ -0,0 +1,95 @@
+"""
+Compare per-session memory when many students chat with the same tutor.
+
+Both scenarios unpickle the same tutor row for every session (as st.cache_data does) and start the
+same chat from it; only the sharing differs.
+"copied" reproduces the previous behaviour: every session builds its own prompts from its copy of the row.
+"shared" is the current behaviour: sessions reference one interned compiled tutor.
+
+    python benchmarks/session_memory.py --sessions 50 --knowledge-chars 100000 --output memory.json
+"""
+import argparse
+import pickle
+import random
+import string
+import tracemalloc
+
+from harness import run_info, use_fake_llm, write_results
+
+from llama_index.core.llms import ChatMessage
+
+from llms.compiled_tutor import build_compiled_tutor, compile_tutor
+from llms.chatbot_llm import AITutor
+
+def make_tutor_row(knowledge_chars):
+    random.seed(0)
+    words = [''.join(random.choices(string.ascii_lowercase, k=random.randint(2, 9))) for _ in range(2000)]
+    knowledge = ''
+    while len(knowledge) < knowledge_chars:
+        knowledge += ' '.join(random.choices(words, k=50)) + '\n\n'
+    return {"Description": "A tutor for benchmarking.",
+            "Introduction": "Hi! What are you working on today?",
+            "Instructions": "You are a helpful tutor. " * 40,
+            "Guidelines": "1. Do not give away answers.\n" * 20,
+            "Knowledge Base": knowledge[:knowledge_chars],
+            "Availability": "Open to Public"}
+
+def add_turns(message_history, num_turns):
+    for i in range(num_turns):
+        message_history.append(ChatMessage(role="user", content=f"Can you help me with question {i}?"))
+        message_history.append(ChatMessage(role="assistant", content="Sure! What have you tried so far? " * 10))
+
+def new_session(compiled, num_turns):
+    session_state = {"instructions": compiled.instructions, "guidelines": compiled.guidelines,
+                     "introduction": compiled.introduction, "knowledge": compiled.knowledge}
+    session_state["tutor_llm"] = AITutor(None, compiled)
+    add_turns(session_state["tutor_llm"].message_history, num_turns)
+    return session_state
+
+def copied_session(pickled_row, num_turns):
+    # Each session builds its own prompts from its own copy of the tutor row
+    row = pickle.loads(pickled_row)
+    compiled = build_compiled_tutor(row["Instructions"], row["Guidelines"], row["Introduction"], row["Knowledge Base"])
+    return new_session(compiled, num_turns)
+
+def shared_session(pickled_row, num_turns):
+    # Each session references the interned compiled tutor; its own copy of the row is discarded
+    row = pickle.loads(pickled_row)
+    compiled = compile_tutor(row["Instructions"], row["Guidelines"], row["Introduction"], row["Knowledge Base"])
+    return new_session(compiled, num_turns)
+
+def measure(make_session, pickled_row, num_sessions, num_turns):
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    sessions = [make_session(pickled_row, num_turns) for _ in range(num_sessions)]
+    total = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    del sessions
+    return total
+
+def run(num_sessions=50, knowledge_chars=100000, turns=(0, 10, 50)):
+    use_fake_llm()
+    pickled_row = pickle.dumps(make_tutor_row(knowledge_chars))
+
+    # Warm up tokenizer and imports so they are not counted
+    compile_tutor("warm", "up", "", "")
+
+    results = {}
+    for num_turns in turns:
+        copied = measure(copied_session, pickled_row, num_sessions, num_turns)
+        shared = measure(shared_session, pickled_row, num_sessions, num_turns)
+        results[str(num_turns)] = {"copied_mb": round(copied / 1e6, 3), "shared_mb": round(shared / 1e6, 3),
+                                   "copied_kb_per_session": round(copied / num_sessions / 1e3, 1),
+                                   "shared_kb_per_session": round(shared / num_sessions / 1e3, 1)}
+    return {"params": {"sessions": num_sessions, "knowledge_chars": knowledge_chars, "turns": list(turns)},
+            "results": results}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=50, help="Number of concurrent sessions")
+    parser.add_argument("--knowledge-chars", type=int, default=100000, help="Size of the tutor's knowledge base")
+    parser.add_argument("--turns", type=int, nargs="+", default=[0, 10, 50], help="Conversation lengths to measure")
+    parser.add_argument("--output", help="JSON file for the results (printed if not given)")
+    args = parser.parse_args()
+    write_results({"run": run_info(), "session_memory": run(args.sessions, args.knowledge_chars, args.turns)},
+                  args.output)
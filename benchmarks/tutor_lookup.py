@@ -0,0 +1,75 @@
+"""
+Measure the cost of looking up a tutor by access code (api.tutor.load_tutor_info) as the catalog grows.
+
+The tutor and access code tables are written to a temporary local directory standing in for the S3 bucket.
+"cold" is the first lookup after the tables change (they are downloaded and parsed again),
+"warm" are later lookups of random codes served from the shared in-memory tables.
+
+    python benchmarks/tutor_lookup.py --tutors 10 100 1000 10000 --lookups 200
+"""
+import argparse
+import random
+import tempfile
+import time
+
+from harness import run_info, summarize, use_local_bucket, write_results
+
+import pandas as pd
+
+from api.tutor import load_tutor_info
+from utils.access_code_index import ACCESS_CODES_FN
+from utils.tutor_data import write_csv
+
+TUTORS_FN = 'ai-tutors/tutor_info.csv'
+
+def make_tables(num_tutors):
+    names = [f"Tutor {i}" for i in range(num_tutors)]
+    tutors = pd.DataFrame({"Name": names,
+                           "Description": [f"A tutor for unit {i}." for i in range(num_tutors)],
+                           "Introduction": "Hi! What are you working on today?",
+                           "Instructions": "You are a helpful tutor. " * 80,
+                           "Knowledge Base": "Notes for the unit. " * 50,
+                           "Knowledge Hash": '',
+                           "Knowledge Size": 1000,
+                           "Guidelines": "1. Do not give away answers.\n" * 10,
+                           "Grades": "['9']",
+                           "Subjects": "['Math']",
+                           "Creator Email": "teacher@example.com",
+                           "Availability": "Open to Public"})
+    codes = pd.DataFrame({"Code": [f"C{i:06d}" for i in range(num_tutors)],
+                          "Name": names,
+                          "Email": "teacher@example.com",
+                          "End Date": ''})
+    return tutors, codes
+
+def run(sizes=(10, 100, 1000, 10000), num_lookups=200, seed=0):
+    rng = random.Random(seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as bucket_dir:
+        use_local_bucket(bucket_dir)
+        for num_tutors in sizes:
+            tutors, codes = make_tables(num_tutors)
+            write_csv(TUTORS_FN, tutors)
+            write_csv(ACCESS_CODES_FN, codes)
+
+            start = time.perf_counter()
+            load_tutor_info(codes["Code"].iloc[0])
+            cold = time.perf_counter() - start
+
+            warm = []
+            for _ in range(num_lookups):
+                code = codes["Code"].iloc[rng.randrange(num_tutors)]
+                start = time.perf_counter()
+                load_tutor_info(code)
+                warm.append(time.perf_counter() - start)
+
+            results[str(num_tutors)] = {"cold_ms": round(cold * 1000, 3), "warm": summarize(warm)}
+    return {"params": {"sizes": list(sizes), "lookups": num_lookups}, "results": results}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tutors", type=int, nargs="+", default=[10, 100, 1000, 10000], help="Catalog sizes")
+    parser.add_argument("--lookups", type=int, default=200, help="Warm lookups per catalog size")
+    parser.add_argument("--output", help="JSON file for the results (printed if not given)")
+    args = parser.parse_args()
+    write_results({"run": run_info(), "tutor_lookup": run(args.tutors, args.lookups)}, args.output)
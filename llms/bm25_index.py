@@ -0,0 +1,129 @@
+import json
+import math
+import re
+from collections import Counter
+
+import numpy as np
+
+from utils.knowledge_files import knowledge_hash, knowledge_passages, format_passages
+from utils.object_cache import get_fs
+
+WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+def tokenize(text):
+    return WORD_PATTERN.findall(text.lower())
+
+def bm25_path(knowledge_hash):
+    # Stored with the vector index of the same knowledge base (see llms/knowledge_index.py)
+    return f'ai-tutors/knowledge-index/{knowledge_hash}/bm25.json'
+
+class BM25Index:
+    """
+    Okapi BM25 keyword index over the passages of a knowledge base.
+
+    The BM25 weight of every (word, passage) pair is computed when the index is built, so a search only
+    adds up the precomputed weights of the query's words (one NumPy scatter-add per word) and picks the top passages.
+    Needs no network access and no embeddings.
+
+    Attributes:
+        passages (list): (file name, text) passages.
+        postings (dict): word -> (passage ids, BM25 weights) as NumPy arrays.
+    """
+
+    def __init__(self, passages, postings):
+        self.passages = passages
+        self.postings = postings
+
+    @classmethod
+    def build(cls, passages, k1=1.5, b=0.75):
+        word_counts = [Counter(tokenize(text)) for _, text in passages]
+        lengths = np.array([sum(counts.values()) for counts in word_counts], dtype=np.float32)
+        average_length = float(lengths.mean()) if len(passages) and lengths.mean() > 0 else 1.0
+
+        # word -> list of (passage id, term frequency)
+        occurrences = {}
+        for passage_id, counts in enumerate(word_counts):
+            for word, count in counts.items():
+                occurrences.setdefault(word, []).append((passage_id, count))
+
+        postings = {}
+        for word, entries in occurrences.items():
+            ids = np.array([passage_id for passage_id, _ in entries], dtype=np.int32)
+            frequencies = np.array([count for _, count in entries], dtype=np.float32)
+            idf = math.log(1 + (len(passages) - len(entries) + 0.5) / (len(entries) + 0.5))
+            weights = idf * frequencies * (k1 + 1) / (frequencies + k1 * (1 - b + b * lengths[ids] / average_length))
+            postings[word] = (ids, weights.astype(np.float32))
+        return cls(passages, postings)
+
+    @classmethod
+    def from_knowledge(cls, knowledge, max_chars=1000):
+        return cls.build(knowledge_passages(knowledge, max_chars=max_chars))
+
+    def search(self, query, top_k=5):
+        """Returns the ids of the `top_k` passages with the highest BM25 score for the query (best first)"""
+        scores = np.zeros(len(self.passages), dtype=np.float32)
+        for word in set(tokenize(query)):
+            posting = self.postings.get(word)
+            if posting is not None:
+                scores[posting[0]] += posting[1]
+        matched = np.flatnonzero(scores)
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(scores[matched], -top_k)[-top_k:]]
+        return [int(i) for i in matched[np.argsort(-scores[matched], kind='stable')]]
+
+    def to_json(self):
+        return json.dumps({"passages": self.passages,
+                           "postings": {word: [ids.tolist(), weights.tolist()]
+                                        for word, (ids, weights) in self.postings.items()}})
+
+    @classmethod
+    def from_json(cls, data):
+        data = json.loads(data)
+        postings = {word: (np.array(ids, dtype=np.int32), np.array(weights, dtype=np.float32))
+                    for word, (ids, weights) in data["postings"].items()}
+        return cls([tuple(passage) for passage in data["passages"]], postings)
+
+def save_bm25_index(knowledge, fs=None):
+    """
+    Builds the BM25 index of a knowledge base and stores it next to its vector index, keyed by the knowledge hash.
+    Indexes that already exist are not rebuilt.
+
+    Returns:
+        str: Path of the stored index (empty if there is no knowledge)
+    """
+    if not knowledge:
+        return ''
+    fs = fs or get_fs()
+    path = bm25_path(knowledge_hash(knowledge))
+    if not fs.exists(path):
+        with fs.open(path, 'wt') as f:
+            f.write(BM25Index.from_knowledge(knowledge).to_json())
+    return path
+
+def load_bm25_index(knowledge, fs=None):
+    """Loads the stored BM25 index of a knowledge base, building (and storing) it first if needed"""
+    fs = fs or get_fs()
+    path = save_bm25_index(knowledge, fs=fs)
+    with fs.open(path, 'rt') as f:
+        return BM25Index.from_json(f.read())
+
+class BM25Retriever:
+    """
+    Same interface as KnowledgeRetriever (see llms/knowledge_index.py), using a BM25 index.
+
+    Attributes:
+        index (BM25Index): The keyword index of the knowledge base.
+        top_k (int): Number of passages retrieved per turn.
+    """
+
+    def __init__(self, index, top_k=5):
+        self.index = index
+        self.top_k = top_k
+
+    def retrieve(self, query):
+        passage_ids = self.index.search(query, self.top_k)
+        # Keep the passages in the order they appear in the knowledge base
+        return format_passages([self.index.passages[i] for i in sorted(passage_ids)])
+
+    async def aretrieve(self, query):
+        return self.retrieve(query)
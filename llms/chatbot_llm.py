@@ -1,33 +1,15 @@
 from llama_index.core.llms import ChatMessage
 
+from llms.prefix_cache import PrefixCachedLLM
+
 def load_text_file(file_path):
     return open(file_path, 'r').read()
 
-class AITutor:
+def build_system_prompt(instructions, guidelines, knowledge):
     """
-    A class that facilitates a back-and-forth conversation between a student and an AI tutor.
-    It uses an LLM (Large Language Model) to guide students through questions, provide feedback, 
-    and help them understand science concepts without directly giving them the answers.
-
-    This class is designed to work with any LLM that has a chat function.
-
-    Attributes:
-        llm (Any LLM with a chat function): The LLM model used to interact with the student.
-        message_history (list): A history of messages exchanged between the student and the tutor.
-    
-    Methods:
-        initiate_conversation(grade, topic): Initiates the tutoring session by asking the student for more details.
-        get_response(student_input): Handles student input and provides a response using the LLM.
-        get_message_history(): Returns the history of messages in the conversation.
+    Builds the AI tutor's system prompt from the tutor's instructions, guidelines and knowledge base.
     """
-
-    def __init__(self, llm_model, instructions, introduction, guidelines, knowledge, display_system=False):
-        self.llm = llm_model
-        self.message_history = []
-        self.introduction = introduction
-
-        # Add these as a "system prompt"
-        system_prompt = f"""
+    system_prompt = f"""
 You are a helpful AI tutor/assistant.
 Following the instructions below, provide supportive assistance to the student user.
 
@@ -53,14 +35,55 @@ Following the instructions below, provide supportive assistance to the student u
       $$
   - DO NOT USE CODE BLOCKS FOR EQUATIONS. ALWAYS USE LATEX FORMATTING.
 """
-        if knowledge:
-            system_prompt += f"""
+    if knowledge:
+        system_prompt += f"""
 ## Knowledge Base
 
 The following files contain reference information to assist with your responses:
 
 {knowledge}
 """
+    return system_prompt
+
+class AITutor:
+    """
+    A class that facilitates a back-and-forth conversation between a student and an AI tutor.
+    It uses an LLM (Large Language Model) to guide students through questions, provide feedback, 
+    and help them understand science concepts without directly giving them the answers.
+
+    This class is designed to work with any LLM that has a chat function.
+
+    Attributes:
+        llm (Any LLM with a chat function): The LLM model used to interact with the student.
+        introduction (str): The tutor's first message to the student.
+        message_history (list): A history of messages exchanged between the student and the tutor.
+        context (ConversationContext): Optional. Keeps the messages sent to the LLM within a token budget
+            by summarizing the older ones (the full history is sent if not provided).
+        retriever (KnowledgeRetriever): Optional. Adds the parts of the knowledge base relevant to the latest turn
+            to the messages sent to the LLM (for tutors whose system prompt does not include the knowledge base).
+        prefix_cache (PrefixCache): Optional. Registers the system prompt with the provider once and references it
+            on later calls instead of resending it.
+    
+    Methods:
+        initiate_conversation(grade, topic): Initiates the tutoring session by asking the student for more details.
+        get_response(student_input): Handles student input and provides a response using the LLM.
+        aget_response(student_input): Async version of get_response using the LLM's async chat function.
+        stream_response(student_input): Generator that yields the response in chunks as the LLM produces them.
+        astream_response(student_input): Async generator that yields the response in chunks as the LLM produces them.
+        llm_messages(): Returns the messages to send to the LLM for the current history.
+        get_message_history(): Returns the history of messages in the conversation.
+    """
+
+    def __init__(self, llm_model, compiled_tutor, display_system=False, context=None, retriever=None,
+                 prefix_cache=None):
+        self.llm = llm_model if prefix_cache is None else PrefixCachedLLM(llm_model, prefix_cache, compiled_tutor)
+        self.context = context
+        self.retriever = retriever
+        self.message_history = []
+        self.introduction = compiled_tutor.introduction
+
+        # The system prompt is built once per tutor and shared by all conversations with it
+        system_prompt = compiled_tutor.system_prompt
         if display_system:
             print(system_prompt)
         
@@ -77,6 +100,43 @@ The following files contain reference information to assist with your responses:
 
         self.message_history.append(ChatMessage(role="assistant", content=self.introduction))
 
+    def retrieval_query(self):
+        # The latest student message and the tutor message it answers
+        conversation = [message for message in self.message_history if message.role.value != 'system']
+        return "\n\n".join(message.content for message in conversation[-2:])
+
+    def add_knowledge(self, messages, excerpts):
+        if not excerpts:
+            return messages
+        knowledge_message = ChatMessage(role="system", content=f"# Relevant Knowledge Base Excerpts\n\n{excerpts}")
+        return [messages[0], knowledge_message] + list(messages[1:])
+
+    def llm_messages(self):
+        """
+        Returns the messages to send to the LLM: the full history, or the system prompt, a summary of
+        the older messages and the most recent turns once the conversation outgrows the context's budget.
+        With a retriever, the relevant knowledge base excerpts follow the system prompt.
+        """
+        messages = self.message_history if self.context is None else self.context.messages(self.message_history)
+        if self.retriever is None:
+            return messages
+        return self.add_knowledge(messages, self.retriever.retrieve(self.retrieval_query()))
+
+    async def allm_messages(self):
+        """Async version of llm_messages"""
+        if self.context is None:
+            messages = self.message_history
+        else:
+            messages = await self.context.amessages(self.message_history)
+        if self.retriever is None:
+            return messages
+        return self.add_knowledge(messages, await self.retriever.aretrieve(self.retrieval_query()))
+
+    def drop_unanswered(self, student_message):
+        """Removes a student message that did not get a response, so that the next turn does not follow it"""
+        if self.message_history and self.message_history[-1] is student_message:
+            self.message_history.pop()
+
     def get_response(self, student_input):
         """
         Handles student input and provides a response.
@@ -86,9 +146,75 @@ The following files contain reference information to assist with your responses:
         self.message_history.append(ChatMessage(role="user", content=student_input))
         
         # Get the response from the LLM
-        response = self.llm.chat(self.message_history).message.content
+        response = self.llm.chat(self.llm_messages()).message.content
         
         # Add the AI's response to the history
         self.message_history.append(ChatMessage(role="assistant", content=response))
         
-        return response
\ No newline at end of file
+        return response
+
+    def stream_response(self, student_input):
+        """
+        Streams the response to the student input.
+        Yields each new chunk of text as soon as the LLM produces it and adds the full response to the history once complete.
+        """
+        # Add the student's message to the history
+        student_message = ChatMessage(role="user", content=student_input)
+        self.message_history.append(student_message)
+
+        # Stream the response from the LLM
+        chunks = []
+        try:
+            for partial in self.llm.stream_chat(self.llm_messages()):
+                delta = partial.delta or ''
+                if delta:
+                    chunks.append(delta)
+                    yield delta
+        except BaseException:
+            # The stream failed or was abandoned (e.g. the client disconnected), so the message is left unanswered
+            self.drop_unanswered(student_message)
+            raise
+
+        # Add the AI's full response to the history
+        self.message_history.append(ChatMessage(role="assistant", content=''.join(chunks)))
+
+    async def aget_response(self, student_input):
+        """
+        Async version of get_response.
+        Uses the LLM's async chat function so that the calling event loop is not blocked while waiting on the LLM.
+        """
+        # Add the student's message to the history
+        self.message_history.append(ChatMessage(role="user", content=student_input))
+
+        # Get the response from the LLM without blocking the event loop
+        response = (await self.llm.achat(await self.allm_messages())).message.content
+
+        # Add the AI's response to the history
+        self.message_history.append(ChatMessage(role="assistant", content=response))
+
+        return response
+
+    async def astream_response(self, student_input):
+        """
+        Streams the response to the student input.
+        Yields each new chunk of text as soon as the LLM produces it and adds the full response to the history once complete.
+        """
+        # Add the student's message to the history
+        student_message = ChatMessage(role="user", content=student_input)
+        self.message_history.append(student_message)
+
+        # Stream the response from the LLM
+        chunks = []
+        try:
+            async for partial in await self.llm.astream_chat(await self.allm_messages()):
+                delta = partial.delta or ''
+                if delta:
+                    chunks.append(delta)
+                    yield delta
+        except BaseException:
+            # The stream failed or was abandoned (e.g. the client disconnected), so the message is left unanswered
+            self.drop_unanswered(student_message)
+            raise
+
+        # Add the AI's full response to the history
+        self.message_history.append(ChatMessage(role="assistant", content=''.join(chunks)))
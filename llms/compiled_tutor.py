@@ -0,0 +1,167 @@
+import hashlib
+import sys
+import threading
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from llama_index.core.utils import get_tokenizer
+
+from llms.chatbot_llm import build_system_prompt
+from llms.moderator_llm import build_moderation_prompt, build_correction_prompt, build_review_prompt
+from utils.config import open_config
+
+def count_tokens(text):
+    return len(get_tokenizer()(text))
+
+def tutor_key(instructions, guidelines, introduction, knowledge):
+    """
+    Content hash identifying a tutor definition.
+    Each field is length-prefixed so that different splits of the same text produce different keys.
+    """
+    sha = hashlib.sha256()
+    for field in (instructions, guidelines, introduction, knowledge):
+        data = (field or '').encode('utf-8')
+        sha.update(len(data).to_bytes(8, 'big'))
+        sha.update(data)
+    return sha.hexdigest()
+
+@dataclass(frozen=True)
+class CompiledTutor:
+    """
+    Immutable, pre-built prompts for one tutor definition.
+    A single instance is shared by every conversation with the same tutor in this process.
+
+    Attributes:
+        key (str): Content hash of the instructions, guidelines, introduction and knowledge.
+        instructions, guidelines, introduction, knowledge (str): The tutor definition.
+        system_prompt (str): The AI tutor's system prompt.
+        moderation_prompt (str): The moderator's system prompt.
+        correction_prompt (str): The corrector's system prompt.
+        review_prompt (str): The system prompt for moderating and correcting in a single call.
+        system_prompt_tokens, moderation_prompt_tokens, correction_prompt_tokens, review_prompt_tokens (int): Token counts of the prompts.
+    """
+    key: str
+    instructions: str
+    guidelines: str
+    introduction: str
+    knowledge: str
+    system_prompt: str
+    moderation_prompt: str
+    correction_prompt: str
+    review_prompt: str
+    system_prompt_tokens: int
+    moderation_prompt_tokens: int
+    correction_prompt_tokens: int
+    review_prompt_tokens: int
+
+    @property
+    def size(self):
+        # Approximate memory footprint in bytes, used for cache eviction
+        return sum(sys.getsizeof(text) for text in (self.instructions, self.guidelines, self.introduction,
+                                                     self.knowledge, self.system_prompt,
+                                                     self.moderation_prompt, self.correction_prompt,
+                                                     self.review_prompt))
+
+def build_compiled_tutor(instructions, guidelines, introduction, knowledge, key=None):
+    instructions = instructions or ''
+    guidelines = guidelines or ''
+    introduction = introduction or ''
+    knowledge = knowledge or ''
+    system_prompt = build_system_prompt(instructions, guidelines, knowledge)
+    moderation_prompt = build_moderation_prompt(guidelines, instructions)
+    correction_prompt = build_correction_prompt(guidelines)
+    review_prompt = build_review_prompt(guidelines, instructions)
+    return CompiledTutor(key=key or tutor_key(instructions, guidelines, introduction, knowledge),
+                         instructions=instructions,
+                         guidelines=guidelines,
+                         introduction=introduction,
+                         knowledge=knowledge,
+                         system_prompt=system_prompt,
+                         moderation_prompt=moderation_prompt,
+                         correction_prompt=correction_prompt,
+                         review_prompt=review_prompt,
+                         system_prompt_tokens=count_tokens(system_prompt),
+                         moderation_prompt_tokens=count_tokens(moderation_prompt),
+                         correction_prompt_tokens=count_tokens(correction_prompt),
+                         review_prompt_tokens=count_tokens(review_prompt))
+
+class CompiledTutorCache:
+    """
+    Process-level LRU cache of compiled tutors keyed by content hash.
+    The least recently used tutors are evicted once the total size exceeds `max_bytes`.
+
+    Compiled tutors are also interned: as long as any conversation still references a tutor,
+    the same instance is returned (even after eviction) so that there is only ever one copy in memory.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self._tutors = OrderedDict()
+        self._live = weakref.WeakValueDictionary()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, instructions, guidelines, introduction, knowledge) -> CompiledTutor:
+        key = tutor_key(instructions, guidelines, introduction, knowledge)
+        with self.lock:
+            compiled = self._tutors.get(key)
+            if compiled is not None:
+                self._tutors.move_to_end(key)
+                self.hits += 1
+                return compiled
+            # Reuse a tutor that was evicted but is still referenced by a conversation
+            compiled = self._live.get(key)
+            if compiled is not None:
+                self._insert(key, compiled)
+                self.hits += 1
+                return compiled
+            self.misses += 1
+
+        # Build outside the lock so that other tutors are not blocked
+        compiled = build_compiled_tutor(instructions, guidelines, introduction, knowledge, key=key)
+
+        with self.lock:
+            # Another thread may have built the same tutor in the meantime
+            existing = self._tutors.get(key) or self._live.get(key)
+            if existing is not None:
+                if key not in self._tutors:
+                    self._insert(key, existing)
+                return existing
+            self._insert(key, compiled)
+        return compiled
+
+    def _insert(self, key, compiled):
+        # Must be called with the lock held
+        self._tutors[key] = compiled
+        self._live[key] = compiled
+        self._total_bytes += compiled.size
+        # Evict least recently used tutors (always keeping the newest one)
+        while self._total_bytes > self.max_bytes and len(self._tutors) > 1:
+            _, evicted = self._tutors.popitem(last=False)
+            self._total_bytes -= evicted.size
+            self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {"tutors": len(self._tutors), "live_tutors": len(self._live),
+                    "bytes": self._total_bytes, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_compiled_tutor_cache() -> CompiledTutorCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            max_mb = open_config()['llm']['compiled_tutor_cache_mb']
+            _cache = CompiledTutorCache(max_bytes=max_mb * 1024 * 1024)
+        return _cache
+
+def compile_tutor(instructions, guidelines, introduction, knowledge) -> CompiledTutor:
+    """Return the shared compiled tutor for this definition, building it if needed"""
+    return get_compiled_tutor_cache().get(instructions, guidelines, introduction, knowledge)
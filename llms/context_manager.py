@@ -0,0 +1,136 @@
+from functools import lru_cache
+
+from llama_index.core.llms import ChatMessage
+from llama_index.core.utils import get_tokenizer
+
+# Marks the text extracted from files uploaded with a message (see pages/tutor.py)
+ATTACHMENT_MARKER = '\n\n## Uploaded file contents:\n\n'
+
+SUMMARY_PROMPT = '''
+# Your Task
+
+You keep a running summary of a tutoring conversation between a student and an AI tutor.
+
+You will be given the current summary (which may be empty) and the messages that followed it.
+Update the summary so that it includes the new messages.
+
+# Response Format
+
+Respond ONLY WITH THE UPDATED SUMMARY in at most {max_words} words. Keep what the student is working on,
+their grade and topic, the questions they asked, what they have already figured out, what they still struggle with,
+and the key content of any uploaded files that is still relevant.
+'''
+
+@lru_cache(maxsize=4096)
+def count_tokens(text):
+    return len(get_tokenizer()(text))
+
+def strip_attachment(content):
+    # Keep the student's message but drop the text extracted from uploaded files
+    message, marker, _ = content.partition(ATTACHMENT_MARKER)
+    if not marker:
+        return content
+    return message + '\n\n(The contents of the uploaded files are included in the summary.)'
+
+class ConversationContext:
+    """
+    Chooses the messages sent to the LLM so that long conversations stay within a token budget.
+
+    While the whole conversation fits in `max_tokens`, it is sent as is. Beyond that, the system prompt
+    and the last `keep_turns` turns are sent verbatim and the older messages are replaced by a rolling summary.
+    The summary is updated incrementally: each turn only folds the messages that just left the window into it,
+    so the work per turn is bounded however long the conversation gets.
+
+    Attributes:
+        llm: The LLM used to write the summary.
+        summary (str): Summary of the messages that are no longer sent verbatim.
+        num_summarized (int): Number of messages (after the system prompt) covered by the summary.
+    """
+
+    def __init__(self, llm, max_tokens, keep_turns=6, summary_max_words=250):
+        self.llm = llm
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.summary_max_words = summary_max_words
+        self.summary = ''
+        self.num_summarized = 0
+
+    def reset(self):
+        self.summary = ''
+        self.num_summarized = 0
+
+    def _window(self, conversation, budget):
+        """
+        Returns the messages to send verbatim and the index of the first one in the conversation.
+        If they do not fit in `budget` tokens, uploaded files are dropped from earlier messages
+        and then the oldest turns are dropped (to be summarized) until they do.
+        """
+        # A turn starts with a student message
+        turn_starts = [i for i, message in enumerate(conversation)
+                       if message.role.value == 'user' and i >= self.num_summarized]
+        if not turn_starts:
+            return conversation[self.num_summarized:], self.num_summarized
+        first_turn = max(0, len(turn_starts) - self.keep_turns)
+        window_start = turn_starts[first_turn]
+        window = conversation[window_start:]
+
+        tokens = sum(count_tokens(message.content) for message in window)
+        if tokens > budget:
+            # Uploaded files from earlier turns are the first to go (the latest message is always kept whole)
+            window = [ChatMessage(role=message.role, content=strip_attachment(message.content))
+                      if message.role.value == 'user' and i < len(window) - 1 else message
+                      for i, message in enumerate(window)]
+            tokens = sum(count_tokens(message.content) for message in window)
+        for turn_start in turn_starts[first_turn + 1:]:
+            if tokens <= budget:
+                break
+            # Drop the oldest turn in the window
+            dropped = turn_start - window_start
+            tokens -= sum(count_tokens(message.content) for message in window[:dropped])
+            window = window[dropped:]
+            window_start = turn_start
+        return window, window_start
+
+    def _plan(self, message_history):
+        """
+        Returns (messages to send verbatim after the system prompt, messages to fold into the summary,
+        number of messages covered by the summary afterwards).
+        """
+        system_message, conversation = message_history[0], message_history[1:]
+        system_tokens = count_tokens(system_message.content)
+        if self.num_summarized == 0:
+            total_tokens = system_tokens + sum(count_tokens(message.content) for message in conversation)
+            if total_tokens <= self.max_tokens:
+                return conversation, [], 0
+
+        # Leave room for the system prompt and the summary (roughly two tokens per word)
+        budget = self.max_tokens - system_tokens - 2 * self.summary_max_words
+        window, window_start = self._window(conversation, budget)
+        return window, conversation[self.num_summarized:window_start], max(window_start, self.num_summarized)
+
+    def _summary_request(self, new_messages):
+        new_text = "\n\n".join([f"**{message.role.value}**: {message.content}" for message in new_messages])
+        return [ChatMessage(role="system", content=SUMMARY_PROMPT.format(max_words=self.summary_max_words)),
+                ChatMessage(role="user", content=f"# Current Summary\n\n{self.summary}\n\n# New Messages\n\n{new_text}")]
+
+    def _messages(self, message_history, window):
+        if not self.summary:
+            return [message_history[0]] + window
+        summary_message = ChatMessage(role="system", content=f"# Summary of the Earlier Conversation\n\n{self.summary}")
+        return [message_history[0], summary_message] + window
+
+    def messages(self, message_history):
+        """Returns the messages to send to the LLM for this conversation, updating the summary if needed"""
+        window, new_messages, num_summarized = self._plan(message_history)
+        if new_messages:
+            self.summary = self.llm.chat(self._summary_request(new_messages)).message.content.strip()
+            self.num_summarized = num_summarized
+        return self._messages(message_history, window)
+
+    async def amessages(self, message_history):
+        """Async version of messages"""
+        window, new_messages, num_summarized = self._plan(message_history)
+        if new_messages:
+            self.summary = (await self.llm.achat(self._summary_request(new_messages))).message.content.strip()
+            self.num_summarized = num_summarized
+        return self._messages(message_history, window)
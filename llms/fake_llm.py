@@ -0,0 +1,180 @@
+import asyncio
+import math
+import random
+import threading
+import time
+from collections import Counter
+
+from llama_index.core.llms import ChatMessage, ChatResponse
+
+# Drafts and corrections are told apart by their first words, so the moderator can treat them differently
+DRAFT_PREFIX = "Let's think about this together."
+CORRECTION_PREFIX = "Let's take this one step at a time."
+
+FILLER_WORDS = ("what do you notice about the first part of the question and how could you use it "
+                "to decide on the next step before we check the answer together").split()
+
+class LatencyDistribution:
+    """
+    Seconds an LLM call takes before its first token.
+
+    Distributions:
+        constant: always `median_seconds`.
+        uniform: between `min_seconds` and `max_seconds`.
+        lognormal: median `median_seconds` with spread `sigma` (a long tail, like real LLM latencies).
+    """
+
+    def __init__(self, distribution='constant', median_seconds=0.0, sigma=0.5, min_seconds=0.0, max_seconds=0.0):
+        if distribution not in ('constant', 'uniform', 'lognormal'):
+            raise ValueError(f"Unknown latency distribution: {distribution}")
+        self.distribution = distribution
+        self.median_seconds = median_seconds
+        self.sigma = sigma
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+
+    def sample(self, rng):
+        if self.distribution == 'uniform':
+            return rng.uniform(self.min_seconds, self.max_seconds)
+        if self.distribution == 'lognormal' and self.median_seconds > 0:
+            return rng.lognormvariate(math.log(self.median_seconds), self.sigma)
+        return self.median_seconds
+
+class FakeLLM:
+    """
+    Deterministic stand-in for the Gemini/OpenAI LLMs, for benchmarks and load tests without a key or network.
+
+    It recognises the calls made by the tutor pipeline and answers each kind in the expected format:
+    tutor drafts, moderation verdicts (separate or combined with a correction), corrections and summaries.
+    The moderator rejects drafts with probability `reject_draft` and corrected responses with
+    probability `reject_correction`. Every call waits for a sampled latency, and streamed responses
+    arrive at `tokens_per_second` (one word per token). Given the same seed and order of calls,
+    the same responses are produced.
+
+    Attributes:
+        calls (Counter): Number of calls of each kind.
+        input_chars (int): Total characters sent to the LLM.
+    """
+
+    def __init__(self, latency=None, tokens_per_second=0, reject_draft=0.0, reject_correction=0.0,
+                 response_words=40, seed=0):
+        self.latency = latency or LatencyDistribution()
+        self.tokens_per_second = tokens_per_second
+        self.reject_draft = reject_draft
+        self.reject_correction = reject_correction
+        self.response_words = response_words
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.input_chars = 0
+        self.model = 'fake'
+        self.temperature = 0.0
+
+    @classmethod
+    def from_config(cls, fake_config):
+        fake_config = fake_config or {}
+        return cls(latency=LatencyDistribution(**fake_config.get('latency', {})),
+                   tokens_per_second=fake_config.get('tokens_per_second', 0),
+                   reject_draft=fake_config.get('reject_draft', 0.0),
+                   reject_correction=fake_config.get('reject_correction', 0.0),
+                   response_words=fake_config.get('response_words', 40),
+                   seed=fake_config.get('seed', 0))
+
+    def _text(self, prefix):
+        words = [FILLER_WORDS[i % len(FILLER_WORDS)] for i in range(max(0, self.response_words - len(prefix.split())))]
+        return f"{prefix} {' '.join(words)}".strip()
+
+    def _respond(self, messages):
+        """Returns (kind of call, response text, latency) for a chat"""
+        system = messages[0].content if messages and messages[0].role.value == 'system' else ''
+        query = messages[-1].content if messages else ''
+        with self.lock:
+            self.input_chars += sum(len(message.content) for message in messages)
+            latency = self.latency.sample(self.rng)
+            if 'is the following AI response appropriate' in query:
+                ai_response = query.rsplit('# AI Response:', 1)[-1]
+                reject_rate = self.reject_correction if CORRECTION_PREFIX in ai_response else self.reject_draft
+                appropriate = self.rng.random() >= reject_rate
+                kind = 'review' if 'CORRECTED RESPONSE:' in system else 'moderation'
+            elif 'running summary' in system:
+                kind = 'summary'
+            else:
+                kind = 'draft'
+            self.calls[kind] += 1
+
+        if kind == 'summary':
+            return kind, "The student is working through a problem with the tutor's guidance.", latency
+        if kind == 'draft':
+            return kind, self._text(DRAFT_PREFIX), latency
+        verdict = "Yes. The response is appropriate." if appropriate else "No. The response is not appropriate."
+        if kind == 'moderation':
+            return kind, f"The response was checked against each guideline.\n{verdict}", latency
+        review = f"The response was checked against each guideline.\nVERDICT: {verdict}"
+        if not appropriate:
+            review += f"\nCORRECTED RESPONSE:\n{self._text(CORRECTION_PREFIX)}"
+        return kind, review, latency
+
+    def _correction(self, prompt):
+        template = getattr(prompt, 'template', prompt)
+        with self.lock:
+            self.input_chars += len(template)
+            latency = self.latency.sample(self.rng)
+            self.calls['correction'] += 1
+        return self._text(CORRECTION_PREFIX), latency
+
+    def _token_delay(self):
+        return 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0
+
+    def chat(self, messages, **kwargs):
+        _, text, latency = self._respond(messages)
+        time.sleep(latency)
+        return ChatResponse(message=ChatMessage(role="assistant", content=text))
+
+    def stream_chat(self, messages, **kwargs):
+        _, text, latency = self._respond(messages)
+
+        def gen():
+            time.sleep(latency)
+            content = ''
+            for i, word in enumerate(text.split(' ')):
+                delta = word if i == 0 else ' ' + word
+                if i > 0:
+                    time.sleep(self._token_delay())
+                content += delta
+                yield ChatResponse(message=ChatMessage(role="assistant", content=content), delta=delta)
+
+        return gen()
+
+    async def achat(self, messages, **kwargs):
+        _, text, latency = self._respond(messages)
+        await asyncio.sleep(latency)
+        return ChatResponse(message=ChatMessage(role="assistant", content=text))
+
+    async def astream_chat(self, messages, **kwargs):
+        _, text, latency = self._respond(messages)
+
+        async def gen():
+            await asyncio.sleep(latency)
+            content = ''
+            for i, word in enumerate(text.split(' ')):
+                delta = word if i == 0 else ' ' + word
+                if i > 0:
+                    await asyncio.sleep(self._token_delay())
+                content += delta
+                yield ChatResponse(message=ChatMessage(role="assistant", content=content), delta=delta)
+
+        return gen()
+
+    def predict(self, prompt, **kwargs):
+        text, latency = self._correction(prompt)
+        time.sleep(latency)
+        return text
+
+    async def apredict(self, prompt, **kwargs):
+        text, latency = self._correction(prompt)
+        await asyncio.sleep(latency)
+        return text
+
+    def stats(self):
+        with self.lock:
+            return {"calls": dict(self.calls), "input_chars": self.input_chars}
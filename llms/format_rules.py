@@ -0,0 +1,189 @@
+import re
+import threading
+from dataclasses import dataclass, field
+
+# Code is left untouched
+CODE_PATTERN = re.compile(r'(```.*?```|`[^`\n]*`)', re.DOTALL)
+# Math that already uses the expected delimiters ($ followed by a digit is a currency amount, not math)
+MATH_PATTERN = re.compile(r'(\$\$.*?\$\$|\$(?!\d)[^$\n]+\$)', re.DOTALL)
+# New $...$ delimiters would pair up with the dollar signs of currency amounts
+CURRENCY_PATTERN = re.compile(r'\$\d')
+
+DELIMITER_RULES = [
+    # \[ ... \] -> $$ ... $$
+    ('display_math_brackets', re.compile(r'\\\[\s*(.+?)\s*\\\]', re.DOTALL), r'$$\1$$'),
+    # \( ... \) -> $ ... $
+    ('inline_math_parentheses', re.compile(r'\\\(\s*(.+?)\s*\\\)', re.DOTALL), r'$\1$'),
+]
+
+# A number, a name or a parenthesized expression that a root, power or index applies to
+OPERAND = r'(\d+(?:\.\d+)?|[A-Za-z]\w*|\([^()\n]*\))'
+
+# Unicode math symbols that stand on their own and their LaTeX equivalents
+UNICODE_SYMBOLS = {
+    '×': r'\times', '÷': r'\div', '±': r'\pm', '∓': r'\mp',
+    '≤': r'\leq', '≥': r'\geq', '≠': r'\neq', '≈': r'\approx',
+    '∞': r'\infty', 'π': r'\pi', 'θ': r'\theta',
+    '·': r'\cdot', '→': r'\rightarrow',
+}
+UNICODE_PATTERN = re.compile('[' + ''.join(re.escape(symbol) for symbol in UNICODE_SYMBOLS) + ']')
+# Powers that apply to the operand before them
+UNICODE_POWERS = {'²': '^{2}', '³': '^{3}', '°': r'^\circ'}
+
+SQRT_PATTERN = re.compile('√' + OPERAND)
+POWER_PATTERN = re.compile(OPERAND + '([²³°])')
+HTML_SUPERSCRIPT_PATTERN = re.compile(OPERAND + r'<sup>(.*?)</sup>', re.IGNORECASE | re.DOTALL)
+HTML_SUBSCRIPT_PATTERN = re.compile(OPERAND + r'<sub>(.*?)</sub>', re.IGNORECASE | re.DOTALL)
+# What is left of these after the rules had no operand to apply to
+DANGLING_PATTERN = re.compile(r'[√²³°]|</?su[bp]>', re.IGNORECASE)
+
+# Generated math is marked while the rules run so that adjacent pieces become a single $...$
+MATH_START, MATH_END = '\x00', '\x01'
+
+# Violations that cannot be rewritten reliably (left to the LLM moderator)
+UNFIXABLE_RULES = [
+    ('mathml', re.compile(r'<math[\s>]', re.IGNORECASE)),
+]
+
+@dataclass
+class FormatResult:
+    """
+    Outcome of applying the formatting rules to a response.
+
+    Attributes:
+        text (str): The response with every fixable violation rewritten.
+        fixes (dict): Number of rewrites made by each rule.
+        unfixable (list): Names of violations that were found but could not be rewritten.
+    """
+    text: str
+    fixes: dict = field(default_factory=dict)
+    unfixable: list = field(default_factory=list)
+
+    @property
+    def fixed(self):
+        return sum(self.fixes.values()) > 0
+
+def unicode_to_latex(symbol):
+    latex = UNICODE_SYMBOLS[symbol]
+    # Separate commands (e.g. \times) from a following letter
+    if latex[-1].isalpha():
+        latex += ' '
+    return latex
+
+def strip_parentheses(operand):
+    return operand[1:-1] if operand.startswith('(') else operand
+
+def sqrt_to_latex(match):
+    return rf'\sqrt{{{strip_parentheses(match.group(1))}}}'
+
+def power_to_latex(match):
+    return match.group(1) + UNICODE_POWERS[match.group(2)]
+
+def superscript_to_latex(match):
+    return f'{match.group(1)}^{{{match.group(2)}}}'
+
+def subscript_to_latex(match):
+    return f'{match.group(1)}_{{{match.group(2)}}}'
+
+def as_math(to_latex):
+    """Wraps a rewrite in (marked) math delimiters, for text outside existing math"""
+    return lambda match: MATH_START + to_latex(match).strip() + MATH_END
+
+def apply_rules(text, rules, fixes):
+    for name, pattern, replacement in rules:
+        text, count = pattern.subn(replacement, text)
+        if count:
+            fixes[name] = fixes.get(name, 0) + count
+    return text
+
+# Rules for text outside math (each rewrite becomes math) and inside existing math
+TEXT_RULES = [
+    ('html_superscript', HTML_SUPERSCRIPT_PATTERN, as_math(superscript_to_latex)),
+    ('html_subscript', HTML_SUBSCRIPT_PATTERN, as_math(subscript_to_latex)),
+    ('unicode_math', SQRT_PATTERN, as_math(sqrt_to_latex)),
+    ('unicode_math', POWER_PATTERN, as_math(power_to_latex)),
+    ('unicode_math', UNICODE_PATTERN, as_math(lambda match: unicode_to_latex(match.group(0)))),
+]
+MATH_RULES = [
+    ('unicode_math', SQRT_PATTERN, sqrt_to_latex),
+    ('unicode_math', POWER_PATTERN, power_to_latex),
+    ('unicode_math', UNICODE_PATTERN, lambda match: unicode_to_latex(match.group(0))),
+]
+
+def fix_html_and_unicode(text, fixes, unfixable):
+    # Math delimiters cannot be added safely next to currency amounts, so the LLM moderator handles those
+    add_delimiters = not CURRENCY_PATTERN.search(text)
+    # Odd parts are existing $...$ math, where Unicode symbols are replaced without new delimiters
+    parts = MATH_PATTERN.split(text)
+    for i, part in enumerate(parts):
+        if i % 2 == 1:
+            part = apply_rules(part, MATH_RULES, fixes)
+        elif add_delimiters:
+            part = apply_rules(part, TEXT_RULES, fixes)
+            # Merge adjacent rewrites (e.g. x² + y² -> $x^{2}$ + $y^{2}$, but x²·y -> $x^{2}\cdot y$)
+            part = part.replace(MATH_END + MATH_START, '').replace(MATH_START, '$').replace(MATH_END, '$')
+        elif UNICODE_PATTERN.search(part):
+            unfixable.append('math_next_to_currency')
+        if DANGLING_PATTERN.search(part):
+            unfixable.append('math_without_operand')
+        parts[i] = part
+    return ''.join(parts)
+
+def apply_format_rules(text) -> FormatResult:
+    """
+    Rewrites math formatting that the moderation guidelines do not allow
+    (\\( \\), \\[ \\], HTML and Unicode math) to $...$ and $$...$$ delimiters.
+    Code spans and code blocks are left untouched.
+    """
+    fixes = {}
+    unfixable = []
+    # Odd parts are code
+    parts = CODE_PATTERN.split(text)
+    for i in range(0, len(parts), 2):
+        part = apply_rules(parts[i], DELIMITER_RULES, fixes)
+        parts[i] = fix_html_and_unicode(part, fixes, unfixable)
+    text = ''.join(parts)
+
+    unfixable += [name for name, pattern in UNFIXABLE_RULES if pattern.search(text)]
+    return FormatResult(text=text, fixes=fixes, unfixable=list(dict.fromkeys(unfixable)))
+
+class FormatRuleStats:
+    """
+    Process-level counters for the formatting rules.
+
+    `llm_calls_avoided` estimates the moderator calls saved: a response whose only problems were fixed
+    by the rules would otherwise have been rejected, corrected and moderated again
+    (two calls with separate moderation and correction, one with the combined mode).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.responses_checked = 0
+        self.responses_fixed = 0
+        self.responses_unfixable = 0
+        self.llm_calls_avoided = 0
+        self.fixes = {}
+
+    def record(self, result, calls_per_rejection):
+        with self.lock:
+            self.responses_checked += 1
+            for name, count in result.fixes.items():
+                self.fixes[name] = self.fixes.get(name, 0) + count
+            if result.unfixable:
+                self.responses_unfixable += 1
+            elif result.fixed:
+                self.responses_fixed += 1
+                self.llm_calls_avoided += calls_per_rejection
+
+    def stats(self):
+        with self.lock:
+            return {"responses_checked": self.responses_checked,
+                    "responses_fixed": self.responses_fixed,
+                    "responses_unfixable": self.responses_unfixable,
+                    "llm_calls_avoided": self.llm_calls_avoided,
+                    "fixes": dict(self.fixes)}
+
+_stats = FormatRuleStats()
+
+def get_format_rule_stats() -> FormatRuleStats:
+    return _stats
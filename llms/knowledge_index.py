@@ -0,0 +1,143 @@
+import threading
+from collections import OrderedDict
+
+from llama_index.core import Document, StorageContext, VectorStoreIndex, load_index_from_storage
+from llama_index.core.node_parser import SentenceSplitter
+
+from llms.bm25_index import BM25Retriever, load_bm25_index
+from llms.models import get_embed
+from utils.config import open_config
+from utils.knowledge_files import format_passages, knowledge_hash, split_knowledge
+from utils.object_cache import get_fs
+
+INDEX_DIR = 'ai-tutors/knowledge-index'
+
+def index_path(knowledge_hash):
+    return f'{INDEX_DIR}/{knowledge_hash}'
+
+def retrieval_config():
+    llm_config = open_config()['llm']
+    return {"backend": llm_config.get('retrieval_backend', 'vector'),
+            "embed_model": llm_config.get('embed_model', 'text-embedding-3-small'),
+            "chunk_size": llm_config.get('retrieval_chunk_size', 512),
+            "chunk_overlap": llm_config.get('retrieval_chunk_overlap', 64),
+            "top_k": llm_config.get('retrieval_top_k', 5)}
+
+def build_index(knowledge, embed_model, chunk_size=512, chunk_overlap=64):
+    """
+    Splits the knowledge base into chunks (keeping track of the file each comes from) and embeds them
+    in an in-memory vector store.
+    """
+    documents = [Document(text=text, metadata={"file_name": file_name})
+                 for file_name, text in split_knowledge(knowledge)]
+    splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return VectorStoreIndex.from_documents(documents, embed_model=embed_model, transformations=[splitter])
+
+def save_knowledge_index(knowledge, embed_model=None, fs=None):
+    """
+    Builds the vector index of a knowledge base and stores it next to the knowledge base, keyed by its hash.
+    Indexes that already exist are not rebuilt.
+
+    Returns:
+        str: Path of the stored index (empty if there is no knowledge)
+    """
+    if not knowledge:
+        return ''
+    config = retrieval_config()
+    fs = fs or get_fs()
+    path = index_path(knowledge_hash(knowledge))
+    if not fs.exists(f'{path}/docstore.json'):
+        index = build_index(knowledge, embed_model or get_embed(config['embed_model']),
+                            config['chunk_size'], config['chunk_overlap'])
+        index.storage_context.persist(persist_dir=path, fs=fs)
+    return path
+
+def load_knowledge_index(knowledge, embed_model=None, fs=None):
+    """Loads the stored vector index of a knowledge base, building (and storing) it first if needed"""
+    config = retrieval_config()
+    embed_model = embed_model or get_embed(config['embed_model'])
+    fs = fs or get_fs()
+    path = save_knowledge_index(knowledge, embed_model=embed_model, fs=fs)
+    storage_context = StorageContext.from_defaults(persist_dir=path, fs=fs)
+    return load_index_from_storage(storage_context, embed_model=embed_model)
+
+def format_excerpts(nodes):
+    """Formats retrieved chunks like the knowledge base itself (under the name of the file they come from)"""
+    return format_passages([(node.node.metadata.get("file_name", ''), node.node.get_content().strip())
+                            for node in nodes])
+
+class KnowledgeRetriever:
+    """
+    Finds the parts of a tutor's knowledge base that are relevant to the current student turn.
+
+    Attributes:
+        index (VectorStoreIndex): The vector index of the knowledge base.
+        top_k (int): Number of chunks retrieved per turn.
+    """
+
+    def __init__(self, index, top_k=5):
+        self.index = index
+        self.top_k = top_k
+        self.retriever = index.as_retriever(similarity_top_k=top_k)
+
+    def retrieve(self, query):
+        if not query.strip():
+            return ''
+        return format_excerpts(self.retriever.retrieve(query))
+
+    async def aretrieve(self, query):
+        if not query.strip():
+            return ''
+        return format_excerpts(await self.retriever.aretrieve(query))
+
+class KnowledgeIndexCache:
+    """
+    Process-level LRU cache of loaded knowledge indexes keyed by backend and knowledge hash,
+    so that conversations with the same tutor share one index.
+    """
+
+    def __init__(self, max_indexes):
+        self.max_indexes = max_indexes
+        self.lock = threading.Lock()
+        self._indexes = OrderedDict()
+        # One lock per knowledge base so that an index is only loaded (or built) once at a time
+        self._loading = {}
+
+    def get(self, knowledge, backend='vector'):
+        key = (backend, knowledge_hash(knowledge))
+        with self.lock:
+            if key in self._indexes:
+                self._indexes.move_to_end(key)
+                return self._indexes[key]
+            loading = self._loading.setdefault(key, threading.Lock())
+
+        with loading:
+            with self.lock:
+                if key in self._indexes:
+                    return self._indexes[key]
+            index = load_bm25_index(knowledge) if backend == 'bm25' else load_knowledge_index(knowledge)
+            with self.lock:
+                self._indexes[key] = index
+                while len(self._indexes) > self.max_indexes:
+                    self._indexes.popitem(last=False)
+                self._loading.pop(key, None)
+        return index
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_knowledge_index_cache() -> KnowledgeIndexCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = KnowledgeIndexCache(max_indexes=open_config()['llm'].get('knowledge_index_cache_size', 32))
+        return _cache
+
+def get_knowledge_retriever(knowledge):
+    """Retriever over the knowledge base with the configured backend, loading its shared index if needed"""
+    config = retrieval_config()
+    if config['backend'] == 'bm25':
+        return BM25Retriever(get_knowledge_index_cache().get(knowledge, 'bm25'), top_k=config['top_k'])
+    elif config['backend'] == 'vector':
+        return KnowledgeRetriever(get_knowledge_index_cache().get(knowledge, 'vector'), top_k=config['top_k'])
+    raise ValueError(f"Unknown retrieval backend: {config['backend']}")
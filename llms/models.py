@@ -1,13 +1,40 @@
-import streamlit as st
-from llama_index.llms.gemini import Gemini
-from utils.config import get_model_config
+import threading
 
-#from transformers import OpenAIGPTTokenizerFast
+from utils.config import get_model_config, open_config
 
-@st.cache_resource
-def get_llm():
-    model_config = get_model_config()
-    if 'gemini' in model_config['model']:
+class LLMRegistry:
+    """
+    Process-level registry of LLM and embedding clients.
+
+    Clients are created on first use and shared by every Streamlit session, API request and worker thread
+    in the process. They are keyed by their settings, so a change of model creates a new client.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._clients = {}
+
+    def get(self, key, create):
+        with self.lock:
+            if key not in self._clients:
+                self._clients[key] = create()
+            return self._clients[key]
+
+    def keys(self):
+        with self.lock:
+            return list(self._clients)
+
+_registry = LLMRegistry()
+
+def get_llm_registry() -> LLMRegistry:
+    return _registry
+
+def create_llm(model_config):
+    if model_config['model'] == 'fake':
+        from llms.fake_llm import FakeLLM
+        return FakeLLM.from_config(open_config()['llm'].get('fake_llm'))
+    elif 'gemini' in model_config['model']:
+        from llama_index.llms.gemini import Gemini
         return Gemini(model=model_config['model'], 
                       temperature=model_config['temperature'], 
                       api_key=model_config['api_key'])
@@ -17,11 +44,13 @@ def get_llm():
                       temperature=model_config['temperature'], 
                       api_key=model_config['api_key'])
 
-@st.cache_resource
-def get_embed(model_name):
-    from llama_index.embeddings.openai import OpenAIEmbedding
-    return OpenAIEmbedding(model=model_name)
+def get_llm():
+    model_config = get_model_config()
+    key = ('llm', model_config['model'], model_config['temperature'])
+    return _registry.get(key, lambda: create_llm(model_config))
 
-#@st.cache_resource
-#def get_tokenizer(hf_token):
-#    return OpenAIGPTTokenizerFast.from_pretrained("openai-community/openai-gpt", token=hf_token)
\ No newline at end of file
+def get_embed(model_name):
+    def create_embed():
+        from llama_index.embeddings.openai import OpenAIEmbedding
+        return OpenAIEmbedding(model=model_name)
+    return _registry.get(('embed', model_name), create_embed)
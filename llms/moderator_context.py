@@ -0,0 +1,110 @@
+from llms.bm25_index import BM25Index
+from utils.knowledge_files import format_passages, split_knowledge
+
+def knowledge_digest(knowledge, chars_per_file):
+    """Lists the files in the knowledge base with the beginning of each"""
+    lines = []
+    for file_name, text in split_knowledge(knowledge):
+        excerpt = text[:chars_per_file].strip()
+        if len(text) > chars_per_file:
+            excerpt += ' ...'
+        lines.append(f"----- {file_name} -----\n\n{excerpt}" if file_name else excerpt)
+    return "\n\n".join(lines)
+
+class ModeratorContext:
+    """
+    Builds the conversation shown to the moderator and corrector for one chat.
+
+    Policies:
+        full: every message, including the tutor's system prompt with the whole knowledge base.
+        recent: the last `keep_turns` turns and a digest of the knowledge base (file names and their beginnings).
+        retrieval: the last `keep_turns` turns and the knowledge base passages most relevant to them (by BM25).
+
+    With `recent` and `retrieval` the moderator's prompt stays bounded however long the chat runs.
+    Messages are formatted once and the transcript is reused until the conversation changes,
+    so repeated moderation of the same turn does not rebuild it.
+    """
+
+    def __init__(self, knowledge, policy='recent', keep_turns=4, digest_chars_per_file=500, excerpt_chars=4000):
+        if policy not in ('full', 'recent', 'retrieval'):
+            raise ValueError(f"Unknown moderator context policy: {policy}")
+        self.knowledge = knowledge or ''
+        self.policy = policy
+        self.keep_turns = keep_turns
+        self.digest_chars_per_file = digest_chars_per_file
+        self.excerpt_chars = excerpt_chars
+        # Formatted messages so far, as (message content, formatted text)
+        self._formatted = []
+        self._transcript_key = None
+        self._transcript = ''
+        self._digest = None
+        self._bm25 = None
+
+    def _format(self, messages):
+        # Only format the messages that were added (or changed) since the last call
+        num_unchanged = 0
+        for message, (content, _) in zip(messages, self._formatted):
+            if message.content is not content and message.content != content:
+                break
+            num_unchanged += 1
+        del self._formatted[num_unchanged:]
+        for message in messages[num_unchanged:]:
+            self._formatted.append((message.content, f"**{message.role.value}**: {message.content}"))
+        return num_unchanged == len(messages)
+
+    def _recent_start(self, messages):
+        # Index of the first message of the last `keep_turns` turns (a turn starts with a student message)
+        turn_starts = [i for i, message in enumerate(messages) if message.role.value == 'user']
+        if len(turn_starts) <= self.keep_turns:
+            return 1 if messages and messages[0].role.value == 'system' else 0
+        return turn_starts[-self.keep_turns]
+
+    def digest(self):
+        if self._digest is None:
+            self._digest = knowledge_digest(self.knowledge, self.digest_chars_per_file)
+        return self._digest
+
+    def excerpts(self, query):
+        """The knowledge base passages most relevant to the query, up to `excerpt_chars`"""
+        if self._bm25 is None:
+            self._bm25 = BM25Index.from_knowledge(self.knowledge)
+        selected = []
+        num_chars = 0
+        for i in self._bm25.search(query, top_k=len(self._bm25.passages)):
+            passage = self._bm25.passages[i][1]
+            if num_chars + len(passage) > self.excerpt_chars:
+                continue
+            selected.append(i)
+            num_chars += len(passage)
+        # Keep the excerpts in the order they appear in the knowledge base
+        return format_passages([self._bm25.passages[i] for i in sorted(selected)])
+
+    def transcript(self, messages):
+        """
+        Returns the conversation (a list of chat messages) formatted for the moderator according to the policy.
+        """
+        unchanged = self._format(messages)
+        if unchanged and self._transcript_key == len(messages):
+            return self._transcript
+
+        if self.policy == 'full':
+            transcript = "\n\n".join(text for _, text in self._formatted)
+        else:
+            start = self._recent_start(messages)
+            recent = "\n\n".join(text for _, text in self._formatted[start:])
+            if self.policy == 'recent':
+                reference = self.digest()
+                heading = "Knowledge Base Digest"
+            else:
+                reference = self.excerpts(" ".join(message.content for message in messages[start:]))
+                heading = "Relevant Knowledge Base Excerpts"
+            transcript = recent
+            num_hidden = start - (1 if messages[0].role.value == 'system' else 0)
+            if num_hidden > 0:
+                transcript = f"(The {num_hidden} earlier messages are not shown.)\n\n{transcript}"
+            if reference:
+                transcript = f"**{heading}**:\n\n{reference}\n\n{transcript}"
+
+        self._transcript_key = len(messages)
+        self._transcript = transcript
+        return transcript
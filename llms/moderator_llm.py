@@ -1,74 +1,116 @@
-import streamlit as st
+import logging
+
 from llama_index.core.llms import ChatMessage
 from llama_index.core.prompts import PromptTemplate
 
+from llms.format_rules import apply_format_rules, get_format_rule_stats
+from llms.moderator_context import ModeratorContext
+from llms.progress import no_progress
+from llms.verdict_cache import get_verdict_cache, verdict_key
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
 def load_text_file(file_path):
     return open(file_path, 'r').read()
 
-class ContentModerator:
+def build_moderation_prompt(guidelines, instructions):
+    """
+    Builds the moderator's system prompt from the tutor's guidelines and instructions.
     """
+    return f'''
+# Your Task
 
-    Attributes:
-        llm (Any LLM with a chat and query function): The LLM model used to moderate and correct AI responses
-    
-    Methods:
+You are a moderator for an AI tutor.
+
+Based on the moderation guidelines below, your task is to determine if the response from the AI assistant is appropriate given the prior conversation.
+
+#### AI Tutor's Instructions
+
+For further reference, here are the instructions that the AI tutor is following:
+
+{instructions}
+
+# Response Format 
+
+Go through each guideline, one-by-one, and QUICKLY determine whether or not the response violates or does no violate that guideline.
 
+Your response should finish with a clear indictor on a separate line including either
+
+"Yes. The response is appropriate."
+
+or 
+
+"No. The response is not appropriate."
+
+# Moderation Guidelines
+
+{guidelines}
+
+### Additional Guidelines to Assess
+
+1. **Math Formatting:**
+  - Responses should **NEVER USE `\(`, `\)` OR `\[`, `\]` FORMATTING FOR MATH IN ANY OF MY COMMUNICATION OR CONTENT.** Responses should **STRICTLY USE `$`,`$` OR `$$`,`$$` FORMATTING.**
+  - Responses should not use Unicode math symbols or code blocks for equations.
+  - Responses should **NOT USE HTML FORMATTING FOR EQUATIONS.**
+        '''
+
+def build_correction_prompt(guidelines):
     """
+    Builds the corrector's system prompt from the tutor's guidelines.
+    """
+    return f'''
+# Your Task
 
-    def __init__(self, llm_model, guidelines, instructions, display_guidelines=False):
-        self.llm = llm_model
-        # Load pre-defined moderation guidelines
-        self.guidelines = guidelines
-        self.instructions = instructions
-        
-        # Optionally print out the guidelines
-        if display_guidelines:
-            print(f"The following guidelines will be used:\n")
-            print(self.guidelines)
+You will be given a chat history between a student and an AI assistant along with the moderator's feedback on why the response was inappropriate.
 
+Your task is to take this feedback and create a new response that is appropriate for the conversation and aligns with the moderator guidelines.
 
-    def moderate_response(self, chat_history, ai_response):
-        """
-        Uses the LLM to moderate the AI tutor's response based on the loaded guidelines and the full chat history.
-    
-        Arguments:
-            chat_history (str): The full chat history (formatted as a string).
-            ai_response (str): The response provided by the AI tutor that needs moderation.
-    
-        Returns:
-            tuple: 
-                - moderator_response (str): Feedback from the moderator explaining the decision.
-                - is_appropriate (bool): Indicates whether the AI response is appropriate or not (True for appropriate, False for inappropriate).
-        """
+The corrected response should CONTINUE THE CONVERSATION BETWEEN THE USER AND ASSISTANT in a way that is aligned with the system instructions and guidelines.
+
+# Response Format 
 
-        system_prompt = f'''
+Respond ONLY WITH THE CORRECTED RESPONSE.
+
+{guidelines}
+        '''
+
+def build_review_prompt(guidelines, instructions):
+    """
+    Builds the system prompt for moderating and (if needed) correcting a response in a single call.
+    """
+    return f'''
 # Your Task
 
 You are a moderator for an AI tutor.
 
-Based on the moderation guidelines below, your task is to determine if the response from the AI assistant is appropriate given the prior conversation.
+Based on the moderation guidelines below, your task is to determine if the response from the AI assistant is appropriate given the prior conversation, and to correct it if it is not.
 
 #### AI Tutor's Instructions
 
 For further reference, here are the instructions that the AI tutor is following:
 
-{self.instructions}
+{instructions}
 
 # Response Format 
 
 Go through each guideline, one-by-one, and QUICKLY determine whether or not the response violates or does no violate that guideline.
 
-Your response should finish with a clear indictor on a separate line including either
+Then give your verdict on a separate line starting with "VERDICT:", including either
 
-"Yes. The response is appropriate."
+"VERDICT: Yes. The response is appropriate."
 
 or 
 
-"No. The response is not appropriate."
+"VERDICT: No. The response is not appropriate."
+
+If the response is appropriate, do not write anything after the verdict.
+
+If the response is not appropriate, write a line containing only "CORRECTED RESPONSE:" after the verdict, followed ONLY BY THE CORRECTED RESPONSE. The corrected response should CONTINUE THE CONVERSATION BETWEEN THE USER AND ASSISTANT in a way that is aligned with the system instructions and guidelines.
 
 # Moderation Guidelines
 
-{self.guidelines}
+{guidelines}
 
 ### Additional Guidelines to Assess
 
@@ -77,6 +119,93 @@ or
   - Responses should not use Unicode math symbols or code blocks for equations.
   - Responses should **NOT USE HTML FORMATTING FOR EQUATIONS.**
         '''
+
+def parse_review(review):
+    """
+    Splits the output of a combined moderation call.
+
+    Returns:
+        tuple: (moderator_feedback, is_appropriate, corrected_response) where corrected_response
+               is None if the response is appropriate or no correction was given.
+    """
+    review = review.strip()
+    feedback, separator, corrected_response = review.partition("CORRECTED RESPONSE:")
+    feedback = feedback.strip()
+    corrected_response = corrected_response.strip() if separator else ''
+
+    # Use the verdict line, or the final line of the feedback (as in the two-call mode)
+    verdict_lines = [line for line in feedback.splitlines() if line.strip().upper().startswith("VERDICT:")]
+    if verdict_lines:
+        verdict = verdict_lines[-1]
+    else:
+        verdict = feedback.splitlines()[-1] if feedback else ''
+    is_appropriate = "yes" in verdict.lower()
+
+    if is_appropriate or not corrected_response:
+        return feedback, is_appropriate, None
+    # Optionally remove quotes if they exist in the output
+    if corrected_response.startswith('"') and corrected_response.endswith('"'):
+        corrected_response = corrected_response[1:-1]
+    return feedback, is_appropriate, corrected_response
+
+class ContentModerator:
+    """
+
+    Attributes:
+        llm (Any LLM with a chat and query function): The LLM model used to moderate and correct AI responses
+    
+    Methods:
+
+    """
+
+    def __init__(self, llm_model, compiled_tutor, display_guidelines=False, mode='two_call', format_rules=True,
+                 context=None, progress=no_progress):
+        self.llm = llm_model
+        # Shows what the moderator is doing (see llms/progress.py)
+        self.progress = progress
+        # Which part of the conversation the moderator sees (the whole transcript by default)
+        self.context = context or ModeratorContext(compiled_tutor.knowledge, policy='full')
+        # Fix math formatting with deterministic rules before the LLM moderator sees the response
+        self.format_rules = format_rules
+        # "two_call": separate moderation and correction calls, "combined": one call for both
+        if mode not in ('two_call', 'combined'):
+            raise ValueError(f"Unknown moderation mode: {mode}")
+        self.mode = mode
+        # Load pre-defined moderation guidelines
+        self.guidelines = compiled_tutor.guidelines
+        self.instructions = compiled_tutor.instructions
+        # Prompts are built once per tutor and shared by all conversations with it
+        self.moderation_prompt = compiled_tutor.moderation_prompt
+        self.correction_prompt = compiled_tutor.correction_prompt
+        self.review_prompt = compiled_tutor.review_prompt
+        
+        # Optionally print out the guidelines
+        if display_guidelines:
+            print(f"The following guidelines will be used:\n")
+            print(self.guidelines)
+
+
+    def conversation(self, messages):
+        """
+        Formats the conversation before the response for the moderator and corrector, following the context policy.
+        """
+        return self.context.transcript(messages)
+
+    def moderate_response(self, chat_history, ai_response):
+        """
+        Uses the LLM to moderate the AI tutor's response based on the loaded guidelines and the full chat history.
+    
+        Arguments:
+            chat_history (str): The full chat history (formatted as a string).
+            ai_response (str): The response provided by the AI tutor that needs moderation.
+    
+        Returns:
+            tuple: 
+                - moderator_response (str): Feedback from the moderator explaining the decision.
+                - is_appropriate (bool): Indicates whether the AI response is appropriate or not (True for appropriate, False for inappropriate).
+        """
+
+        system_prompt = self.moderation_prompt
             
         # Formulate the query for moderation based on the full chat history
         query = f'''
@@ -104,6 +233,81 @@ Based on the moderation guidelines, is the following AI response appropriate giv
 
         return moderator_response, is_appropriate
 
+    def fix_formatting(self, ai_response):
+        """
+        Rewrites math formatting violations (\\( \\), \\[ \\], HTML and Unicode math) without an LLM call,
+        so that the moderator only needs to reject responses for the remaining guidelines.
+        """
+        if not self.format_rules:
+            return ai_response
+        result = apply_format_rules(ai_response)
+        get_format_rule_stats().record(result, calls_per_rejection=1 if self.mode == 'combined' else 2)
+        if result.fixed:
+            logger.debug(f"Formatting fixed without the moderator: {result.fixes}")
+        return result.text
+
+    def review_response(self, chat_history, ai_response):
+        """
+        Moderates the AI tutor's response and, if it is inappropriate, corrects it in the same LLM call.
+
+        Arguments:
+            chat_history (str): The full chat history (formatted as a string).
+            ai_response (str): The response provided by the AI tutor that needs moderation.
+
+        Returns:
+            tuple:
+                - moderator_response (str): Feedback from the moderator explaining the decision.
+                - is_appropriate (bool): Indicates whether the AI response is appropriate or not.
+                - corrected_response (str or None): The corrected response (None if appropriate or if the moderator did not provide one).
+        """
+
+        system_prompt = self.review_prompt
+
+        # Formulate the query for moderation based on the full chat history
+        query = f'''
+Based on the moderation guidelines, is the following AI response appropriate given the prior conversation? If not, correct it.
+
+# Chat History:\n\n
+{chat_history}
+
+# AI Response:\n\n
+"{ai_response}"
+        '''
+
+        message_history = [ChatMessage(role="system", content=system_prompt),
+                           ChatMessage(role="user", content=query)]
+
+        # Query the moderator LLM with the response
+        review = self.llm.chat(message_history).message.content
+
+        return parse_review(review)
+
+    def check_response(self, chat_history, ai_response, use_cache=False):
+        """
+        Moderates the AI tutor's response with the configured mode.
+        Only the combined mode returns a corrected response (otherwise it is None).
+
+        If `use_cache` is set, the verdict is cached and reused when the moderator would be asked exactly
+        the same thing again (same prompt, mode, conversation as formatted by the context policy and response).
+        """
+        cache = get_verdict_cache() if use_cache else None
+        if cache is not None:
+            system_prompt = self.review_prompt if self.mode == 'combined' else self.moderation_prompt
+            key = verdict_key(system_prompt, self.mode, chat_history, ai_response)
+            verdict = cache.get(key)
+            if verdict is not None:
+                return verdict
+
+        if self.mode == 'combined':
+            verdict = self.review_response(chat_history, ai_response)
+        else:
+            moderator_feedback, is_appropriate = self.moderate_response(chat_history, ai_response)
+            verdict = (moderator_feedback, is_appropriate, None)
+
+        if cache is not None:
+            cache.put(key, verdict)
+        return verdict
+
     def correct_response(self, chat_history, ai_response, moderator_feedback):
         """
         Generates a corrected response based on the chat history, AI tutor's inappropriate response(s), 
@@ -125,21 +329,7 @@ Based on the moderation guidelines, is the following AI response appropriate giv
         if isinstance(moderator_feedback, list):
             moderator_feedback = "\n\n".join([f"**Moderator Feedback {i+1}**:\n\n {feedback}" for i, feedback in enumerate(moderator_feedback)])
 
-        system_prompt = f'''
-# Your Task
-
-You will be given a chat history between a student and an AI assistant along with the moderator's feedback on why the response was inappropriate.
-
-Your task is to take this feedback and create a new response that is appropriate for the conversation and aligns with the moderator guidelines.
-
-The corrected response should CONTINUE THE CONVERSATION BETWEEN THE USER AND ASSISTANT in a way that is aligned with the system instructions and guidelines.
-
-# Response Format 
-
-Respond ONLY WITH THE CORRECTED RESPONSE.
-
-{self.guidelines}
-        '''
+        system_prompt = self.correction_prompt
 
         # Combine the chat history, AI response, and moderator feedback into a correction prompt
         correction_prompt = f"""
@@ -192,16 +382,12 @@ Your Task: Provide a corrected response based on the full conversation that is a
         if not chat_history:
             raise ValueError("Chat history cannot be empty.")
         
-        # Combine all prior messages (before the last AI response) into the conversation context
-        previous_conversation = "\n\n".join([f"**{message.role.value}**: {message.content}" for message in chat_history[:-1]])
+        # Combine the prior messages (before the last AI response) into the conversation context
+        previous_conversation = self.conversation(chat_history[:-1])
         
         # If the response is inappropriate, pass it to the corrector LLM
-        if 'chat_spinner' in st.session_state:
-            with st.session_state.chat_spinner, st.spinner('Correcting my response...'):
-                final_response = self.correct_response(previous_conversation, previous_responses, previous_feedback)
-        else:
-            with st.spinner('Correcting my response...'):
-                final_response = self.correct_response(previous_conversation, previous_responses, previous_feedback)
+        with self.progress('Correcting my response...'), span('moderator.final_correction'):
+            final_response = self.correct_response(previous_conversation, previous_responses, previous_feedback)
         
         return final_response
     
@@ -232,28 +418,24 @@ Your Task: Provide a corrected response based on the full conversation that is a
         if latest_message.role.value != 'assistant':
             raise ValueError("The latest message in the chat history must be from the AI.")
         
-        # Extract the AI response
-        ai_response = latest_message.content
+        # Extract the AI response (with any formatting violations already fixed)
+        ai_response = self.fix_formatting(latest_message.content)
         
-        # Combine all prior messages (before the last AI response) into the conversation context
-        previous_conversation = "\n\n".join([f"**{message.role.value}**: {message.content}" for message in chat_history[:-1]])
+        # Combine the prior messages (before the last AI response) into the conversation context
+        previous_conversation = self.conversation(chat_history[:-1])
     
-        # Moderate the AI response using the full previous conversation context
-        if 'chat_spinner' in st.session_state:
-            with st.session_state.chat_spinner, st.spinner('Considering my response...'):
-                moderator_feedback, is_appropriate = self.moderate_response(previous_conversation, ai_response)
-        else:
-            with st.spinner('Considering my response...'):
-                moderator_feedback, is_appropriate = self.moderate_response(previous_conversation, ai_response)
+        # Moderate the AI response using the previous conversation context
+        with self.progress('Considering my response...'), span('moderator.check', mode=self.mode) as check_span:
+            moderator_feedback, is_appropriate, corrected_response = self.check_response(previous_conversation, ai_response, chat_history[:-1])
+            check_span.set(appropriate=is_appropriate)
         
+        if not is_appropriate and corrected_response is not None:
+            # The moderator already corrected the response
+            final_response = corrected_response
         # If the response is inappropriate, pass it to the corrector LLM
-        if not is_appropriate:
-            if 'chat_spinner' in st.session_state:
-                with st.session_state.chat_spinner, st.spinner('Correcting my response...'):
-                    corrected_response = self.correct_response(previous_conversation, ai_response, moderator_feedback)
-            else:
-                with st.spinner('Correcting my response...'):
-                    corrected_response = self.correct_response(previous_conversation, ai_response, moderator_feedback)
+        elif not is_appropriate:
+            with self.progress('Correcting my response...'), span('moderator.correct'):
+                corrected_response = self.correct_response(previous_conversation, ai_response, moderator_feedback)
             final_response = corrected_response
         else:
             final_response = ai_response
@@ -0,0 +1,324 @@
+import time
+import asyncio
+import datetime
+import logging
+import threading
+from dataclasses import dataclass
+
+from llama_index.core.llms import ChatMessage, ChatResponse
+
+from utils.config import open_config
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class CachedPrefix:
+    """
+    A prompt prefix registered with the provider.
+
+    Attributes:
+        name (str): The provider's handle for the cached prefix.
+        expires (float): Time (from the cache's clock) at which the provider drops the prefix.
+        tokens (int): Size of the prefix.
+    """
+    name: str
+    expires: float
+    tokens: int
+
+class MockPrefixProvider:
+    """
+    Offline stand-in for a provider with context caching.
+
+    Keeps the prefixes in memory and answers by sending the prefix and the messages to the wrapped LLM,
+    so responses are the same as without caching. Every lifecycle event is recorded for tests.
+    """
+
+    def __init__(self, llm):
+        self.llm = llm
+        self.lock = threading.Lock()
+        self._prefixes = {}
+        self.created = []
+        self.refreshed = []
+        self.deleted = []
+        self.calls = []
+
+    def create(self, prefix, ttl_seconds):
+        with self.lock:
+            name = f'cachedContents/mock-{len(self.created)}'
+            self._prefixes[name] = prefix
+            self.created.append(name)
+        return name
+
+    def refresh(self, name, ttl_seconds):
+        with self.lock:
+            if name not in self._prefixes:
+                raise KeyError(f"Unknown cached prefix: {name}")
+            self.refreshed.append(name)
+
+    def delete(self, name):
+        with self.lock:
+            self._prefixes.pop(name, None)
+            self.deleted.append(name)
+
+    def _messages(self, name, messages):
+        with self.lock:
+            self.calls.append(name)
+            prefix = self._prefixes[name]
+        return [ChatMessage(role="system", content=prefix)] + list(messages)
+
+    def chat(self, name, messages):
+        return self.llm.chat(self._messages(name, messages))
+
+    def stream_chat(self, name, messages):
+        return self.llm.stream_chat(self._messages(name, messages))
+
+    async def achat(self, name, messages):
+        return await self.llm.achat(self._messages(name, messages))
+
+    async def astream_chat(self, name, messages):
+        return await self.llm.astream_chat(self._messages(name, messages))
+
+def chunk_text(chunk):
+    # Some chunks (e.g. the last one, with only the finish reason) carry no text
+    if not chunk.candidates or not chunk.candidates[0].content.parts:
+        return ''
+    return chunk.candidates[0].content.parts[0].text
+
+class GeminiPrefixProvider:
+    """
+    Gemini context caching (google.generativeai.caching).
+
+    The prefix is cached as the first user turn, which is where the Gemini LLM puts the system prompt
+    of an uncached chat, so cached and uncached calls see the same conversation.
+    """
+
+    def __init__(self, llm):
+        import google.generativeai as genai
+        self.genai = genai
+        self.llm = llm
+        self.lock = threading.Lock()
+        self._cached = {}
+
+    def create(self, prefix, ttl_seconds):
+        from google.generativeai import caching
+        cached = caching.CachedContent.create(model=self.llm.model,
+                                              contents=[{"role": "user", "parts": [prefix]}],
+                                              ttl=datetime.timedelta(seconds=ttl_seconds))
+        with self.lock:
+            self._cached[cached.name] = cached
+        return cached.name
+
+    def refresh(self, name, ttl_seconds):
+        with self.lock:
+            cached = self._cached[name]
+        cached.update(ttl=datetime.timedelta(seconds=ttl_seconds))
+
+    def delete(self, name):
+        with self.lock:
+            cached = self._cached.pop(name, None)
+        if cached is not None:
+            cached.delete()
+
+    def _chat_session(self, name, messages):
+        from llama_index.core.utilities.gemini_utils import merge_neighboring_same_role_messages
+        from llama_index.llms.gemini.utils import chat_message_to_gemini
+        with self.lock:
+            cached = self._cached[name]
+        model = self.genai.GenerativeModel.from_cached_content(cached_content=cached,
+                                                               generation_config={"temperature": self.llm.temperature})
+        *history, next_message = map(chat_message_to_gemini, merge_neighboring_same_role_messages(messages))
+        return model.start_chat(history=history), next_message
+
+    def chat(self, name, messages):
+        from llama_index.llms.gemini.utils import chat_from_gemini_response
+        chat, next_message = self._chat_session(name, messages)
+        return chat_from_gemini_response(chat.send_message(next_message))
+
+    def stream_chat(self, name, messages):
+        chat, next_message = self._chat_session(name, messages)
+        response = chat.send_message(next_message, stream=True)
+        content = ''
+        for chunk in response:
+            delta = chunk_text(chunk)
+            content += delta
+            yield ChatResponse(message=ChatMessage(role="assistant", content=content), delta=delta)
+
+    async def achat(self, name, messages):
+        from llama_index.llms.gemini.utils import chat_from_gemini_response
+        chat, next_message = self._chat_session(name, messages)
+        return chat_from_gemini_response(await chat.send_message_async(next_message))
+
+    async def astream_chat(self, name, messages):
+        chat, next_message = self._chat_session(name, messages)
+        response = await chat.send_message_async(next_message, stream=True)
+
+        async def gen():
+            content = ''
+            async for chunk in response:
+                delta = chunk_text(chunk)
+                content += delta
+                yield ChatResponse(message=ChatMessage(role="assistant", content=content), delta=delta)
+
+        return gen()
+
+class PrefixCache:
+    """
+    Process-level registry of cached system prompts: one provider handle per compiled tutor.
+
+    A prefix is registered the first time a conversation with the tutor needs it and shared by all
+    later conversations. Handles that are about to expire are refreshed (their TTL is extended) and
+    expired ones are registered again. Only prompts of at least `min_tokens` are cached.
+    """
+
+    def __init__(self, provider, ttl_seconds, refresh_seconds, min_tokens=0, clock=time.time):
+        self.provider = provider
+        self.ttl_seconds = ttl_seconds
+        self.refresh_seconds = refresh_seconds
+        self.min_tokens = min_tokens
+        self.clock = clock
+        self.lock = threading.Lock()
+        self._prefixes = {}
+        # One lock per tutor so that a prefix is only registered once at a time
+        self._registering = {}
+        self.created = 0
+        self.refreshed = 0
+        self.reused = 0
+        self.invalidated = 0
+        self.cached_tokens = 0
+
+    def handle(self, compiled_tutor):
+        """Returns the provider's handle for the tutor's system prompt (None if it is too small to cache)"""
+        if compiled_tutor.system_prompt_tokens < self.min_tokens:
+            return None
+        key = compiled_tutor.key
+        with self.lock:
+            registering = self._registering.setdefault(key, threading.Lock())
+
+        with registering:
+            with self.lock:
+                prefix = self._prefixes.get(key)
+            now = self.clock()
+            if prefix is None or prefix.expires <= now:
+                name = self.provider.create(compiled_tutor.system_prompt, self.ttl_seconds)
+                prefix = CachedPrefix(name=name, expires=now + self.ttl_seconds,
+                                      tokens=compiled_tutor.system_prompt_tokens)
+                with self.lock:
+                    self._prefixes[key] = prefix
+                    self.created += 1
+                return prefix.name
+            if prefix.expires - now < self.refresh_seconds:
+                self.provider.refresh(prefix.name, self.ttl_seconds)
+                with self.lock:
+                    prefix.expires = now + self.ttl_seconds
+                    self.refreshed += 1
+            # The prefix is referenced instead of being sent again
+            with self.lock:
+                self.reused += 1
+                self.cached_tokens += prefix.tokens
+            return prefix.name
+
+    def invalidate(self, key):
+        """Deletes the cached prefix of a compiled tutor (e.g. after the tutor was edited)"""
+        with self.lock:
+            prefix = self._prefixes.pop(key, None)
+            self._registering.pop(key, None)
+        if prefix is not None:
+            self.provider.delete(prefix.name)
+            with self.lock:
+                self.invalidated += 1
+
+    def invalidate_tutor(self, instructions, guidelines, introduction, knowledge):
+        from llms.compiled_tutor import tutor_key
+        # The tutor is compiled with its knowledge base in prompt mode and without it in retrieval mode
+        self.invalidate(tutor_key(instructions or '', guidelines or '', introduction or '', knowledge or ''))
+        self.invalidate(tutor_key(instructions or '', guidelines or '', introduction or '', ''))
+
+    def stats(self):
+        with self.lock:
+            return {"prefixes": len(self._prefixes), "created": self.created, "refreshed": self.refreshed,
+                    "reused": self.reused, "invalidated": self.invalidated, "cached_tokens": self.cached_tokens}
+
+class PrefixCachedLLM:
+    """
+    Wraps an LLM so that chats starting with the tutor's system prompt reference the cached prefix
+    instead of resending it. Any other call (or a prompt too small to cache) goes to the LLM unchanged.
+    """
+
+    def __init__(self, llm, prefix_cache, compiled_tutor):
+        self.llm = llm
+        self.prefix_cache = prefix_cache
+        self.compiled_tutor = compiled_tutor
+
+    def _starts_with_prefix(self, messages):
+        return messages and messages[0].role.value == 'system' and messages[0].content == self.compiled_tutor.system_prompt
+
+    def _split(self, messages):
+        if self._starts_with_prefix(messages):
+            try:
+                name = self.prefix_cache.handle(self.compiled_tutor)
+            except Exception as e:
+                # The provider could not register or refresh the prefix, so send it in full this time
+                logger.warning(f"Prefix cache unavailable, sending the full prompt: {e}")
+                name = None
+            if name is not None:
+                return name, messages[1:]
+        return None, messages
+
+    async def _asplit(self, messages):
+        if not self._starts_with_prefix(messages):
+            return None, messages
+        # Registering or refreshing the prefix is a blocking provider call, so it runs off the event loop
+        return await asyncio.to_thread(self._split, messages)
+
+    def chat(self, messages, **kwargs):
+        name, rest = self._split(messages)
+        if name is None:
+            return self.llm.chat(messages, **kwargs)
+        return self.prefix_cache.provider.chat(name, rest)
+
+    def stream_chat(self, messages, **kwargs):
+        name, rest = self._split(messages)
+        if name is None:
+            return self.llm.stream_chat(messages, **kwargs)
+        return self.prefix_cache.provider.stream_chat(name, rest)
+
+    async def achat(self, messages, **kwargs):
+        name, rest = await self._asplit(messages)
+        if name is None:
+            return await self.llm.achat(messages, **kwargs)
+        return await self.prefix_cache.provider.achat(name, rest)
+
+    async def astream_chat(self, messages, **kwargs):
+        name, rest = await self._asplit(messages)
+        if name is None:
+            return await self.llm.astream_chat(messages, **kwargs)
+        return await self.prefix_cache.provider.astream_chat(name, rest)
+
+    def __getattr__(self, name):
+        # Everything else (e.g. predict) is the wrapped LLM's
+        return getattr(self.llm, name)
+
+def create_prefix_provider(name, llm):
+    if name == 'gemini':
+        return GeminiPrefixProvider(llm)
+    elif name == 'mock':
+        return MockPrefixProvider(llm)
+    raise ValueError(f"Unknown prefix cache provider: {name}")
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_prefix_cache(llm) -> PrefixCache:
+    """Process-level prefix cache configured in config/llm.yaml (None if disabled)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            llm_config = open_config()['llm']
+            provider = llm_config.get('prefix_cache') or 'none'
+            if provider == 'none':
+                return None
+            _cache = PrefixCache(create_prefix_provider(provider, llm),
+                                 ttl_seconds=llm_config.get('prefix_cache_ttl_minutes', 60) * 60,
+                                 refresh_seconds=llm_config.get('prefix_cache_refresh_minutes', 10) * 60,
+                                 min_tokens=llm_config.get('prefix_cache_min_tokens', 0))
+        return _cache
@@ -0,0 +1,10 @@
+import contextlib
+
+def no_progress(message):
+    """
+    Default progress callback for TutorChain and ContentModerator.
+
+    Each slow step runs inside `with progress(message):` (e.g. 'Considering my response...'),
+    so a UI can show the message while the step runs. Without a UI nothing is shown.
+    """
+    return contextlib.nullcontext()
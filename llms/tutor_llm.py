@@ -1,44 +1,232 @@
-import streamlit as st
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from llama_index.core.llms import ChatMessage
 
 from llms.chatbot_llm import AITutor
 from llms.moderator_llm import ContentModerator
+from llms.moderator_context import ModeratorContext
 from llms.models import get_llm
+from llms.compiled_tutor import compile_tutor
+from llms.context_manager import ConversationContext
+from llms.knowledge_index import get_knowledge_retriever
+from llms.prefix_cache import get_prefix_cache
+from llms.progress import no_progress
+from utils.config import open_config
+from utils.tracing import propagate, span
+
+logger = logging.getLogger(__name__)
 
 class TutorChain:
+    """
+    The moderated tutoring pipeline for one conversation, independent of any UI.
+
+    `progress` is called with a message for each slow step and must return a context manager
+    that is held while the step runs (see llms/progress.py).
+    """
+
     def __init__(self, 
                  instructions, 
                  guidelines,
                  introduction, 
-                 knowledge):
+                 knowledge,
+                 progress=no_progress):
+        self.progress = progress
 
         # Initialize the OpenAI LLM
         llm_model = get_llm()
+        llm_config = open_config()['llm']
+
+        # In retrieval mode only the parts of the knowledge base relevant to each turn are sent,
+        # instead of the whole knowledge base in the system prompt (see config/llm.yaml)
+        retriever = None
+        prompt_knowledge = knowledge
+        if llm_config.get('knowledge_mode', 'prompt') == 'retrieval' and knowledge:
+            retriever = get_knowledge_retriever(knowledge)
+            prompt_knowledge = ''
+
+        # Shared, pre-built prompts for this tutor (only the conversation state belongs to this chain)
+        self.compiled_tutor = compile_tutor(instructions, guidelines, introduction, prompt_knowledge)
         
+        # Long conversations are summarized to stay within the token budget
+        context = None
+        if llm_config.get('context_max_tokens', 0) > 0:
+            context = ConversationContext(llm_model, llm_config['context_max_tokens'],
+                                          keep_turns=llm_config.get('context_keep_turns', 6),
+                                          summary_max_words=llm_config.get('context_summary_max_words', 250))
+
         # Initialize the tutor with the LLM and instructions
-        self.tutor_llm = AITutor(llm_model, instructions, introduction, guidelines, knowledge, display_system=False)
+        # Large system prompts are cached by the provider and shared by all conversations with this tutor
+        self.tutor_llm = AITutor(llm_model, self.compiled_tutor, display_system=False, context=context,
+                                retriever=retriever, prefix_cache=get_prefix_cache(llm_model))
         self.init_request = self.tutor_llm.message_history[-1].content
 
+        # How responses are moderated
+        self.moderation_strategy = llm_config.get('moderation_strategy', 'sequential')
+        self.num_drafts = llm_config.get('num_drafts', 3)
+        # Drafts of the last parallel turn, which may still be finishing after it returned (e.g. for benchmarks to wait on)
+        self.draft_futures = []
+
         # Create an instance of the ContentModerator class
-        self.moderator_llm = ContentModerator(llm_model, guidelines, instructions)
+        self.moderator_llm = ContentModerator(llm_model, self.compiled_tutor, progress=progress,
+                                              mode=llm_config.get('moderation_mode', 'two_call'),
+                                              format_rules=llm_config.get('format_rules', True),
+                                              context=ModeratorContext(
+                                                  knowledge,
+                                                  policy=llm_config.get('moderator_context', 'recent'),
+                                                  keep_turns=llm_config.get('moderator_context_turns', 4),
+                                                  digest_chars_per_file=llm_config.get('moderator_digest_chars_per_file', 500),
+                                                  excerpt_chars=llm_config.get('moderator_excerpt_chars', 4000)))
 
     def get_response(self, student_prompt, moderate=True, max_moderations=3):
-        if 'chat_spinner' in st.session_state:
-            # Prompt AI tutor
-            with st.session_state.chat_spinner, st.spinner('Coming up with a response...'):
-                ai_response = self.tutor_llm.get_response(student_prompt)
-        else:
+        with span('tutor.get_response', moderate=moderate, strategy=self.moderation_strategy):
+            if moderate and self.moderation_strategy == 'parallel':
+                return self.get_parallel_response(student_prompt)
+
             # Prompt AI tutor
-            with st.spinner('Coming up with a response...'):
+            with self.progress('Coming up with a response...'), span('tutor.draft'):
                 ai_response = self.tutor_llm.get_response(student_prompt)
 
-        if moderate:
+            if moderate:
+                ai_response = self.moderate_response(max_moderations)
+
+            return ai_response
+
+    def draft_and_moderate(self, message_history, previous_conversation, cancelled=None):
+        """
+        Drafts a response to the conversation and moderates it.
+        Runs in a worker thread, so it does not touch the Streamlit UI or the shared message history.
+        Returns None if `cancelled` (a threading.Event) is set while drafting: the draft is streamed so that
+        it stops as soon as another draft has passed, and it is not moderated.
+        """
+        cancelled = cancelled or threading.Event()
+        with span('tutor.draft_and_moderate') as draft_span:
+            with span('tutor.draft'):
+                draft = ''
+                for chunk in self.tutor_llm.llm.stream_chat(message_history):
+                    if cancelled.is_set():
+                        break
+                    draft = chunk.message.content
+            if cancelled.is_set():
+                # Another draft already passed, so this one is not worth finishing or moderating
+                draft_span.set(cancelled=True)
+                return None
+            draft = self.moderator_llm.fix_formatting(draft)
+            with span('moderator.check', mode=self.moderator_llm.mode):
+                moderator_feedback, is_appropriate, corrected_response = self.moderator_llm.check_response(previous_conversation, draft, use_cache=True)
+            # A moderation that was already running when another draft passed is wasted
+            draft_span.set(appropriate=is_appropriate, wasted=cancelled.is_set())
+            if cancelled.is_set():
+                logger.info("Moderation call of a losing draft finished after another draft passed")
+        return draft, moderator_feedback, is_appropriate, corrected_response
+
+    def parallel_response(self, student_prompt):
+        # Add the student's message to the history
+        student_message = ChatMessage(role="user", content=student_prompt)
+        self.tutor_llm.message_history.append(student_message)
+        try:
+            ai_response = self.first_passing_response()
+        except Exception:
+            # Drop the unanswered message so that the conversation can continue
+            if self.tutor_llm.message_history and self.tutor_llm.message_history[-1] is student_message:
+                self.tutor_llm.message_history.pop()
+            raise
+
+        # Add the AI's response to the history
+        self.tutor_llm.message_history.append(ChatMessage(role="assistant", content=ai_response))
+        return ai_response
+
+    def first_passing_response(self):
+        message_history = list(self.tutor_llm.llm_messages())
+        previous_conversation = self.moderator_llm.conversation(self.tutor_llm.message_history)
+
+        # Draft and moderate several responses at once and use the first one that passes
+        cancelled = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=self.num_drafts)
+        futures = [executor.submit(propagate(self.draft_and_moderate), message_history, previous_conversation, cancelled)
+                   for _ in range(self.num_drafts)]
+        self.draft_futures = futures
+        responses = []
+        feedback = []
+        corrections = []
+        errors = []
+        ai_response = None
+        try:
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # A failed draft does not fail the turn while the others may still pass
+                    logger.warning(f"Draft failed: {e}")
+                    errors.append(e)
+                    continue
+                if result is None:
+                    continue
+                draft, moderator_feedback, is_appropriate, corrected_response = result
+                if is_appropriate:
+                    ai_response = draft
+                    break
+                responses.append(draft)
+                feedback.append(moderator_feedback)
+                if corrected_response is not None:
+                    corrections.append(corrected_response)
+                logger.info(moderator_feedback)
+        finally:
+            # Drafts that are still being written stop (without a moderation call), and queued ones never start
+            cancelled.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        if ai_response is not None:
+            return ai_response
+        if not responses:
+            # Every draft failed
+            raise errors[-1]
+        if corrections:
+            # None of the drafts passed, but the moderator already corrected one of them.
+            # Like any correction in the sequential strategy, it is moderated before it is used
+            with span('moderator.check', mode=self.moderator_llm.mode, correction=True):
+                moderator_feedback, is_appropriate, _ = self.moderator_llm.check_response(previous_conversation, corrections[0], use_cache=True)
+            if is_appropriate:
+                return corrections[0]
+            responses.append(corrections[0])
+            feedback.append(moderator_feedback)
+        # None of the drafts passed, so correct them all at once
+        with span('moderator.correct', drafts=len(responses)):
+            return self.moderator_llm.correct_response(previous_conversation, responses, feedback)
+
+    def get_parallel_response(self, student_prompt):
+        """
+        Generates `num_drafts` responses in parallel, moderates each as soon as it is drafted and
+        returns the first one that passes moderation. Only if none pass is a corrected response generated.
+        At most three LLM round trips are made in sequence (draft, moderation, correction), or four in the combined
+        mode when the moderator's own correction has to be checked.
+        """
+        with self.progress('Coming up with a response...'):
+            return self.parallel_response(student_prompt)
+
+    def stream_response(self, student_prompt):
+        """
+        Yields the tutor's (unmoderated) response in chunks as the LLM produces them.
+        Call `moderate_response` once the stream is exhausted to get the final response.
+        """
+        yield from self.tutor_llm.stream_response(student_prompt)
+
+    def moderate_response(self, max_moderations=3):
+        """
+        Moderates the last response in the conversation, correcting it if needed.
+        Returns the final response, which also replaces the last message in the history.
+        """
+        with span('tutor.moderate', max_moderations=max_moderations) as moderate_span:
+            ai_response = self.tutor_llm.message_history[-1].content
             num_moderations = 0
             needs_checking = True
             responses = []
             feedback = []
             while needs_checking and num_moderations<max_moderations:
                 # Moderate response
-                results = self.moderator_llm.forward(self.tutor_llm.message_history)
+                with span('tutor.moderation_round', round=num_moderations + 1) as round_span:
+                    results = self.moderator_llm.forward(self.tutor_llm.message_history)
+                    round_span.set(corrected=results['moderated'])
                 ai_response = results['final_response']
                 # Update chat history
                 self.tutor_llm.message_history[-1].content = ai_response
@@ -57,6 +245,7 @@ class TutorChain:
                 ai_response = self.moderator_llm.final_correction(self.tutor_llm.message_history, responses, feedback)
                 # Update chat history
                 self.tutor_llm.message_history[-1].content = ai_response
+            moderate_span.set(moderations=num_moderations, final_correction=needs_checking)
 
         return ai_response 
 
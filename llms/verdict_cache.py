@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from utils.config import open_config
+
+def verdict_key(system_prompt, mode, chat_history, ai_response):
+    """
+    Content hash of exactly what the moderator is asked: its system prompt (which holds the tutor's guidelines
+    and instructions), the moderation mode, the conversation as shown to it and the response.
+    Each field is length-prefixed so that different splits of the same text produce different keys.
+    """
+    sha = hashlib.sha256()
+    for field in (system_prompt, mode, chat_history, ai_response):
+        data = (field or '').encode('utf-8')
+        sha.update(len(data).to_bytes(8, 'big'))
+        sha.update(data)
+    return sha.hexdigest()
+
+class VerdictCache:
+    """
+    Bounded cache of moderation verdicts with a time to live.
+
+    Verdicts are kept in an in-process LRU (at most `max_entries`) and, if `disk_dir` is set,
+    also written to disk so that they are shared between processes and survive restarts.
+    A verdict is (moderator_feedback, is_appropriate, corrected_response).
+    """
+
+    def __init__(self, max_entries, ttl_seconds, disk_dir=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self.lock = threading.Lock()
+        self._verdicts = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f'{key}.json')
+
+    def _read_disk(self, key, now):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry['expires'] <= now:
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+            return None
+        return entry['expires'], tuple(entry['verdict'])
+
+    def _write_disk(self, key, expires, verdict):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            # Write to a temporary file first so that other processes never read a partial file
+            with open(tmp_path, 'w') as f:
+                json.dump({'expires': expires, 'verdict': list(verdict)}, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            # The disk tier is only an optimisation
+            pass
+
+    def get(self, key):
+        """Return the cached verdict, or None if there is none (or it has expired)"""
+        now = time.time()
+        with self.lock:
+            entry = self._verdicts.get(key)
+            if entry is not None:
+                expires, verdict = entry
+                if expires > now:
+                    self._verdicts.move_to_end(key)
+                    self.hits += 1
+                    return verdict
+                del self._verdicts[key]
+                self.expirations += 1
+
+        entry = self._read_disk(key, now)
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._insert(key, entry)
+            return entry[1]
+
+    def put(self, key, verdict):
+        expires = time.time() + self.ttl_seconds
+        with self.lock:
+            self._insert(key, (expires, tuple(verdict)))
+        self._write_disk(key, expires, verdict)
+
+    def _insert(self, key, entry):
+        # Must be called with the lock held
+        self._verdicts[key] = entry
+        self._verdicts.move_to_end(key)
+        while len(self._verdicts) > self.max_entries:
+            self._verdicts.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {"verdicts": len(self._verdicts), "hits": self.hits, "disk_hits": self.disk_hits,
+                    "misses": self.misses, "evictions": self.evictions, "expirations": self.expirations,
+                    "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_verdict_cache() -> VerdictCache:
+    """Process-level verdict cache configured in config/llm.yaml (None if disabled)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            llm_config = open_config()['llm']
+            if llm_config.get('verdict_cache_entries', 0) <= 0:
+                return None
+            _cache = VerdictCache(max_entries=llm_config['verdict_cache_entries'],
+                                  ttl_seconds=llm_config['verdict_cache_ttl_minutes'] * 60,
+                                  disk_dir=llm_config.get('verdict_cache_dir') or None)
+        return _cache
@@ -15,7 +15,7 @@ if 'code' in params:
     st.session_state.role = 'student'
     st.session_state['authentication_status'] = False
     access_code = params["code"]
-    use_code(st.session_state.df_access_codes, st.session_state.df_tutors, access_code)
+    use_code(st.session_state.df_tutors, access_code)
 
 st.markdown("<h1 style='text-align: center; color: grey;'>AI Tutors</h1>", unsafe_allow_html=True)
 
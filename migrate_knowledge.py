@@ -0,0 +1,5 @@
+from utils.tutor_data import migrate_knowledge
+
+if __name__ == "__main__":
+    num_migrated = migrate_knowledge('ai-tutors/tutor_info.csv')
+    print(f"Moved {num_migrated} knowledge bases out of the tutor catalog")
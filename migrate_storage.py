@@ -0,0 +1,21 @@
+import argparse
+
+from utils.config import open_config
+from utils.storage import S3Storage, create_storage, migrate
+
+TABLE_FNS = ['ai-tutors/tutor_info.csv', 'ai-tutors/access_codes.csv']
+USERS_FN = 'ai-tutors/users.yaml'
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import the tutors, access codes and users from S3 into SQLite")
+    parser.add_argument("--sqlite-path", default=None, help="Database to create (default: sqlite_path in config/storage.yaml)")
+    args = parser.parse_args()
+
+    storage_config = dict(open_config()['storage'], backend='sqlite')
+    if args.sqlite_path is not None:
+        storage_config['sqlite_path'] = args.sqlite_path
+
+    counts = migrate(S3Storage(), create_storage(storage_config), TABLE_FNS, USERS_FN)
+    for fn, count in counts.items():
+        print(f"{fn}: {count} rows")
+    print("Set 'backend: sqlite' in config/storage.yaml to use the new database")
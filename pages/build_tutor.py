@@ -1,6 +1,7 @@
 import streamlit as st
 import streamlit.components.v1 as components
-from utils.tutor_data import select_instructions, create_tutor, ask_for_overwrite
+from utils.tutor_data import select_instructions, create_tutor
+from utils.tutor_dialogs import ask_for_overwrite
 from utils.menu import menu
 from utils.session import reset_chatbot, reset_build
 from utils.session import check_state
@@ -1,6 +1,6 @@
 import streamlit as st
 from utils.menu import menu
-from utils.user_data import save_yaml
+from utils.user_data import save_user
 from utils.session import check_state
 
 st.set_page_config(page_title="AI Tutors", page_icon="https://raw.githubusercontent.com/teaghan/ai-tutors/main/images/AIT_favicon4.png",  layout="wide")
@@ -17,8 +17,8 @@ if st.session_state['authentication_status']:
     try:
         if st.session_state.authenticator.reset_password(st.session_state['username']):
             st.success('Password modified successfully')
-            save_yaml(st.session_state.users_data_fn, 
-                  st.session_state.users_config)
+            save_user(st.session_state.users_data_fn, 
+                  st.session_state.users_config, st.session_state['username'])
             # Go to teacher dashboard
             st.switch_page("pages/dashboard.py")
     except Exception as e:
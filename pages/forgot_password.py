@@ -1,7 +1,7 @@
 import streamlit as st
 from utils.session import check_state
 from utils.password import send_email_forgot_password
-from utils.user_data import save_yaml
+from utils.user_data import save_user
 
 st.set_page_config(page_title="AI Tutors", page_icon="https://raw.githubusercontent.com/teaghan/ai-tutors/main/images/AIT_favicon4.png",  layout="wide")
 st.markdown("<h1 style='text-align: center; color: grey;'>AI Tutors</h1>", unsafe_allow_html=True)
@@ -20,8 +20,8 @@ try:
         send_email_forgot_password(email_of_forgotten_password, new_random_password)
         st.success('New password sent to your email!')
         st.session_state['password_sent'] = True
-        save_yaml(st.session_state.users_data_fn, 
-                  st.session_state.users_config)
+        save_user(st.session_state.users_data_fn, 
+                  st.session_state.users_config, username_of_forgotten_password)
         st.switch_page("pages/login.py")
     elif username_of_forgotten_password == False:
         st.error('Username not found')
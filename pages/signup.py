@@ -1,6 +1,6 @@
 import streamlit as st
 from streamlit_authenticator.utilities import RegisterError
-from utils.user_data import save_yaml
+from utils.user_data import save_user
 from utils.session import check_state
 
 st.set_page_config(page_title="AI Tutors", page_icon="https://raw.githubusercontent.com/teaghan/ai-tutors/main/images/AIT_favicon4.png",  layout="wide")
@@ -23,8 +23,8 @@ try:
                                                                     'Captcha':'Captcha', 'Register':'Register'})
     if user_email:
         st.success('User registered successfully')
-        save_yaml(st.session_state.users_data_fn, 
-                  st.session_state.users_config)
+        save_user(st.session_state.users_data_fn, 
+                  st.session_state.users_config, username)
         # Username and email are the same
         st.session_state.username = user_email
         st.session_state.user_email = user_email
@@ -1,17 +1,20 @@
 import streamlit as st
 from st_equation_editor import mathfield
-import time
 from audiorecorder import audiorecorder
 
 from llms.tutor_llm import TutorChain
+from llms.context_manager import ATTACHMENT_MARKER
 from utils.menu import menu
 from utils.session import check_state, reset_chatbot
 from utils.save_to_html import download_chat_button, escape_markdown, send_chat_button
 from utils.file_handler import extract_text_from_different_file_types
 from utils.speech_to_txt import stt
 from utils.styling import button_style, columns_style, scroll_to
+from utils.streaming import render_stream, replay_text, spinner_progress
+from utils.config import open_config
+from utils.tracing import turn
 
-pause_time_between_chars = 0.01
+chat_config = open_config()['chat']
 
 if "tool name" in st.session_state:
     page_name = st.session_state["tool name"]
@@ -82,18 +85,17 @@ if not st.session_state.model_loaded:
     st.session_state['tutor_llm'] = TutorChain(st.session_state["instructions"],
                                                 st.session_state["guidelines"],
                                                 st.session_state["introduction"],
-                                                st.session_state["knowledge"])
+                                                st.session_state["knowledge"],
+                                                progress=spinner_progress)
 
     init_request = st.session_state.tutor_llm.init_request        
     st.session_state.messages.append({"role": "assistant", "content": init_request})
     st.session_state.model_loaded = True
 
-# Function to stream text letter by letter
-def stream_text(text):
-    sentence = ""
-    for letter in text:
-        sentence += letter
-        yield sentence
+# Function to type out a complete text word by word
+def stream_text(placeholder, text):
+    render_stream(placeholder, replay_text(text, chat_config['replay_chars_per_second']),
+                  chat_config['stream_frame_rate'])
 
 # Display conversation
 if len(st.session_state.messages)>0:
@@ -101,10 +103,7 @@ if len(st.session_state.messages)>0:
         msg = st.session_state.messages[0]
         with st.chat_message(msg["role"], avatar=avatar[msg["role"]]):
             intro_msg = rf"{msg["content"]}"
-            with st.empty():
-                for char in stream_text(intro_msg):
-                    st.markdown(char)
-                    time.sleep(pause_time_between_chars)
+            stream_text(st.empty(), intro_msg)
         st.session_state.stream_init_msg = False
     else:
         for msg in st.session_state.messages:
@@ -224,49 +223,63 @@ if audio_prompt:
     audio_prompt = ''
 
 if prompt:
-    # Process dropped files
-    processed_file_text = ''
-    if dropped_files:
-        for file in dropped_files:
-            try:
-                with st.session_state.chat_spinner, st.spinner(f"Processing: {file.name}"):
-                    extracted_text = extract_text_from_different_file_types(file)
-                    processed_file_text += f"\n\n**{file.name}**\n\n{extracted_text}"
-            except Exception as e:
-                st.error(f"Error processing {file.name}: {str(e)}")
-                st.exception(e)
-        del st.session_state[f'file_upload_{st.session_state.file_upload_key}']
-        st.session_state.file_upload_key += 1
-        st.session_state.drop_file = False
-
-    # Add the math attachments to the prompt
-    if st.session_state.math_attachments:
-        prompt += f'\n\n#### Math Attachments:\n\n'
-        for i, attachment in enumerate(st.session_state.math_attachments):
-            prompt += f'Expression {i+1}: ${attachment}$\n\n'
-        st.session_state.math_attachments = []
-
-    # Add the uploaded file contents to the prompt
-    if processed_file_text:
-        prompt_full = prompt + f'\n\n## Uploaded file contents:\n\n{processed_file_text}'
-    else:
-        prompt_full = prompt
-
-    # Add the user's prompt to the conversation
-    st.session_state.messages.append({"role": "user", "content": prompt})
-    with next_user_message:
-        st.chat_message("user", avatar=avatar["user"]).markdown(escape_markdown(prompt))
-
-    # Get the response from the tutor
-    response = st.session_state.tutor_llm.get_response(prompt_full)
-    st.session_state.messages.append({"role": "assistant", "content": rf"{response}"})    
-    st.session_state.email_sent = False
-    # Display the response letter by letter
-    with next_assistant_message.chat_message("assistant", avatar=avatar["assistant"]):
-        with st.empty():
-            for sentence in stream_text(response):
-                st.markdown(sentence)
-                time.sleep(0.02)
+    # Everything done for this message (file extraction, draft, moderation) is traced as one turn
+    with turn('chat.turn', attachments=len(dropped_files or [])):
+        # Process dropped files
+        processed_file_text = ''
+        if dropped_files:
+            for file in dropped_files:
+                try:
+                    with st.session_state.chat_spinner, st.spinner(f"Processing: {file.name}"):
+                        extracted_text = extract_text_from_different_file_types(file)
+                        processed_file_text += f"\n\n**{file.name}**\n\n{extracted_text}"
+                except Exception as e:
+                    st.error(f"Error processing {file.name}: {str(e)}")
+                    st.exception(e)
+            del st.session_state[f'file_upload_{st.session_state.file_upload_key}']
+            st.session_state.file_upload_key += 1
+            st.session_state.drop_file = False
+
+        # Add the math attachments to the prompt
+        if st.session_state.math_attachments:
+            prompt += f'\n\n#### Math Attachments:\n\n'
+            for i, attachment in enumerate(st.session_state.math_attachments):
+                prompt += f'Expression {i+1}: ${attachment}$\n\n'
+            st.session_state.math_attachments = []
+
+        # Add the uploaded file contents to the prompt
+        if processed_file_text:
+            prompt_full = prompt + ATTACHMENT_MARKER + processed_file_text
+        else:
+            prompt_full = prompt
+
+        # Add the user's prompt to the conversation
+        st.session_state.messages.append({"role": "user", "content": prompt})
+        with next_user_message:
+            st.chat_message("user", avatar=avatar["user"]).markdown(escape_markdown(prompt))
+
+        # Streaming shows a single draft, so the parallel strategy is never streamed
+        if chat_config['stream_tokens'] and st.session_state.tutor_llm.moderation_strategy == 'sequential':
+            with next_assistant_message.chat_message("assistant", avatar=avatar["assistant"]):
+                # Display the (provisional) response as the tutor writes it
+                response_placeholder = st.empty()
+                draft = render_stream(response_placeholder, 
+                                      st.session_state.tutor_llm.stream_response(prompt_full),
+                                      chat_config['stream_frame_rate'])
+                # Check the response and replace it if the moderator changed it
+                response = st.session_state.tutor_llm.moderate_response()
+                if response != draft:
+                    stream_text(response_placeholder, response)
+            st.session_state.messages.append({"role": "assistant", "content": rf"{response}"})
+            st.session_state.email_sent = False
+        else:
+            # Get the response from the tutor
+            response = st.session_state.tutor_llm.get_response(prompt_full)
+            st.session_state.messages.append({"role": "assistant", "content": rf"{response}"})    
+            st.session_state.email_sent = False
+            # Display the response word by word
+            with next_assistant_message.chat_message("assistant", avatar=avatar["assistant"]):
+                stream_text(st.empty(), response)
 
     # Re-run the app to update the conversation
     st.rerun()
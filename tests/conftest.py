@@ -0,0 +1,19 @@
+import os
+import sys
+
+# The tests import the app's modules (llms, utils, api) like the app does, from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import utils.object_cache
+import utils.storage
+
+@pytest.fixture
+def local_bucket(tmp_path, monkeypatch):
+    """A local directory standing in for the S3 bucket (with tables stored in it and an in-memory object cache)"""
+    bucket_dir = tmp_path / 'bucket'
+    monkeypatch.setattr(utils.object_cache, '_fs', utils.object_cache.create_fs({'local_bucket_dir': str(bucket_dir)}))
+    monkeypatch.setattr(utils.object_cache, '_cache', utils.object_cache.ObjectCache(memory_max_bytes=1024 * 1024))
+    monkeypatch.setattr(utils.storage, '_storage', utils.storage.S3Storage())
+    return bucket_dir
@@ -0,0 +1,46 @@
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from utils.access_code_index import ACCESS_CODES_FN, AccessCodeIndex, parse_end_datetime
+from utils.tutor_data import upsert_rows, write_csv
+
+def codes(*rows):
+    return pd.DataFrame([{"Code": code, "Name": name, "Email": "teacher@example.com", "End Date": end_date}
+                         for code, name, end_date in rows])
+
+def test_lookup_is_case_insensitive(local_bucket):
+    write_csv(ACCESS_CODES_FN, codes(("AbC123", "Math Tutor", ""), ("XYZ", "Reading Tutor", "2030-01-01 12:00")))
+    index = AccessCodeIndex(check_interval=60)
+
+    entry = index.lookup("abc123")
+    assert (entry.code, entry.tool_name, entry.email) == ("AbC123", "Math Tutor", "teacher@example.com")
+    assert index.lookup("ABC123") == entry
+    assert index.lookup("nope") is None
+
+def test_expiry(local_bucket):
+    write_csv(ACCESS_CODES_FN, codes(("A", "Math Tutor", ""), ("B", "Math Tutor", "2030-01-01 12:00"),
+                                     ("C", "Math Tutor", "someday")))
+    index = AccessCodeIndex(check_interval=60)
+
+    assert not index.lookup("A").is_expired()
+    expiring = index.lookup("B")
+    assert expiring.end_datetime == datetime(2030, 1, 1, 12, 0, tzinfo=timezone.utc)
+    assert not expiring.is_expired(datetime(2030, 1, 1, 11, 59, tzinfo=timezone.utc))
+    assert expiring.is_expired(datetime(2030, 1, 1, 12, 1, tzinfo=timezone.utc))
+    # End dates that cannot be parsed are flagged
+    assert not index.lookup("C").valid_date
+
+def test_parse_end_datetime():
+    assert parse_end_datetime('') == (None, True)
+    assert parse_end_datetime(None) == (None, True)
+    assert parse_end_datetime(float('nan')) == (None, True)
+    assert parse_end_datetime('2030-01-01') == (None, False)
+
+def test_changes_in_this_process_seen_immediately(local_bucket):
+    write_csv(ACCESS_CODES_FN, codes(("A", "Math Tutor", "")))
+    index = AccessCodeIndex(check_interval=60)
+    assert index.lookup("B") is None
+
+    upsert_rows(ACCESS_CODES_FN, codes(("B", "Reading Tutor", "")))
+    assert index.lookup("B").tool_name == "Reading Tutor"
@@ -0,0 +1,82 @@
+import math
+
+import numpy as np
+
+from llms.bm25_index import BM25Index, BM25Retriever, bm25_path, load_bm25_index, save_bm25_index, tokenize
+from utils.knowledge_files import knowledge_hash
+
+PASSAGES = [("fractions.txt", "To add fractions, find a common denominator."),
+            ("fractions.txt", "Fractions fractions fractions and more fractions about pizza slices."),
+            ("volcanoes.txt", "Magma that reaches the surface is called lava."),
+            ("volcanoes.txt", "Lava cools into rock.")]
+
+KNOWLEDGE = ("----- fractions.txt -----\n\nTo add fractions, find a common denominator.\n\n"
+             "----- volcanoes.txt -----\n\nMagma that reaches the surface is called lava.")
+
+def bm25_score(passages, query, k1=1.5, b=0.75):
+    # Straightforward BM25, to check the precomputed weights against
+    documents = [tokenize(text) for _, text in passages]
+    average_length = sum(len(document) for document in documents) / len(documents)
+    scores = []
+    for document in documents:
+        score = 0.0
+        for word in set(tokenize(query)):
+            num_documents = sum(word in d for d in documents)
+            if not num_documents:
+                continue
+            idf = math.log(1 + (len(documents) - num_documents + 0.5) / (num_documents + 0.5))
+            frequency = document.count(word)
+            score += idf * frequency * (k1 + 1) / (frequency + k1 * (1 - b + b * len(document) / average_length))
+        scores.append(score)
+    return scores
+
+def test_scores_match_bm25():
+    index = BM25Index.build(PASSAGES)
+    for query in ["add fractions", "lava rock", "what is magma"]:
+        expected = bm25_score(PASSAGES, query)
+        ranked = [i for i in np.argsort(expected)[::-1] if expected[i] > 0]
+        assert index.search(query, top_k=len(PASSAGES)) == ranked
+
+def test_search_limits_and_misses():
+    index = BM25Index.build(PASSAGES)
+    ranked = index.search("fractions lava", top_k=4)
+    assert len(ranked) == 4
+    assert index.search("fractions lava", top_k=1) == ranked[:1]
+    assert index.search("fractions lava", top_k=2) == ranked[:2]
+    assert index.search("photosynthesis") == []
+    assert BM25Index.build([]).search("anything") == []
+
+def test_shorter_passage_ranks_higher_for_the_same_words():
+    index = BM25Index.build(PASSAGES)
+    # "lava" appears once in both volcano passages, the shorter one scores higher
+    assert index.search("lava", top_k=2) == [3, 2]
+
+def test_json_round_trip():
+    index = BM25Index.build(PASSAGES)
+    loaded = BM25Index.from_json(index.to_json())
+    assert loaded.passages == PASSAGES
+    for query in ["add fractions", "lava rock", "pizza"]:
+        assert loaded.search(query, top_k=4) == index.search(query, top_k=4)
+
+def test_retriever_keeps_knowledge_base_order():
+    retriever = BM25Retriever(BM25Index.build(PASSAGES), top_k=2)
+    assert retriever.retrieve("lava") == ("----- volcanoes.txt -----\n\nMagma that reaches the surface is called lava.\n\n"
+                                          "----- volcanoes.txt -----\n\nLava cools into rock.")
+
+def test_saved_once_and_loaded(local_bucket):
+    path = save_bm25_index(KNOWLEDGE)
+    assert path == bm25_path(knowledge_hash(KNOWLEDGE))
+    stored = local_bucket / path
+    assert stored.exists()
+
+    # An existing index is not rebuilt
+    stored.write_text(BM25Index.build(PASSAGES[:1]).to_json())
+    assert save_bm25_index(KNOWLEDGE) == path
+    assert load_bm25_index(KNOWLEDGE).passages == PASSAGES[:1]
+
+    assert save_bm25_index('') == ''
+
+def test_load_builds_missing_index(local_bucket):
+    index = load_bm25_index(KNOWLEDGE)
+    assert index.search("lava") == [1]
+    assert (local_bucket / bm25_path(knowledge_hash(KNOWLEDGE))).exists()
@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from llms.chatbot_llm import AITutor
+from llms.compiled_tutor import build_compiled_tutor
+from llms.fake_llm import FakeLLM
+
+@pytest.fixture
+def tutor():
+    compiled = build_compiled_tutor("You are a helpful tutor.", "1. Do not give away answers.", "Hi!", "")
+    return AITutor(FakeLLM(tokens_per_second=10000), compiled)
+
+def roles(tutor):
+    return [message.role.value for message in tutor.message_history]
+
+def test_completed_stream_adds_both_messages(tutor):
+    response = ''.join(tutor.stream_response("What is 1/2 + 1/4?"))
+    assert roles(tutor) == ['system', 'assistant', 'user', 'assistant']
+    assert tutor.message_history[-1].content == response
+
+def test_abandoned_stream_drops_student_message(tutor):
+    stream = tutor.stream_response("What is 1/2 + 1/4?")
+    next(stream)
+    # e.g. the student left the page while the response was streaming
+    stream.close()
+    assert roles(tutor) == ['system', 'assistant']
+
+def test_abandoned_async_stream_drops_student_message(tutor):
+    async def read_one_chunk():
+        stream = tutor.astream_response("What is 1/2 + 1/4?")
+        await stream.__anext__()
+        # e.g. the API client disconnected
+        await stream.aclose()
+
+    asyncio.run(read_one_chunk())
+    assert roles(tutor) == ['system', 'assistant']
+
+def test_failed_stream_drops_student_message(tutor):
+    def fail(messages, **kwargs):
+        raise ConnectionError("LLM unavailable")
+    tutor.llm = type('FailingLLM', (), {'stream_chat': staticmethod(fail)})()
+
+    with pytest.raises(ConnectionError):
+        list(tutor.stream_response("What is 1/2 + 1/4?"))
+    assert roles(tutor) == ['system', 'assistant']
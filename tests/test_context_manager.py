@@ -0,0 +1,87 @@
+import asyncio
+
+from llama_index.core.llms import ChatMessage, ChatResponse
+
+from llms.context_manager import ATTACHMENT_MARKER, ConversationContext, count_tokens, strip_attachment
+
+class SummaryLLM:
+    """Records the summary requests and answers each with a numbered summary"""
+
+    def __init__(self):
+        self.requests = []
+
+    def chat(self, messages, **kwargs):
+        self.requests.append(messages)
+        return ChatResponse(message=ChatMessage(role="assistant", content=f" summary {len(self.requests)} "))
+
+    async def achat(self, messages, **kwargs):
+        return self.chat(messages)
+
+def text(n, word="word"):
+    return " ".join(f"{word}{i}" for i in range(n))
+
+def conversation(num_turns, words=40):
+    messages = [ChatMessage(role="system", content="You are a tutor.")]
+    for turn in range(num_turns):
+        messages.append(ChatMessage(role="user", content=f"question {turn} " + text(words)))
+        messages.append(ChatMessage(role="assistant", content=f"answer {turn} " + text(words)))
+    return messages
+
+def test_short_conversation_sent_as_is():
+    llm = SummaryLLM()
+    context = ConversationContext(llm, max_tokens=10000, keep_turns=2)
+    messages = conversation(4)
+    assert context.messages(messages) == messages
+    assert llm.requests == []
+
+def test_older_turns_are_summarized_incrementally():
+    llm = SummaryLLM()
+    messages = conversation(4)
+    turn_tokens = sum(count_tokens(message.content) for message in messages[1:3])
+    context = ConversationContext(llm, max_tokens=3 * turn_tokens, keep_turns=2, summary_max_words=10)
+
+    sent = context.messages(messages)
+    # The system prompt, the summary and the last two turns
+    assert [message.content for message in sent[2:]] == [message.content for message in messages[5:]]
+    assert sent[1].content.endswith("summary 1")
+    assert context.summary == "summary 1" and context.num_summarized == 4
+    assert all(message.content in llm.requests[0][1].content for message in messages[1:5])
+
+    # The next turn only folds the turn that just left the window into the summary
+    messages += conversation(5)[-2:]
+    sent = context.messages(messages)
+    assert [message.content for message in sent[2:]] == [message.content for message in messages[7:]]
+    assert context.summary == "summary 2" and context.num_summarized == 6
+    request = llm.requests[1][1].content
+    assert "summary 1" in request
+    assert messages[5].content in request and messages[4].content not in request
+
+    # Nothing new to summarize until another turn leaves the window
+    assert context.messages(messages) == sent
+    assert len(llm.requests) == 2
+
+def test_async_matches_sync():
+    messages = conversation(4)
+    turn_tokens = sum(count_tokens(message.content) for message in messages[1:3])
+    sync_context = ConversationContext(SummaryLLM(), max_tokens=3 * turn_tokens, keep_turns=2, summary_max_words=10)
+    async_context = ConversationContext(SummaryLLM(), max_tokens=3 * turn_tokens, keep_turns=2, summary_max_words=10)
+    assert asyncio.run(async_context.amessages(messages)) == sync_context.messages(messages)
+
+def test_strip_attachment():
+    assert strip_attachment("What is this?") == "What is this?"
+    stripped = strip_attachment("What is this?" + ATTACHMENT_MARKER + "Chapter 1: fractions.")
+    assert stripped.startswith("What is this?") and "fractions" not in stripped
+
+def test_attachments_dropped_from_earlier_turns_first():
+    llm = SummaryLLM()
+    messages = [ChatMessage(role="system", content="You are a tutor."),
+                ChatMessage(role="user", content="Read this." + ATTACHMENT_MARKER + text(300, "old")),
+                ChatMessage(role="assistant", content="Done."),
+                ChatMessage(role="user", content="And this." + ATTACHMENT_MARKER + text(30, "new"))]
+    context = ConversationContext(llm, max_tokens=200, keep_turns=2, summary_max_words=10)
+
+    sent = context.messages(messages)
+    # Both turns still fit once the earlier file is dropped, so nothing is summarized
+    assert llm.requests == []
+    assert sent[1].content == strip_attachment(messages[1].content)
+    assert sent[2:] == messages[2:]
@@ -0,0 +1,83 @@
+import asyncio
+import random
+import statistics
+
+import pytest
+from llama_index.core.llms import ChatMessage
+
+from llms.compiled_tutor import build_compiled_tutor
+from llms.context_manager import ConversationContext
+from llms.fake_llm import CORRECTION_PREFIX, DRAFT_PREFIX, FakeLLM, LatencyDistribution
+from llms.moderator_context import ModeratorContext
+from llms.moderator_llm import ContentModerator
+
+TUTOR = build_compiled_tutor("You are a helpful tutor.", "1. Do not give away answers.", "Hi!", "Chapter 1.")
+
+def verdicts(llm, num_checks, mode='two_call'):
+    moderator = ContentModerator(llm, TUTOR, mode=mode, context=ModeratorContext(TUTOR.knowledge, policy='full'))
+    return [moderator.check_response("**user**: hi", f"{DRAFT_PREFIX} {i}") for i in range(num_checks)]
+
+def test_same_seed_same_verdicts():
+    first = verdicts(FakeLLM(reject_draft=0.5, seed=7), 20)
+    assert verdicts(FakeLLM(reject_draft=0.5, seed=7), 20) == first
+    assert verdicts(FakeLLM(reject_draft=0.5, seed=8), 20) != first
+    # Both outcomes occur
+    assert {is_appropriate for _, is_appropriate, _ in first} == {True, False}
+
+def test_reject_rates():
+    assert all(is_appropriate for _, is_appropriate, _ in verdicts(FakeLLM(reject_draft=0.0), 10))
+    assert not any(is_appropriate for _, is_appropriate, _ in verdicts(FakeLLM(reject_draft=1.0), 10))
+
+    # Corrections are judged with their own rate
+    llm = FakeLLM(reject_draft=1.0, reject_correction=0.0)
+    moderator = ContentModerator(llm, TUTOR, context=ModeratorContext(TUTOR.knowledge, policy='full'))
+    assert moderator.check_response("**user**: hi", f"{CORRECTION_PREFIX} try again")[1]
+
+def test_calls_recognised_by_kind():
+    llm = FakeLLM(reject_draft=1.0)
+    draft = llm.chat([ChatMessage(role="system", content=TUTOR.system_prompt),
+                      ChatMessage(role="user", content="What is 1/2 + 1/3?")]).message.content
+    assert draft.startswith(DRAFT_PREFIX) and len(draft.split()) == 40
+
+    verdicts(llm, 1)
+    (_, is_appropriate, corrected), = verdicts(llm, 1, mode='combined')
+    assert not is_appropriate and corrected.startswith(CORRECTION_PREFIX)
+    moderator = ContentModerator(llm, TUTOR, context=ModeratorContext(TUTOR.knowledge, policy='full'))
+    assert moderator.correct_response("**user**: hi", draft, "Too direct.").startswith(CORRECTION_PREFIX)
+
+    messages = [ChatMessage(role="system", content="You are a tutor.")]
+    for i in range(4):
+        messages += [ChatMessage(role="user", content=f"question {i} " * 50),
+                     ChatMessage(role="assistant", content=f"answer {i} " * 50)]
+    ConversationContext(llm, max_tokens=300, keep_turns=1, summary_max_words=10).messages(messages)
+
+    assert llm.stats()["calls"] == {"draft": 1, "moderation": 1, "review": 1, "correction": 1, "summary": 1}
+
+def test_streamed_text_matches_chat():
+    messages = [ChatMessage(role="user", content="Help me with fractions.")]
+    text = FakeLLM().chat(messages).message.content
+
+    chunks = list(FakeLLM().stream_chat(messages))
+    assert "".join(chunk.delta for chunk in chunks) == text
+    assert chunks[-1].message.content == text
+
+    async def astream():
+        return [chunk async for chunk in await FakeLLM().astream_chat(messages)]
+    assert "".join(chunk.delta for chunk in asyncio.run(astream())) == text
+
+def test_latency_distributions():
+    rng = random.Random(0)
+    assert LatencyDistribution('constant', median_seconds=0.2).sample(rng) == 0.2
+    samples = [LatencyDistribution('uniform', min_seconds=0.1, max_seconds=0.3).sample(rng) for _ in range(200)]
+    assert all(0.1 <= sample <= 0.3 for sample in samples)
+    samples = [LatencyDistribution('lognormal', median_seconds=0.5, sigma=0.5).sample(rng) for _ in range(2000)]
+    assert statistics.median(samples) == pytest.approx(0.5, rel=0.1)
+    with pytest.raises(ValueError):
+        LatencyDistribution('normal')
+
+def test_from_config():
+    llm = FakeLLM.from_config({"latency": {"distribution": "uniform", "min_seconds": 0, "max_seconds": 0},
+                               "reject_draft": 1.0, "response_words": 10, "seed": 3})
+    assert llm.chat([ChatMessage(role="user", content="hi")]).message.content.split()[:5] == DRAFT_PREFIX.split()
+    assert len(llm.chat([ChatMessage(role="user", content="hi")]).message.content.split()) == 10
+    assert FakeLLM.from_config(None).reject_draft == 0.0
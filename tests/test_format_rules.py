@@ -0,0 +1,58 @@
+import pytest
+
+from llms.format_rules import FormatRuleStats, apply_format_rules
+
+@pytest.mark.parametrize("text, expected, fixes", [
+    # Delimiters
+    (r"The velocity is \(v = at\).", "The velocity is $v = at$.", {'inline_math_parentheses': 1}),
+    ("So \\[ E = mc^2 \\] holds.", "So $$E = mc^2$$ holds.", {'display_math_brackets': 1}),
+    # HTML
+    ("x<sup>2</sup> + H<sub>2</sub>O", "$x^{2}$ + $H_{2}$O", {'html_superscript': 1, 'html_subscript': 1}),
+    # Unicode symbols
+    ("2 × 3 ≤ 7", "2 $\\times$ 3 $\\leq$ 7", {'unicode_math': 2}),
+    ("the area is π", "the area is $\\pi$", {'unicode_math': 1}),
+    # Roots and powers keep their operand
+    ("√2 ≈ 1.41", "$\\sqrt{2}$ $\\approx$ 1.41", {'unicode_math': 2}),
+    ("√(x+1)", "$\\sqrt{x+1}$", {'unicode_math': 1}),
+    ("x² + y³", "$x^{2}$ + $y^{3}$", {'unicode_math': 2}),
+    ("It is 20°C", "It is $20^\\circ$C", {'unicode_math': 1}),
+    # Adjacent rewrites become one span
+    ("x²·y", "$x^{2}\\cdot$y", {'unicode_math': 2}),
+    # Inside existing math no delimiters are added
+    ("$x² + √y$ and π", "$x^{2} + \\sqrt{y}$ and $\\pi$", {'unicode_math': 3}),
+    # Code is left untouched
+    ("`x²` and ```\n√2\n```", "`x²` and ```\n√2\n```", {}),
+    # Nothing to fix
+    ("The velocity is $v = at$.", "The velocity is $v = at$.", {}),
+])
+def test_fixed(text, expected, fixes):
+    result = apply_format_rules(text)
+    assert result.text == expected
+    assert result.fixes == fixes
+    assert result.unfixable == []
+
+@pytest.mark.parametrize("text, unfixable", [
+    # A root or power without an operand is left to the moderator
+    ("√ of a number", ['math_without_operand']),
+    ("x ² y", ['math_without_operand']),
+    ("<sup>2</sup> only", ['math_without_operand']),
+    # New delimiters would pair up with currency amounts
+    ("Prices: $3 or $4 → pick π", ['math_next_to_currency']),
+    ("<math><mi>x</mi></math>", ['mathml']),
+])
+def test_unfixable(text, unfixable):
+    result = apply_format_rules(text)
+    assert result.text == text
+    assert result.unfixable == unfixable
+
+def test_currency_is_not_math():
+    # "$3 or $" is not an existing math span
+    assert apply_format_rules("It costs $3 or $4.").text == "It costs $3 or $4."
+
+def test_stats_count_avoided_calls():
+    stats = FormatRuleStats()
+    stats.record(apply_format_rules("x² + 1"), calls_per_rejection=2)
+    stats.record(apply_format_rules("all good"), calls_per_rejection=2)
+    stats.record(apply_format_rules("√ alone"), calls_per_rejection=2)
+    assert stats.stats() == {"responses_checked": 3, "responses_fixed": 1, "responses_unfixable": 1,
+                             "llm_calls_avoided": 2, "fixes": {'unicode_math': 1}}
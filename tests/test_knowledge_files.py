@@ -0,0 +1,49 @@
+import os
+
+import utils.knowledge_files
+import utils.object_cache
+from utils.knowledge_files import load_file_to_temp, load_knowledge, save_knowledge
+
+def test_knowledge_round_trip(local_bucket):
+    k_hash, size = save_knowledge("Chapter 1: fractions.")
+    assert size == len("Chapter 1: fractions.")
+    assert load_knowledge(k_hash) == "Chapter 1: fractions."
+    # Identical knowledge bases are stored once
+    assert save_knowledge("Chapter 1: fractions.") == (k_hash, size)
+    assert save_knowledge("") == ('', 0)
+
+def write_file(local_bucket, name, data, mtime):
+    path = local_bucket / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    os.utime(path, (mtime, mtime))
+
+def test_temp_copy_reused_and_replaced(local_bucket, monkeypatch):
+    monkeypatch.setattr(utils.knowledge_files, '_temp_files', type(utils.knowledge_files._temp_files)())
+    monkeypatch.setattr(utils.object_cache._cache, 'revalidate_interval', 0)
+    write_file(local_bucket, 'files/notes.txt', b'v1', mtime=1000)
+
+    path = load_file_to_temp('files/notes.txt')
+    assert path.endswith('.txt')
+    assert load_file_to_temp('files/notes.txt') == path
+
+    # A new version gets a new copy and the old one is removed
+    write_file(local_bucket, 'files/notes.txt', b'v2', mtime=2000)
+    new_path = load_file_to_temp('files/notes.txt')
+    assert new_path != path and not os.path.exists(path)
+    with open(new_path, 'rb') as f:
+        assert f.read() == b'v2'
+    os.remove(new_path)
+
+def test_temp_copies_bounded(local_bucket, monkeypatch):
+    monkeypatch.setattr(utils.knowledge_files, '_temp_files', type(utils.knowledge_files._temp_files)())
+    monkeypatch.setattr(utils.knowledge_files, 'MAX_TEMP_FILES', 2)
+    paths = []
+    for name in ['a.txt', 'b.txt', 'c.txt']:
+        write_file(local_bucket, name, name.encode(), mtime=1000)
+        paths.append(load_file_to_temp(name))
+
+    assert [os.path.exists(path) for path in paths] == [False, True, True]
+    assert list(utils.knowledge_files._temp_files) == ['b.txt', 'c.txt']
+    for path in paths[1:]:
+        os.remove(path)
@@ -0,0 +1,63 @@
+import pytest
+from llama_index.core.llms import ChatMessage
+
+from llms.moderator_context import ModeratorContext
+
+KNOWLEDGE = ("----- fractions.txt -----\n\nTo add fractions, find a common denominator first.\n\n"
+             "----- volcanoes.txt -----\n\nMagma that reaches the surface is called lava.")
+
+def conversation(num_turns):
+    messages = [ChatMessage(role="system", content="You are a tutor.\n\n" + KNOWLEDGE)]
+    for turn in range(num_turns):
+        messages.append(ChatMessage(role="user", content=f"question {turn}"))
+        messages.append(ChatMessage(role="assistant", content=f"answer {turn}"))
+    return messages
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        ModeratorContext(KNOWLEDGE, policy='everything')
+
+def test_full_policy_shows_every_message():
+    messages = conversation(5)
+    transcript = ModeratorContext(KNOWLEDGE, policy='full').transcript(messages)
+    assert transcript == "\n\n".join(f"**{m.role.value}**: {m.content}" for m in messages)
+
+def test_recent_policy_keeps_last_turns_and_digest():
+    context = ModeratorContext(KNOWLEDGE, policy='recent', keep_turns=2, digest_chars_per_file=20)
+    transcript = context.transcript(conversation(5))
+    assert transcript.startswith("**Knowledge Base Digest**")
+    assert "----- fractions.txt -----\n\nTo add fractions, fi ..." in transcript
+    assert "common denominator" not in transcript
+    assert "(The 6 earlier messages are not shown.)" in transcript
+    assert "question 2" not in transcript
+    assert transcript.endswith("**user**: question 3\n\n**assistant**: answer 3\n\n"
+                               "**user**: question 4\n\n**assistant**: answer 4")
+
+def test_recent_policy_with_a_short_conversation():
+    transcript = ModeratorContext(KNOWLEDGE, policy='recent', keep_turns=4).transcript(conversation(2))
+    assert "not shown" not in transcript
+    # The system prompt is replaced by the digest
+    assert "You are a tutor." not in transcript
+    assert "**user**: question 0" in transcript
+
+def test_retrieval_policy_shows_relevant_excerpts():
+    messages = conversation(3)
+    messages.append(ChatMessage(role="user", content="What is lava?"))
+    context = ModeratorContext(KNOWLEDGE, policy='retrieval', keep_turns=1)
+    transcript = context.transcript(messages)
+    assert transcript.startswith("**Relevant Knowledge Base Excerpts**")
+    assert "Magma that reaches the surface" in transcript
+    assert "common denominator" not in transcript
+    assert transcript.endswith("**user**: What is lava?")
+
+def test_transcript_reused_until_the_conversation_changes():
+    context = ModeratorContext(KNOWLEDGE, policy='recent', keep_turns=2)
+    messages = conversation(3)
+    transcript = context.transcript(messages)
+    assert context.transcript(list(messages)) is transcript
+
+    messages.append(ChatMessage(role="user", content="question 3"))
+    assert context.transcript(messages).endswith("**user**: question 3")
+    # An edited message is formatted again
+    messages[-1] = ChatMessage(role="user", content="question 3, edited")
+    assert context.transcript(messages).endswith("**user**: question 3, edited")
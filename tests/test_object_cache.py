@@ -0,0 +1,129 @@
+import os
+
+from utils.object_cache import ObjectCache
+
+def write_object(bucket_dir, name, data, mtime=None):
+    path = bucket_dir / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    if mtime is not None:
+        # Give every rewrite a distinct version, even within the timestamp resolution of the filesystem
+        os.utime(path, (mtime, mtime))
+
+def test_memory_hit_within_revalidation_interval(local_bucket):
+    write_object(local_bucket, 'tutors.csv', b'v1')
+    cache = ObjectCache(memory_max_bytes=1024, revalidate_interval=60)
+
+    assert cache.read_bytes('tutors.csv') == b'v1'
+    # Changes are not seen (and the bucket is not asked) until the interval has passed
+    write_object(local_bucket, 'tutors.csv', b'v2', mtime=1000)
+    assert cache.read_bytes('tutors.csv') == b'v1'
+    stats = cache.stats()
+    assert (stats['misses'], stats['hits'], stats['revalidations']) == (1, 1, 1)
+
+def test_revalidation_keeps_unchanged_object(local_bucket):
+    write_object(local_bucket, 'tutors.csv', b'v1', mtime=1000)
+    cache = ObjectCache(memory_max_bytes=1024, revalidate_interval=0)
+
+    cache.read_bytes('tutors.csv')
+    assert cache.read_bytes('tutors.csv') == b'v1'
+    stats = cache.stats()
+    assert (stats['misses'], stats['hits'], stats['revalidations']) == (1, 1, 2)
+
+def test_download_again_after_object_changed(local_bucket):
+    write_object(local_bucket, 'tutors.csv', b'v1', mtime=1000)
+    cache = ObjectCache(memory_max_bytes=1024, revalidate_interval=0)
+
+    assert cache.read_bytes('tutors.csv') == b'v1'
+    write_object(local_bucket, 'tutors.csv', b'v2', mtime=2000)
+    assert cache.read_bytes('tutors.csv') == b'v2'
+    assert cache.stats()['misses'] == 2
+
+def test_disk_tier_shared_between_caches(local_bucket, tmp_path):
+    write_object(local_bucket, 'knowledge/abc', b'knowledge base', mtime=1000)
+    disk_dir = str(tmp_path / 'disk')
+
+    first = ObjectCache(memory_max_bytes=1024, disk_dir=disk_dir)
+    assert first.read_bytes('knowledge/abc') == b'knowledge base'
+    assert first.stats()['misses'] == 1
+
+    # A new cache (e.g. another process) reads the copy on disk instead of downloading it
+    second = ObjectCache(memory_max_bytes=1024, disk_dir=disk_dir)
+    assert second.read_bytes('knowledge/abc') == b'knowledge base'
+    assert (second.stats()['disk_hits'], second.stats()['misses']) == (1, 0)
+
+    # The copy on disk is not used once the object has changed
+    write_object(local_bucket, 'knowledge/abc', b'new knowledge base', mtime=2000)
+    third = ObjectCache(memory_max_bytes=1024, disk_dir=disk_dir)
+    assert third.read_bytes('knowledge/abc') == b'new knowledge base'
+    assert (third.stats()['disk_hits'], third.stats()['misses']) == (0, 1)
+
+def test_memory_bounded(local_bucket):
+    for name in 'abc':
+        write_object(local_bucket, name, name.encode() * 40)
+    write_object(local_bucket, 'big', b'x' * 200)
+    cache = ObjectCache(memory_max_bytes=100, revalidate_interval=60)
+
+    cache.read_bytes('a')
+    cache.read_bytes('b')
+    # Reading c evicts the least recently used object
+    cache.read_bytes('c')
+    stats = cache.stats()
+    assert (stats['objects'], stats['memory_bytes']) == (2, 80)
+    cache.read_bytes('a')
+    assert cache.stats()['misses'] == 4
+
+    # An object larger than the whole cache is returned but not kept
+    assert cache.read_bytes('big') == b'x' * 200
+    assert cache.stats()['memory_bytes'] <= 100
+
+def test_disk_bounded(local_bucket, tmp_path):
+    disk_dir = tmp_path / 'disk'
+    cache = ObjectCache(memory_max_bytes=1024, disk_dir=str(disk_dir), disk_max_bytes=100)
+    for i, name in enumerate('abc'):
+        write_object(local_bucket, name, name.encode() * 40)
+        cache.read_bytes(name)
+        # Distinct write times, so that the oldest copy is the one evicted
+        data_path, _ = cache._disk_paths(name)
+        os.utime(data_path, (1000 * (i + 1), 1000 * (i + 1)))
+
+    assert sum(path.stat().st_size for path in disk_dir.glob('*.bin')) <= 100
+    assert [os.path.exists(path) for name in 'abc' for path in cache._disk_paths(name)] == \
+        [False, False, True, True, True, True]
+
+def test_invalidate(local_bucket, tmp_path):
+    write_object(local_bucket, 'tutors.csv', b'v1')
+    disk_dir = tmp_path / 'disk'
+    cache = ObjectCache(memory_max_bytes=1024, disk_dir=str(disk_dir), revalidate_interval=60)
+
+    cache.read_bytes('tutors.csv')
+    write_object(local_bucket, 'tutors.csv', b'v2', mtime=1000)
+    # A writer in this process sees its change immediately, without waiting for the revalidation
+    cache.invalidate('tutors.csv')
+    assert list(disk_dir.iterdir()) == []
+    assert cache.read_bytes('tutors.csv') == b'v2'
+    assert cache.stats()['misses'] == 2
+
+def test_version_checked_once_per_read(local_bucket):
+    write_object(local_bucket, 'tutors.csv', b'v1', mtime=1000)
+    cache = ObjectCache(memory_max_bytes=1024, revalidate_interval=60)
+
+    # Checking the version before reading (as versioned files do) costs one metadata request, not two
+    version = cache.version('tutors.csv')
+    assert cache.read_bytes('tutors.csv') == b'v1'
+    write_object(local_bucket, 'tutors.csv', b'v2', mtime=2000)
+    assert cache.version('tutors.csv') != version
+    assert cache.read_bytes('tutors.csv') == b'v2'
+    stats = cache.stats()
+    assert (stats['misses'], stats['revalidations']) == (2, 2)
+
+def test_read_with_known_version(local_bucket):
+    write_object(local_bucket, 'tutors.csv', b'v1', mtime=1000)
+    cache = ObjectCache(memory_max_bytes=1024, revalidate_interval=0)
+    version = cache.get('tutors.csv').version
+
+    assert cache.read_bytes('tutors.csv', version) == b'v1'
+    write_object(local_bucket, 'tutors.csv', b'v2', mtime=2000)
+    assert cache.read_bytes('tutors.csv', cache.version('tutors.csv')) == b'v2'
+    stats = cache.stats()
+    assert (stats['misses'], stats['hits'], stats['revalidations']) == (2, 1, 2)
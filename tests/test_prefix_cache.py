@@ -0,0 +1,158 @@
+import asyncio
+import threading
+
+import pandas as pd
+import pytest
+from llama_index.core.llms import ChatMessage
+
+import llms.models
+import llms.prefix_cache
+import utils.tutor_data
+from llms.compiled_tutor import build_compiled_tutor
+from llms.fake_llm import FakeLLM
+from llms.prefix_cache import MockPrefixProvider, PrefixCache, PrefixCachedLLM
+
+TUTORS_FN = 'ai-tutors/tutor_info.csv'
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+@pytest.fixture
+def prefix_cache(clock):
+    return PrefixCache(MockPrefixProvider(FakeLLM()), ttl_seconds=600, refresh_seconds=60, clock=clock)
+
+def compiled_tutor(instructions="You are a helpful tutor."):
+    return build_compiled_tutor(instructions, "1. Do not give away answers.", "Hi!", "Chapter 1: fractions.")
+
+def test_registered_once_per_tutor(prefix_cache):
+    tutor = compiled_tutor()
+    handles = []
+    threads = [threading.Thread(target=lambda: handles.append(prefix_cache.handle(tutor))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(handles)) == 1
+    assert prefix_cache.provider.created == handles[:1]
+    # Another tutor gets its own prefix
+    assert prefix_cache.handle(compiled_tutor("You are a strict tutor.")) != handles[0]
+    assert prefix_cache.stats()['created'] == 2
+
+def test_later_calls_reuse_handle(prefix_cache, clock):
+    tutor = compiled_tutor()
+    name = prefix_cache.handle(tutor)
+    clock.now += 300
+    assert prefix_cache.handle(tutor) == name
+    stats = prefix_cache.stats()
+    assert (stats['created'], stats['reused'], stats['refreshed']) == (1, 1, 0)
+    assert stats['cached_tokens'] == tutor.system_prompt_tokens
+
+def test_refreshed_before_ttl_expires(prefix_cache, clock):
+    tutor = compiled_tutor()
+    name = prefix_cache.handle(tutor)
+
+    # Less than refresh_seconds left: the TTL is extended and the handle kept
+    clock.now += 570
+    assert prefix_cache.handle(tutor) == name
+    assert prefix_cache.provider.refreshed == [name]
+    clock.now += 570
+    assert prefix_cache.handle(tutor) == name
+    assert prefix_cache.stats()['created'] == 1
+
+    # Once expired (e.g. no conversation for longer than the TTL), the prompt is registered again
+    clock.now += 601
+    assert prefix_cache.handle(tutor) != name
+    assert prefix_cache.stats()['created'] == 2
+
+def test_small_prompts_not_cached(clock):
+    tutor = compiled_tutor()
+    prefix_cache = PrefixCache(MockPrefixProvider(FakeLLM()), ttl_seconds=600, refresh_seconds=60,
+                               min_tokens=tutor.system_prompt_tokens + 1, clock=clock)
+    assert prefix_cache.handle(tutor) is None
+    assert prefix_cache.provider.created == []
+
+class RecordingProvider(MockPrefixProvider):
+    """Records the messages sent with each cached prefix"""
+
+    def __init__(self, llm):
+        super().__init__(llm)
+        self.sent = []
+
+    def chat(self, name, messages):
+        self.sent.append((name, list(messages)))
+        return super().chat(name, messages)
+
+def test_only_messages_after_prefix_sent(clock):
+    tutor = compiled_tutor()
+    prefix_cache = PrefixCache(RecordingProvider(FakeLLM()), ttl_seconds=600, refresh_seconds=60, clock=clock)
+    llm = PrefixCachedLLM(FakeLLM(), prefix_cache, tutor)
+    messages = [ChatMessage(role="system", content=tutor.system_prompt),
+                ChatMessage(role="assistant", content="Hi!"),
+                ChatMessage(role="user", content="What is 1/2 + 1/4?")]
+
+    assert llm.chat(messages).message.content
+    name = prefix_cache.handle(tutor)
+    assert prefix_cache.provider.sent == [(name, messages[1:])]
+
+    # A chat that does not start with the tutor's system prompt goes to the LLM unchanged
+    llm.chat([ChatMessage(role="system", content="Summarize the conversation."), messages[-1]])
+    assert len(prefix_cache.provider.sent) == 1
+
+def test_invalidated_when_tutor_overwritten(local_bucket, prefix_cache, monkeypatch):
+    monkeypatch.setattr(llms.prefix_cache, '_cache', prefix_cache)
+    monkeypatch.setattr(llms.models, 'get_llm', lambda: FakeLLM())
+    config = utils.tutor_data.open_config()
+    config['llm']['prefix_cache'] = 'mock'
+    monkeypatch.setattr(utils.tutor_data, 'open_config', lambda: config)
+    utils.tutor_data.write_csv(TUTORS_FN, pd.DataFrame(columns=["Name"]))
+
+    def save(instructions, overwrite):
+        utils.tutor_data.create_tutor(TUTORS_FN, "Fractions", "Fractions tutor", "Hi!", instructions,
+                                      "Chapter 1: fractions.", "1. Do not give away answers.",
+                                      "['6']", "['Math']", "Public", "teacher@example.com", overwrite=overwrite)
+
+    save("You are a helpful tutor.", overwrite=False)
+    name = prefix_cache.handle(compiled_tutor())
+    save("You are a strict tutor.", overwrite=True)
+
+    assert prefix_cache.provider.deleted == [name]
+    assert prefix_cache.stats()['prefixes'] == 0
+    # The edited tutor registers its new prompt
+    assert prefix_cache.handle(compiled_tutor("You are a strict tutor.")) != name
+
+class FailingProvider(MockPrefixProvider):
+    def create(self, prefix, ttl_seconds):
+        raise ConnectionError("provider unavailable")
+
+def test_falls_back_to_full_prompt_when_provider_fails(clock):
+    tutor = compiled_tutor()
+    prefix_cache = PrefixCache(FailingProvider(FakeLLM()), ttl_seconds=600, refresh_seconds=60, clock=clock)
+    llm = PrefixCachedLLM(FakeLLM(), prefix_cache, tutor)
+    messages = [ChatMessage(role="system", content=tutor.system_prompt),
+                ChatMessage(role="user", content="What is 1/2 + 1/4?")]
+
+    assert llm.chat(messages).message.content
+    assert asyncio.run(llm.achat(messages)).message.content
+    assert prefix_cache.provider.calls == []
+
+def test_async_calls_register_off_the_event_loop(prefix_cache):
+    tutor = compiled_tutor()
+    llm = PrefixCachedLLM(FakeLLM(), prefix_cache, tutor)
+    threads = []
+    create = prefix_cache.provider.create
+    prefix_cache.provider.create = lambda *args: threads.append(threading.current_thread()) or create(*args)
+    messages = [ChatMessage(role="system", content=tutor.system_prompt),
+                ChatMessage(role="user", content="What is 1/2 + 1/4?")]
+
+    assert asyncio.run(llm.achat(messages)).message.content
+    assert threads and threads[0] is not threading.main_thread()
+    assert len(prefix_cache.provider.calls) == 1
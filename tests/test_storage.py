@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+
+from utils.storage import S3Storage, SQLiteStorage, migrate
+
+CODES_FN = 'ai-tutors/access_codes.csv'
+USERS_FN = 'ai-tutors/users.yaml'
+
+def codes(*rows):
+    return pd.DataFrame([{"Code": code, "Name": name, "Email": "teacher@example.com", "End Date": "2030-01-01"}
+                         for code, name in rows])
+
+def users(*usernames):
+    return {"cookie": {"expiry_days": 30, "name": "ai_tutor"},
+            "credentials": {"usernames": {username: {"email": f"{username}@example.com", "name": username.title(),
+                                                     "password": "hash"} for username in usernames}}}
+
+@pytest.fixture(params=['s3', 'sqlite'])
+def storage(request, tmp_path):
+    if request.param == 's3':
+        request.getfixturevalue('local_bucket')
+        storage = S3Storage()
+        storage.save_table(CODES_FN, codes())
+        return storage
+    return SQLiteStorage(str(tmp_path / 'storage.db'))
+
+def test_table_round_trip(storage):
+    version = storage.table_version(CODES_FN)
+    storage.save_table(CODES_FN, codes(("abc", "Math Tutor"), ("def", "Reading Tutor")))
+    assert storage.table_version(CODES_FN) != version
+    df = storage.load_table(CODES_FN)
+    assert list(df["Code"]) == ["abc", "def"]
+    assert list(df["Name"]) == ["Math Tutor", "Reading Tutor"]
+
+def test_upsert_and_delete(storage):
+    storage.save_table(CODES_FN, codes(("abc", "Math Tutor"), ("def", "Reading Tutor")))
+    version = storage.table_version(CODES_FN)
+    storage.upsert_rows(CODES_FN, codes(("def", "Science Tutor"), ("ghi", "Art Tutor")))
+    assert storage.table_version(CODES_FN) != version
+    df = storage.load_table(CODES_FN)
+    assert dict(zip(df["Code"], df["Name"])) == {"abc": "Math Tutor", "def": "Science Tutor", "ghi": "Art Tutor"}
+
+    version = storage.table_version(CODES_FN)
+    storage.delete_rows(CODES_FN, ["abc", "ghi"])
+    assert storage.table_version(CODES_FN) != version
+    assert list(storage.load_table(CODES_FN)["Code"]) == ["def"]
+
+def test_upsert_key_only_rows(storage):
+    storage.save_table(CODES_FN, codes(("abc", "Math Tutor")))
+    storage.upsert_rows(CODES_FN, pd.DataFrame({"Code": ["abc", "def"]}))
+    df = storage.load_table(CODES_FN)
+    assert list(df["Code"]) == ["abc", "def"]
+    assert list(df["Name"]) == ["Math Tutor", ""]
+
+def test_users_round_trip(storage):
+    storage.save_users(USERS_FN, users("ada", "alan"))
+    assert storage.load_users(USERS_FN) == users("ada", "alan")
+
+    config = users("ada", "alan", "grace")
+    config["credentials"]["usernames"]["ada"]["name"] = "Ada Lovelace"
+    storage.upsert_user(USERS_FN, config, "grace")
+    storage.upsert_user(USERS_FN, config, "ada")
+    assert storage.load_users(USERS_FN) == config
+
+    # Users that are no longer in the config are removed
+    storage.save_users(USERS_FN, users("grace"))
+    assert storage.load_users(USERS_FN) == users("grace")
+
+def test_migrate(local_bucket, tmp_path):
+    source = S3Storage()
+    source.save_table(CODES_FN, codes(("abc", "Math Tutor"), ("def", "Reading Tutor")))
+    source.save_users(USERS_FN, users("ada", "alan"))
+    target = SQLiteStorage(str(tmp_path / 'storage.db'))
+
+    assert migrate(source, target, [CODES_FN], USERS_FN) == {CODES_FN: 2, USERS_FN: 2}
+    pd.testing.assert_frame_equal(target.load_table(CODES_FN), source.load_table(CODES_FN))
+    assert target.load_users(USERS_FN) == source.load_users(USERS_FN)
+    assert target.table_version(CODES_FN) == 1
@@ -0,0 +1,106 @@
+import pytest
+
+import llms.verdict_cache
+from llms.compiled_tutor import build_compiled_tutor
+from llms.fake_llm import FakeLLM
+from llms.moderator_context import ModeratorContext
+from llms.moderator_llm import ContentModerator
+from llms.verdict_cache import VerdictCache, verdict_key
+
+VERDICT = ("Looks fine.\nVERDICT: yes", True, None)
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llms.verdict_cache.time, 'time', clock)
+    return clock
+
+def test_hit_and_miss():
+    cache = VerdictCache(max_entries=10, ttl_seconds=60)
+    key = verdict_key("prompt", "two_call", "**user**: hi", "Hello!")
+    assert cache.get(key) is None
+    cache.put(key, VERDICT)
+    assert cache.get(key) == VERDICT
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+def test_key_covers_every_field():
+    fields = ("prompt", "two_call", "**user**: hi", "Hello!")
+    keys = {verdict_key(*fields)}
+    for i in range(len(fields)):
+        changed = list(fields)
+        changed[i] += "!"
+        keys.add(verdict_key(*changed))
+    # Moving text from one field to the next gives a different key
+    keys.add(verdict_key("prompt", "two_call", "**user**: hiHello", "!"))
+    assert len(keys) == len(fields) + 2
+
+def test_expiry(clock):
+    cache = VerdictCache(max_entries=10, ttl_seconds=60)
+    cache.put("key", VERDICT)
+    clock.now += 59
+    assert cache.get("key") == VERDICT
+    clock.now += 2
+    assert cache.get("key") is None
+    assert cache.stats()["expirations"] == 1
+
+def test_least_recently_used_is_evicted():
+    cache = VerdictCache(max_entries=2, ttl_seconds=60)
+    cache.put("a", VERDICT)
+    cache.put("b", VERDICT)
+    cache.get("a")
+    cache.put("c", VERDICT)
+    assert cache.get("b") is None
+    assert cache.get("a") == VERDICT and cache.get("c") == VERDICT
+    assert cache.stats()["evictions"] == 1
+
+def test_disk_tier_is_shared(tmp_path):
+    first = VerdictCache(max_entries=10, ttl_seconds=60, disk_dir=str(tmp_path))
+    second = VerdictCache(max_entries=10, ttl_seconds=60, disk_dir=str(tmp_path))
+    first.put("key", VERDICT)
+    assert second.get("key") == VERDICT
+    assert second.stats()["disk_hits"] == 1
+    # The verdict is now also in the second cache's memory
+    assert second.get("key") == VERDICT
+    assert second.stats()["hits"] == 1
+
+def test_expired_disk_verdicts_are_removed(tmp_path, clock):
+    first = VerdictCache(max_entries=10, ttl_seconds=60, disk_dir=str(tmp_path))
+    first.put("key", VERDICT)
+    clock.now += 61
+    second = VerdictCache(max_entries=10, ttl_seconds=60, disk_dir=str(tmp_path))
+    assert second.get("key") is None
+    assert list(tmp_path.iterdir()) == []
+
+@pytest.fixture
+def verdict_cache(monkeypatch):
+    cache = VerdictCache(max_entries=10, ttl_seconds=60)
+    monkeypatch.setattr(llms.verdict_cache, '_cache', cache)
+    return cache
+
+def moderator(llm, mode='two_call'):
+    tutor = build_compiled_tutor("You are a helpful tutor.", "1. Do not give away answers.", "Hi!", "Chapter 1.")
+    return ContentModerator(llm, tutor, mode=mode, context=ModeratorContext(tutor.knowledge, policy='recent'))
+
+def test_moderator_reuses_verdict_for_the_same_input(verdict_cache):
+    llm = FakeLLM()
+    first = moderator(llm).check_response("**user**: hi", "Hello!", use_cache=True)
+    second = moderator(llm).check_response("**user**: hi", "Hello!", use_cache=True)
+    assert first == second
+    assert sum(llm.stats()["calls"].values()) == 1
+
+def test_moderator_rechecks_when_its_input_differs(verdict_cache):
+    llm = FakeLLM()
+    moderator(llm).check_response("**user**: hi", "Hello!", use_cache=True)
+    # Earlier context (e.g. a different knowledge base excerpt) changes the moderator's input
+    moderator(llm).check_response("Excerpt\n\n**user**: hi", "Hello!", use_cache=True)
+    moderator(llm, mode='combined').check_response("**user**: hi", "Hello!", use_cache=True)
+    moderator(llm).check_response("**user**: hi", "Hello!")
+    assert sum(llm.stats()["calls"].values()) == 4
+    assert verdict_cache.stats()["hits"] == 0
@@ -0,0 +1,46 @@
+import pandas as pd
+
+from utils.tutor_data import load_csv, write_csv
+from utils.versioned_file import VersionedFile, invalidate_path
+
+CODES_FN = 'ai-tutors/access_codes.csv'
+
+def codes(*names):
+    return pd.DataFrame({"Code": list(names), "Name": "Math Tutor", "Email": "", "End Date": ""})
+
+class Builder:
+    def __init__(self):
+        self.builds = 0
+
+    def __call__(self):
+        self.builds += 1
+        return list(load_csv(CODES_FN)["Code"])
+
+def test_rebuilt_only_when_the_file_changes(local_bucket):
+    write_csv(CODES_FN, codes("A"))
+    build = Builder()
+    versioned = VersionedFile(CODES_FN, build, check_interval=60)
+    assert versioned.get() == ["A"]
+    assert versioned.get() == ["A"]
+    assert build.builds == 1
+
+    # Invalidating an unchanged file checks its version but keeps the value
+    invalidate_path(CODES_FN)
+    assert versioned.get() == ["A"]
+    assert build.builds == 1
+
+    # Writes in this process invalidate it, and the new version is built
+    write_csv(CODES_FN, codes("A", "B"))
+    assert versioned.get() == ["A", "B"]
+    assert build.builds == 2
+
+def test_other_writers_seen_after_the_interval(local_bucket):
+    write_csv(CODES_FN, codes("A"))
+    versioned = VersionedFile(CODES_FN, Builder(), check_interval=60)
+    assert versioned.get() == ["A"]
+
+    # A write that does not invalidate this process's values (e.g. from another process)
+    (local_bucket / CODES_FN).write_text(codes("A", "B").to_csv(index=False))
+    assert versioned.get() == ["A"]
+    versioned.check_interval = 0
+    assert versioned.get() == ["A", "B"]
@@ -0,0 +1,91 @@
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional
+
+from utils.tutor_data import load_csv
+from utils.versioned_file import VersionedFile, VERSION_CHECK_INTERVAL
+
+ACCESS_CODES_FN = 'ai-tutors/access_codes.csv'
+
+@dataclass(frozen=True)
+class AccessCodeEntry:
+    """
+    A single access code.
+
+    Attributes:
+        code (str): The access code as it was created.
+        tool_name (str): Name of the tutor the code gives access to.
+        email (str): Email of the teacher who created the code.
+        end_datetime (datetime or None): Expiry time in UTC, or None if the code does not expire.
+        valid_date (bool): False if the stored end date could not be parsed.
+    """
+    code: str
+    tool_name: str
+    email: str
+    end_datetime: Optional[datetime]
+    valid_date: bool = True
+
+    def is_expired(self, cur_datetime=None):
+        if self.end_datetime is None:
+            return False
+        if cur_datetime is None:
+            cur_datetime = datetime.now(tz=timezone.utc)
+        return self.end_datetime < cur_datetime
+
+def normalize_code(code):
+    # Access codes are case insensitive
+    return str(code).upper()
+
+def parse_end_datetime(end_datetime_str):
+    """
+    Parse an end date from the access codes file.
+
+    Returns:
+        tuple: (end_datetime, valid_date) where end_datetime is None if there is no expiration
+    """
+    if end_datetime_str is None or end_datetime_str == '' or end_datetime_str != end_datetime_str:
+        return None, True  # No expiration
+    try:
+        end_datetime = datetime.strptime(str(end_datetime_str), '%Y-%m-%d %H:%M')
+        return end_datetime.replace(tzinfo=timezone.utc), True
+    except ValueError:
+        return None, False
+
+class AccessCodeIndex:
+    """
+    In-memory index of the access codes file for O(1) lookups.
+    The index is rebuilt only when the file changes (see VersionedFile).
+    """
+
+    def __init__(self, fn=ACCESS_CODES_FN, check_interval=VERSION_CHECK_INTERVAL):
+        self.fn = fn
+        self._file = VersionedFile(fn, self._build, check_interval=check_interval)
+
+    def _build(self):
+        df = load_csv(self.fn)
+        entries = {}
+        for code, name, email, end_date in zip(df["Code"].values, df["Name"].values,
+                                               df["Email"].values, df["End Date"].values):
+            end_datetime, valid_date = parse_end_datetime(end_date)
+            entries[normalize_code(code)] = AccessCodeEntry(code=code, tool_name=name, email=email,
+                                                            end_datetime=end_datetime, valid_date=valid_date)
+        return entries
+
+    def lookup(self, code) -> Optional[AccessCodeEntry]:
+        """Return the entry for an access code (case insensitive), or None if it does not exist"""
+        return self._file.get().get(normalize_code(code))
+
+    def invalidate(self):
+        """Force the index to be rebuilt on the next lookup"""
+        self._file.invalidate()
+
+# Process-level indexes shared by all sessions and requests
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_access_code_index(fn=ACCESS_CODES_FN) -> AccessCodeIndex:
+    with _indexes_lock:
+        if fn not in _indexes:
+            _indexes[fn] = AccessCodeIndex(fn)
+        return _indexes[fn]
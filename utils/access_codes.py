@@ -5,51 +5,36 @@ import numpy as np
 import random
 import string
 
-from utils.session import reset_chatbot
-from utils.tutor_data import select_instructions, write_csv, read_csv
+from utils.session import reset_chatbot, load_shared_tutor
+from utils.tutor_data import upsert_rows, delete_rows, read_csv
 from utils.knowledge_files import get_file_paths
+from utils.access_code_index import get_access_code_index
 from utils.config import domain_url
 
-def use_code(df_access, df_tutors, access_code):
+def use_code(df_tutors, access_code):
     # Get the current date and time
     cur_datetime = datetime.now(tz=timezone.utc)
 
-    # Select the row where the Code matches the given code (case insensitive)
-    selected_row = df_access[df_access["Code"].str.upper() == access_code.upper()]
+    # Look up the code (case insensitive) in the shared in-memory index
+    entry = get_access_code_index().lookup(access_code)
 
-    # Extract the Instructions and Guidelines for the selected row
-    if not selected_row.empty:
-        tool_name = selected_row["Name"].values[0]
-        st.session_state['teacher_email'] = selected_row["Email"].values[0]
-        end_datetime_str = selected_row["End Date"].values[0]  # This includes date and time
-
-        # Check if the end date is NaN
-        if pd.isna(end_datetime_str) or end_datetime_str == '':
-            end_datetime = None  # No expiration
-        else:
-            try:
-                # Convert the end date and time string to a datetime object
-                end_datetime = datetime.strptime(end_datetime_str, '%Y-%m-%d %H:%M')
-            except ValueError:
-                not_valid(error_msg='has an invalid date/time format')
-                return
+    # Extract the Instructions and Guidelines for the selected code
+    if entry is not None:
+        tool_name = entry.tool_name
+        st.session_state['teacher_email'] = entry.email
+        if not entry.valid_date:
+            not_valid(error_msg='has an invalid date/time format')
+            return
     else:
         not_valid(error_msg='does not exist')
         return
 
     # Compare the current datetime with the end datetime (if it exists)
-    if (end_datetime is not None) and (end_datetime < cur_datetime):
+    if entry.is_expired(cur_datetime):
         not_valid(error_msg='has expired')
     else:
-        # Extract and set instructions and other details in session state
-        (st.session_state["description"],
-         st.session_state["introduction"],
-         st.session_state["instructions"],
-         st.session_state["guidelines"],
-         st.session_state["knowledge"],
-         st.session_state["availability"]) = select_instructions(df_tutors, tool_name=tool_name)
-
-        st.session_state["tool name"] = tool_name
+        # Reference the shared tutor definition in session state
+        load_shared_tutor(df_tutors, tool_name)
         st.session_state["tutor_test_mode"] = False
 
         # Launch new chat
@@ -110,8 +95,8 @@ def add_code(fn, access_code, tool_name,
     # Concatenate the new row to the DataFrame
     df = pd.concat([df, new_row], ignore_index=True)
     
-    # Write the updated DataFrame to a CSV file
-    write_csv(fn, df)
+    # Save only the new code
+    upsert_rows(fn, new_row)
     
     return df
 
@@ -126,12 +111,14 @@ def delete_code(username, code):
     st.markdown(f"Are you sure you want to delete the code '{code}'?")
     # Ask for confirmation
     if st.button(f"Delete", type='primary', use_container_width=True):
-        # Remove the code from the user config
-        success = delete_access_code(st.session_state.df_access_codes, username, code)
+        # Remove the code from a copy of the shared table
+        df_access_codes = st.session_state.df_access_codes.copy()
+        success = delete_access_code(df_access_codes, username, code)
         
         if success:
-            # Save the updated CSV file
-            write_csv(st.session_state.access_codes_data_fn, st.session_state.df_access_codes)
+            st.session_state.df_access_codes = df_access_codes
+            # Delete the code from storage
+            delete_rows(st.session_state.access_codes_data_fn, [code])
             st.success("Access code removed successfully.")
             st.rerun()
         else:
@@ -188,11 +175,13 @@ def extend_code(username, code):
         new_end_date = np.nan  # Indefinite (no end date)
 
     if st.button(f"Extend", type='primary', use_container_width=True):
-        # Update the DataFrame with the new end date
-        st.session_state.df_access_codes.loc[selected_row.index, 'End Date'] = new_end_date
+        # Update a copy of the shared table with the new end date
+        df_access_codes = st.session_state.df_access_codes.copy()
+        df_access_codes.loc[selected_row.index, 'End Date'] = new_end_date
+        st.session_state.df_access_codes = df_access_codes
 
-        # Save the updated CSV file
-        write_csv(st.session_state.access_codes_data_fn, st.session_state.df_access_codes)
+        # Save only the updated code
+        upsert_rows(st.session_state.access_codes_data_fn, df_access_codes.loc[selected_row.index])
         st.success(f"Access code '{code}' extended successfully.")
         st.rerun()
 
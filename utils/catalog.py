@@ -0,0 +1,42 @@
+import threading
+
+from utils.tutor_data import load_csv
+from utils.versioned_file import VersionedFile
+
+class Catalog:
+    """
+    Read-only tables (tutors, access codes) shared by every session in this process.
+
+    Each table is loaded once and reloaded only when the stored file changes, so sessions
+    can reference the DataFrames on every rerun without copying them.
+    The DataFrames must not be modified in place: copy them first and save with `write_csv`.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._tables = {}
+
+    def _versioned_table(self, fn):
+        with self.lock:
+            if fn not in self._tables:
+                self._tables[fn] = VersionedFile(fn, lambda: load_csv(fn))
+            return self._tables[fn]
+
+    def table(self, fn):
+        """Return the current (shared, read-only) DataFrame for the file"""
+        return self._versioned_table(fn).get()
+
+    def version(self, fn):
+        """Return the version (S3 ETag or mtime) of the file the current table was loaded from"""
+        return self._versioned_table(fn).version
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+def get_catalog():
+    """Singleton instance of Catalog."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = Catalog()
+        return _catalog
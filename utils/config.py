@@ -1,8 +1,8 @@
-import streamlit as st
+import copy
+import functools
 import yaml
 import os
 
-@st.cache_data
 def open_config(config_dir="../config"):
     """
     Loads all configuration files from the config directory into a nested dictionary.
@@ -16,6 +16,11 @@ def open_config(config_dir="../config"):
     Raises:
         FileNotFoundError: If the configuration directory is not found
     """
+    # The files are only read once per process, and every caller gets its own copy
+    return copy.deepcopy(load_config(config_dir))
+
+@functools.lru_cache(maxsize=None)
+def load_config(config_dir):
     config_dir = os.path.join(os.path.dirname(__file__), config_dir)
     if not os.path.exists(config_dir):
         raise FileNotFoundError(f"Configuration directory not found: {config_dir}")
@@ -62,7 +67,10 @@ def get_model_config(config_dir="../config"):
 
     config = open_config(config_dir)
 
-    if 'gemini' in config["llm"]["model"]:
+    if config["llm"]["model"] == 'fake':
+        # The fake LLM (llms/fake_llm.py) runs offline
+        llm_api_key = None
+    elif 'gemini' in config["llm"]["model"]:
         llm_api_key = get_api_key("gemini")
     else:
         llm_api_key = get_api_key("openai")
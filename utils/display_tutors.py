@@ -1,19 +1,14 @@
 import streamlit as st
-from utils.tutor_data import select_instructions, available_tutors, delete_tutor_confirm, get_tags
-from utils.session import reset_chatbot, reset_build
+from utils.tutor_data import select_instructions, available_tutors, get_tags
+from utils.tutor_dialogs import delete_tutor_confirm
+from utils.session import reset_chatbot, reset_build, load_shared_tutor
 from utils.access_codes import create_code
 from utils.knowledge_files import get_file_paths
 
 def load_tool(df_tutors, tool_name, test_mode=False):
 
-    (st.session_state["description"],
-    st.session_state["introduction"], 
-     st.session_state["instructions"], 
-     st.session_state["guidelines"], 
-     st.session_state["knowledge"], 
-     st.session_state["availability"])= select_instructions(df_tutors, 
-                                                           tool_name=tool_name)
-    st.session_state["tool name"] = tool_name
+    # Reference the shared tutor definition in session state
+    load_shared_tutor(df_tutors, tool_name)
     st.session_state["tutor_test_mode"] = test_mode
     
     st.switch_page('pages/tutor.py')
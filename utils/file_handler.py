@@ -6,6 +6,7 @@ from striprtf.striprtf import rtf_to_text
 import zipfile
 
 from utils.mathpix import mathpix_extract
+from utils.tracing import span
 
 def extract_json_from_csv(csv_file) -> str:
     """
@@ -40,17 +41,20 @@ def extract_text_from_different_file_types(file) -> str:
         str: The extracted text.
     """
     type = file.name.split('.')[-1].lower()
-    if type == 'zip':
-        text = extract_text_from_zip(file)
-    elif type == 'pdf' or type == 'docx' or type == 'png' or type == 'jpg' or type == 'jpeg':
-        text = mathpix_extract(file)
-    elif type in ['txt', 'rtf']:
-        raw_text = file.read().decode("utf-8")
-        text = rtf_to_text(raw_text) if type == 'rtf' else raw_text
-    elif type == 'csv':
-        text = extract_json_from_csv(file) # in fact in json format
-    else:  # Treat other file type as .txt file
-        text = file.read().decode("utf-8")  # Treat all other types as text files
+    with span('files.extract_text', file_type=type) as extract_span:
+        if type == 'zip':
+            text = extract_text_from_zip(file)
+        elif type == 'pdf' or type == 'docx' or type == 'png' or type == 'jpg' or type == 'jpeg':
+            with span('files.mathpix', file_type=type):
+                text = mathpix_extract(file)
+        elif type in ['txt', 'rtf']:
+            raw_text = file.read().decode("utf-8")
+            text = rtf_to_text(raw_text) if type == 'rtf' else raw_text
+        elif type == 'csv':
+            text = extract_json_from_csv(file) # in fact in json format
+        else:  # Treat other file type as .txt file
+            text = file.read().decode("utf-8")  # Treat all other types as text files
+        extract_span.set(chars=len(text))
 
     return text
 
@@ -1,42 +1,141 @@
 import os
+import re
 import json
+import hashlib
+import threading
+from collections import OrderedDict
 
-import streamlit as st
-import s3fs
+from utils.object_cache import get_fs, get_object_cache
 
 #from st_files_connection import FilesConnection
 from tempfile import NamedTemporaryFile
 from pathlib import Path
 
-@st.cache_data(show_spinner=False)
+# Temporary copies of remote files: fn -> (version, path), least recently used first
+MAX_TEMP_FILES = 64
+_temp_files = OrderedDict()
+_temp_files_lock = threading.Lock()
+
+def remove_temp_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
 def load_file_to_temp(fn):
-    # Create a connection object to S3
-    #conn = st.connection('s3', type=FilesConnection, ttl=0)
-    fs = s3fs.S3FileSystem(anon=False)
+    # Retrieve the file through the shared object cache
+    remote_file = get_object_cache().get(fn)
 
-    # Open the remote file in binary read mode
-    with fs.open(fn, mode='rb') as remote_file:
+    with _temp_files_lock:
+        # Reuse the temporary copy if the file has not changed
+        if fn in _temp_files and _temp_files[fn][0] == remote_file.version:
+            _temp_files.move_to_end(fn)
+            return _temp_files[fn][1]
 
         # Extract the file extension
         filename = Path(fn).name
         suffix = Path(filename).suffix
 
-        # Create a temporary file with a custom name and appropriate suffix
-        temp_file = NamedTemporaryFile(delete=False, suffix=suffix, prefix=filename.split('.')[0] + '_')
+        # Create a temporary file with a custom name and appropriate suffix, and write the content to it
+        with NamedTemporaryFile(delete=False, suffix=suffix, prefix=filename.split('.')[0] + '_') as temp_file:
+            temp_file.write(remote_file.data)
 
-        # Write the content to the temporary file
-        temp_file.write(remote_file.read())
-        temp_file.flush()  # Ensure all data is written
+        # Remove the copy of the previous version, and the least recently used copies beyond the limit
+        if fn in _temp_files:
+            remove_temp_file(_temp_files.pop(fn)[1])
+        _temp_files[fn] = (remote_file.version, temp_file.name)
+        while len(_temp_files) > MAX_TEMP_FILES:
+            remove_temp_file(_temp_files.popitem(last=False)[1][1])
 
     # Return the path to the temporary file
     return temp_file.name
 
 
+KNOWLEDGE_DIR = 'ai-tutors/knowledge'
+
+def knowledge_hash(knowledge):
+    return hashlib.sha256(knowledge.encode('utf-8')).hexdigest()
+
+def knowledge_path(knowledge_hash):
+    return f'{KNOWLEDGE_DIR}/{knowledge_hash}.txt'
+
+def save_knowledge(knowledge):
+    """
+    Store a knowledge base as a content-addressed object.
+
+    Returns:
+        tuple: (hash, size) to be stored in the tutor catalog instead of the text itself
+    """
+    if not knowledge:
+        return '', 0
+    k_hash = knowledge_hash(knowledge)
+    fn = knowledge_path(k_hash)
+    fs = get_fs()
+    # Identical knowledge bases are only stored once
+    if not fs.exists(fn):
+        with fs.open(fn, 'wb') as f:
+            f.write(knowledge.encode('utf-8'))
+    return k_hash, len(knowledge)
+
+def load_knowledge(knowledge_hash):
+    """
+    Fetch a knowledge base by its hash (through the shared object cache).
+    """
+    if not knowledge_hash:
+        return ''
+    return get_object_cache().read_bytes(knowledge_path(knowledge_hash)).decode('utf-8')
+
+# Files in the knowledge base are separated by "----- file name -----" lines (see pages/build_tutor.py)
+FILE_HEADER_PATTERN = re.compile(r'^-----\s*(.+?)\s*-----\s*$', re.MULTILINE)
+
+def split_knowledge(knowledge):
+    """
+    Splits the knowledge base into (file name, text) sections.
+    Text before the first file header (or a knowledge base without headers) has an empty file name.
+    """
+    knowledge = knowledge or ''
+    sections = []
+    matches = list(FILE_HEADER_PATTERN.finditer(knowledge))
+    preamble = knowledge[:matches[0].start()] if matches else knowledge
+    if preamble.strip():
+        sections.append(('', preamble.strip()))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(knowledge)
+        text = knowledge[match.end():end].strip()
+        if text:
+            sections.append((match.group(1), text))
+    return sections
+
+def knowledge_passages(knowledge, max_chars=1000):
+    """
+    Splits the knowledge base into (file name, text) passages: the paragraphs of each file,
+    with consecutive short paragraphs merged up to `max_chars`.
+    """
+    passages = []
+    for file_name, text in split_knowledge(knowledge):
+        current = ''
+        for paragraph in re.split(r'\n\s*\n', text):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            if current and len(current) + len(paragraph) + 2 > max_chars:
+                passages.append((file_name, current))
+                current = ''
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+        if current:
+            passages.append((file_name, current))
+    return passages
+
+def format_passages(passages):
+    """Formats (file name, text) passages like the knowledge base itself"""
+    return "\n\n".join(f"----- {file_name} -----\n\n{text}" if file_name else text
+                       for file_name, text in passages)
+
 def save_files(tool_name, knowledge_files):
     data_dir = f'ai-tutors/knowledge-files/{tool_name}'
     # Create connection object and write file contents.
     #conn = st.connection('s3', type=FilesConnection, ttl=0)
-    fs = s3fs.S3FileSystem(anon=False)
+    fs = get_fs()
 
     file_paths = []
     for knowledge_file in knowledge_files:
@@ -44,6 +143,8 @@ def save_files(tool_name, knowledge_files):
         with fs.open(file_path, "wb") as f:
             f.write(knowledge_file.getvalue())
             file_paths.append(file_path)
+        # Replaced files must not be served from the cache
+        get_object_cache().invalidate(file_path)
 
     return file_paths
 
@@ -59,6 +160,7 @@ def get_file_paths(df, tool_name):
         return [] 
 
 def drop_files(container, existing_file_paths=[]):
+    import streamlit as st
     dropped_files = container.file_uploader("Drop a file or multiple files (.txt, .rtf, .pdf, .csv, .docx)", 
                                      accept_multiple_files=True, key='upload')
     
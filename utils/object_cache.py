@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import s3fs
+from fsspec.implementations.dirfs import DirFileSystem
+from fsspec.implementations.local import LocalFileSystem
+
+from utils.config import open_config
+
+# One filesystem client (and connection pool) shared by the whole process
+_fs = None
+_fs_lock = threading.Lock()
+
+def create_fs(storage_config):
+    local_bucket_dir = storage_config.get('local_bucket_dir')
+    if local_bucket_dir:
+        # A local directory stands in for the bucket (development and tests)
+        local_bucket_dir = os.path.abspath(local_bucket_dir)
+        os.makedirs(local_bucket_dir, exist_ok=True)
+        return DirFileSystem(path=local_bucket_dir, fs=LocalFileSystem(auto_mkdir=True))
+    return s3fs.S3FileSystem(anon=False)
+
+def get_fs():
+    """Filesystem holding the bucket (S3, or a local directory if configured)."""
+    global _fs
+    with _fs_lock:
+        if _fs is None:
+            _fs = create_fs(open_config()['storage'])
+        return _fs
+
+def object_version(fn):
+    # Cheap metadata request (no download) that changes whenever the object is rewritten
+    info = get_fs().info(fn, refresh=True)
+    return info.get('ETag') or info.get('LastModified') or info.get('mtime')
+
+@dataclass
+class CachedObject:
+    version: object
+    data: bytes
+    last_check: float
+
+class ObjectCache:
+    """
+    Read-through cache of objects in the bucket with two tiers:
+    an in-process LRU (bounded by `memory_max_bytes`) and a directory on local disk.
+
+    Cached objects are revalidated with a metadata request at most once every
+    `revalidate_interval` seconds and downloaded again only if their version (ETag) changed,
+    so changes made by other processes are seen within the interval.
+    Writers in this process call `invalidate` so that their changes are seen immediately.
+    """
+
+    def __init__(self, memory_max_bytes, disk_dir=None, disk_max_bytes=None, revalidate_interval=30):
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.revalidate_interval = revalidate_interval
+        self.lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        # Versions of objects not in memory, as (version, time checked), for the `get` that usually follows
+        self._versions = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_paths(self, fn):
+        key = hashlib.sha256(fn.encode('utf-8')).hexdigest()
+        return os.path.join(self.disk_dir, f'{key}.bin'), os.path.join(self.disk_dir, f'{key}.json')
+
+    def _read_disk(self, fn, version):
+        if not self.disk_dir:
+            return None
+        data_path, meta_path = self._disk_paths(fn)
+        try:
+            with open(meta_path, 'r') as f:
+                if json.load(f)['version'] != version:
+                    return None
+            with open(data_path, 'rb') as f:
+                return f.read()
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_disk(self, fn, version, data):
+        if not self.disk_dir:
+            return
+        data_path, meta_path = self._disk_paths(fn)
+        try:
+            # Write to temporary files first so that other processes never read a partial file
+            for path, content, mode in [(data_path, data, 'wb'),
+                                        (meta_path, json.dumps({'fn': fn, 'version': version}), 'w')]:
+                tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+                with open(tmp_path, mode) as f:
+                    f.write(content)
+                os.replace(tmp_path, path)
+            self._evict_disk()
+        except (OSError, TypeError):
+            # The disk tier is only an optimisation
+            pass
+
+    def _evict_disk(self):
+        if self.disk_max_bytes is None:
+            return
+        # Remove the least recently written objects until the directory fits
+        files = [os.path.join(self.disk_dir, name) for name in os.listdir(self.disk_dir) if name.endswith('.bin')]
+        files = sorted(files, key=os.path.getmtime)
+        total = sum(os.path.getsize(path) for path in files)
+        while files and total > self.disk_max_bytes:
+            path = files.pop(0)
+            total -= os.path.getsize(path)
+            for stale_path in [path, path[:-len('.bin')] + '.json']:
+                try:
+                    os.remove(stale_path)
+                except OSError:
+                    pass
+
+    def _remove_memory(self, fn):
+        entry = self._memory.pop(fn, None)
+        if entry is not None:
+            self._memory_bytes -= len(entry.data)
+
+    def _insert_memory(self, fn, entry):
+        self._remove_memory(fn)
+        if len(entry.data) > self.memory_max_bytes:
+            return
+        self._memory[fn] = entry
+        self._memory_bytes += len(entry.data)
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted.data)
+
+    def version(self, fn):
+        """Return the current version of the object, dropping the cached copy if it is out of date"""
+        version = object_version(fn)
+        with self.lock:
+            self.revalidations += 1
+            entry = self._memory.get(fn)
+            if entry is not None and entry.version == version:
+                entry.last_check = time.monotonic()
+            else:
+                self._remove_memory(fn)
+                self._versions[fn] = (version, time.monotonic())
+        return version
+
+    def get(self, fn, version=None):
+        """
+        Return the object (a CachedObject), downloading it only if there is no up to date copy.
+        `version` is the object's current version if the caller has just checked it (saves a metadata request);
+        a version checked by `version` within the revalidation interval is reused in the same way.
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self._memory.get(fn)
+            if entry is not None and (entry.version == version if version is not None
+                                      else now - entry.last_check < self.revalidate_interval):
+                self._memory.move_to_end(fn)
+                self.hits += 1
+                return entry
+            checked_version, checked = self._versions.pop(fn, (None, None))
+            if version is None and checked is not None and now - checked < self.revalidate_interval:
+                version = checked_version
+
+        if version is None:
+            version = self.version(fn)
+            with self.lock:
+                self._versions.pop(fn, None)
+        with self.lock:
+            entry = self._memory.get(fn)
+            if entry is not None and entry.version == version:
+                self._memory.move_to_end(fn)
+                self.hits += 1
+                return entry
+
+        data = self._read_disk(fn, version)
+        if data is not None:
+            with self.lock:
+                self.disk_hits += 1
+        else:
+            data = get_fs().cat_file(fn)
+            self._write_disk(fn, version, data)
+            with self.lock:
+                self.misses += 1
+
+        entry = CachedObject(version=version, data=data, last_check=time.monotonic())
+        with self.lock:
+            self._insert_memory(fn, entry)
+        return entry
+
+    def read_bytes(self, fn, version=None):
+        return self.get(fn, version).data
+
+    def invalidate(self, fn):
+        """Drop the cached copy of an object (after it was written by this process)"""
+        with self.lock:
+            self._remove_memory(fn)
+            self._versions.pop(fn, None)
+        if self.disk_dir:
+            for path in self._disk_paths(fn):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self):
+        with self.lock:
+            return {"objects": len(self._memory), "memory_bytes": self._memory_bytes,
+                    "hits": self.hits, "disk_hits": self.disk_hits,
+                    "misses": self.misses, "revalidations": self.revalidations}
+
+# Process-level cache shared by all sessions and requests
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_object_cache():
+    """Object cache configured in config/storage.yaml."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            storage_config = open_config()['storage']
+            _cache = ObjectCache(memory_max_bytes=storage_config['cache_memory_mb'] * 1024 * 1024,
+                                 disk_dir=storage_config.get('cache_disk_dir') or None,
+                                 disk_max_bytes=storage_config['cache_disk_mb'] * 1024 * 1024,
+                                 revalidate_interval=storage_config['cache_revalidate_seconds'])
+        return _cache
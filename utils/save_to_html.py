@@ -5,6 +5,7 @@ import streamlit as st
 import random
 from datetime import datetime
 from utils.emailing import send_email_chat
+from utils.tracing import span
 import weasyprint
 from weasyprint.text.fonts import FontConfiguration
 from pygments.formatters import HtmlFormatter
@@ -80,12 +81,15 @@ def generate_pdf(html_content: str) -> bytes:
     """
     Generate PDF from HTML content with proper font configuration.
     """
-    font_config = FontConfiguration()
-    html = weasyprint.HTML(string=html_content, url_fetcher=lambda url: {'string': '', 'mime_type': 'text/css'})
-    return html.write_pdf(
-        stylesheets=[],
-        font_config=font_config
-    )
+    with span('export.generate_pdf', html_chars=len(html_content)) as pdf_span:
+        font_config = FontConfiguration()
+        html = weasyprint.HTML(string=html_content, url_fetcher=lambda url: {'string': '', 'mime_type': 'text/css'})
+        pdf = html.write_pdf(
+            stylesheets=[],
+            font_config=font_config
+        )
+        pdf_span.set(pdf_bytes=len(pdf))
+        return pdf
 
 def escape_markdown(text: str) -> str:
     """
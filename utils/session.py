@@ -1,16 +1,21 @@
 import streamlit as st
 from streamlit_authenticator.utilities import LoginError 
 
-from utils.tutor_data import read_csv
+from utils.tutor_data import select_instructions
+from utils.catalog import get_catalog
 from utils.user_data import read_users
 from utils.styling import load_style
 from utils.memory_manager import initialize_memory_and_heartbeat, update_session_activity
 from utils.check_window import on_mobile
+from llms.compiled_tutor import compile_tutor
 
 def load_data():
+    # Shared, read-only tables (referenced, not copied, on every rerun)
+    catalog = get_catalog()
+
     # Load tutor data file or cached data
     st.session_state["ai_tutors_data_fn"] = 'ai-tutors/tutor_info.csv'
-    st.session_state["df_tutors"] = read_csv(st.session_state["ai_tutors_data_fn"])
+    st.session_state["df_tutors"] = catalog.table(st.session_state["ai_tutors_data_fn"])
 
     # Load user data file or cached data
     st.session_state["users_data_fn"] = 'ai-tutors/users.yaml'
@@ -18,7 +23,30 @@ def load_data():
 
     # Load access codes data file or cached data
     st.session_state["access_codes_data_fn"] = 'ai-tutors/access_codes.csv'
-    st.session_state["df_access_codes"] = read_csv(st.session_state["access_codes_data_fn"])
+    st.session_state["df_access_codes"] = catalog.table(st.session_state["access_codes_data_fn"])
+
+def load_shared_tutor(df_tutors, tool_name):
+    """
+    Load a tutor into this session for chatting.
+
+    The tutor definition is interned, so every session chatting with the same tutor
+    references one shared copy of its instructions, guidelines and knowledge base.
+    """
+    (description,
+     introduction,
+     instructions,
+     guidelines,
+     knowledge,
+     availability) = select_instructions(df_tutors, tool_name=tool_name)
+    compiled_tutor = compile_tutor(instructions, guidelines, introduction, knowledge)
+
+    st.session_state["description"] = description
+    st.session_state["availability"] = availability
+    st.session_state["introduction"] = compiled_tutor.introduction
+    st.session_state["instructions"] = compiled_tutor.instructions
+    st.session_state["guidelines"] = compiled_tutor.guidelines
+    st.session_state["knowledge"] = compiled_tutor.knowledge
+    st.session_state["tool name"] = tool_name
 
 def user_reset():
     st.session_state.authentication_status = None
@@ -0,0 +1,272 @@
+import io
+import os
+import json
+import sqlite3
+import threading
+from dataclasses import dataclass
+
+import pandas as pd
+import yaml
+from yaml.loader import SafeLoader
+
+from utils.config import open_config
+from utils.object_cache import get_fs, get_object_cache
+
+@dataclass(frozen=True)
+class TableSchema:
+    """
+    How a table file (e.g. 'ai-tutors/tutor_info.csv') is stored.
+
+    Attributes:
+        name (str): Name of the SQLite table.
+        key (str): Column that uniquely identifies a row.
+        columns (tuple): All columns, in the order they appear in the CSV file.
+        indexes (tuple): Additional columns that are looked up often.
+    """
+    name: str
+    key: str
+    columns: tuple
+    indexes: tuple = ()
+
+# Tables are identified by the file name they have always been stored under
+TABLES = {
+    'tutor_info.csv': TableSchema(
+        name='tutors', key='Name',
+        columns=("Name", "Description", "Introduction", "Instructions", "Knowledge Base",
+                 "Knowledge Hash", "Knowledge Size", "Guidelines", "Grades", "Subjects",
+                 "Creator Email", "Availability"),
+        indexes=("Creator Email",)),
+    'access_codes.csv': TableSchema(
+        name='access_codes', key='Code',
+        columns=("Code", "Name", "Email", "End Date"),
+        indexes=("Name", "Email")),
+}
+
+def table_schema(fn):
+    try:
+        return TABLES[os.path.basename(fn)]
+    except KeyError:
+        raise KeyError(f"No table is stored under '{fn}'")
+
+def to_sql_value(value):
+    # Missing values (NaN/None) are stored as NULL, numpy scalars as plain Python values
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+class S3Storage:
+    """
+    Each table is a CSV file and the users are a YAML file on S3.
+    Every change rewrites the whole file.
+    Files are read through the shared object cache, which revalidates them by ETag.
+    """
+
+    def load_table(self, fn):
+        return pd.read_csv(io.BytesIO(get_object_cache().read_bytes(fn))).fillna('')
+
+    def table_version(self, fn):
+        return get_object_cache().version(fn)
+
+    def _write(self, fn, content):
+        with get_fs().open(fn, 'wt') as f:
+            f.write(content)
+        get_object_cache().invalidate(fn)
+
+    def save_table(self, fn, df):
+        self._write(fn, df.to_csv(index=False))
+
+    def upsert_rows(self, fn, rows):
+        key = table_schema(fn).key
+        df = self.load_table(fn)
+        for column in rows.columns:
+            if column not in df.columns:
+                df[column] = ''
+        # Replace existing rows in place and append the new ones
+        for _, row in rows.iterrows():
+            match = df.index[df[key] == row[key]]
+            if len(match) > 0:
+                df.loc[match, rows.columns] = row.values
+            else:
+                df = pd.concat([df, row.to_frame().T], ignore_index=True)
+        self.save_table(fn, df)
+
+    def delete_rows(self, fn, keys):
+        key = table_schema(fn).key
+        df = self.load_table(fn)
+        self.save_table(fn, df[~df[key].isin(keys)])
+
+    def load_users(self, fn):
+        return yaml.load(get_object_cache().read_bytes(fn).decode('utf-8'), Loader=SafeLoader)
+
+    def save_users(self, fn, config):
+        self._write(fn, yaml.dump(config, default_flow_style=False))
+
+    def upsert_user(self, fn, config, username):
+        # The YAML file can only be rewritten as a whole
+        self.save_users(fn, config)
+
+class SQLiteStorage:
+    """
+    All tables and users in a single SQLite database.
+
+    Rows are inserted, updated and deleted individually, and the database runs in WAL mode
+    so that readers are never blocked by a writer.
+    Every write increments the table's version, which readers use to detect changes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # SQLite connections cannot be shared between threads
+        self._local = threading.local()
+        self._create_schema()
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        conn = self.connection()
+        with conn:
+            for schema in TABLES.values():
+                columns = ', '.join(f'"{c}" TEXT PRIMARY KEY' if c == schema.key else f'"{c}"'
+                                    for c in schema.columns)
+                conn.execute(f'CREATE TABLE IF NOT EXISTS {schema.name} ({columns})')
+                for column in schema.indexes:
+                    index_name = f'idx_{schema.name}_{column.lower().replace(" ", "_")}'
+                    conn.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON {schema.name} ("{column}")')
+            conn.execute('CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, email TEXT, data TEXT NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_users_email ON users (email)')
+            # Everything in the users config other than the credentials (e.g. cookie settings)
+            conn.execute('CREATE TABLE IF NOT EXISTS users_settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+
+    def _bump_version(self, conn, name):
+        conn.execute('INSERT INTO versions (name, version) VALUES (?, 1) '
+                     'ON CONFLICT(name) DO UPDATE SET version = version + 1', (name,))
+
+    def load_table(self, fn):
+        schema = table_schema(fn)
+        columns = ', '.join(f'"{c}"' for c in schema.columns)
+        df = pd.read_sql_query(f'SELECT {columns} FROM {schema.name} ORDER BY rowid', self.connection())
+        return df.fillna('')
+
+    def table_version(self, fn):
+        row = self.connection().execute('SELECT version FROM versions WHERE name = ?',
+                                        (table_schema(fn).name,)).fetchone()
+        return row[0] if row else 0
+
+    def _upsert(self, conn, schema, rows):
+        columns = [c for c in rows.columns if c in schema.columns]
+        column_names = ', '.join(f'"{c}"' for c in columns)
+        placeholders = ', '.join('?' for _ in columns)
+        updates = ', '.join(f'"{c}" = excluded."{c}"' for c in columns if c != schema.key)
+        # Rows with only the key column leave existing rows as they are
+        on_conflict = f'DO UPDATE SET {updates}' if updates else 'DO NOTHING'
+        sql = (f'INSERT INTO {schema.name} ({column_names}) VALUES ({placeholders}) '
+               f'ON CONFLICT("{schema.key}") {on_conflict}')
+        values = [[to_sql_value(v) for v in row] for row in rows[columns].itertuples(index=False)]
+        conn.executemany(sql, values)
+
+    def save_table(self, fn, df):
+        schema = table_schema(fn)
+        conn = self.connection()
+        with conn:
+            conn.execute(f'DELETE FROM {schema.name}')
+            self._upsert(conn, schema, df)
+            self._bump_version(conn, schema.name)
+
+    def upsert_rows(self, fn, rows):
+        schema = table_schema(fn)
+        conn = self.connection()
+        with conn:
+            self._upsert(conn, schema, rows)
+            self._bump_version(conn, schema.name)
+
+    def delete_rows(self, fn, keys):
+        schema = table_schema(fn)
+        conn = self.connection()
+        with conn:
+            conn.executemany(f'DELETE FROM {schema.name} WHERE "{schema.key}" = ?',
+                             [(to_sql_value(k),) for k in keys])
+            self._bump_version(conn, schema.name)
+
+    def load_users(self, fn):
+        conn = self.connection()
+        config = {key: json.loads(value) for key, value in conn.execute('SELECT key, value FROM users_settings')}
+        usernames = {username: json.loads(data) for username, data
+                     in conn.execute('SELECT username, data FROM users ORDER BY rowid')}
+        config['credentials'] = {'usernames': usernames}
+        return config
+
+    def _upsert_user(self, conn, username, user_data):
+        conn.execute('INSERT INTO users (username, email, data) VALUES (?, ?, ?) '
+                     'ON CONFLICT(username) DO UPDATE SET email = excluded.email, data = excluded.data',
+                     (username, user_data.get('email'), json.dumps(user_data)))
+
+    def save_users(self, fn, config):
+        usernames = config['credentials']['usernames']
+        conn = self.connection()
+        with conn:
+            for username, user_data in usernames.items():
+                self._upsert_user(conn, username, user_data)
+            # Remove users that are no longer in the config
+            stored = [row[0] for row in conn.execute('SELECT username FROM users')]
+            conn.executemany('DELETE FROM users WHERE username = ?',
+                             [(username,) for username in stored if username not in usernames])
+            conn.execute('DELETE FROM users_settings')
+            conn.executemany('INSERT INTO users_settings (key, value) VALUES (?, ?)',
+                             [(key, json.dumps(value)) for key, value in config.items() if key != 'credentials'])
+
+    def upsert_user(self, fn, config, username):
+        conn = self.connection()
+        with conn:
+            self._upsert_user(conn, username, config['credentials']['usernames'][username])
+
+def create_storage(storage_config):
+    backend = storage_config.get('backend', 's3')
+    if backend == 's3':
+        return S3Storage()
+    elif backend == 'sqlite':
+        path = storage_config['sqlite_path']
+        if not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(os.path.dirname(__file__)), path)
+        return SQLiteStorage(path)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+# Process-level storage shared by all sessions and requests
+_storage = None
+_storage_lock = threading.Lock()
+
+def get_storage():
+    """Storage backend selected in config/storage.yaml."""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = create_storage(open_config()['storage'])
+        return _storage
+
+def migrate(source, target, table_fns, users_fn):
+    """
+    Copy all tables and users from one storage backend to another.
+
+    Returns:
+        dict: Number of rows copied for each table and for the users
+    """
+    counts = {}
+    for fn in table_fns:
+        df = source.load_table(fn)
+        target.save_table(fn, df)
+        counts[fn] = len(df)
+    config = source.load_users(users_fn)
+    target.save_users(users_fn, config)
+    counts[users_fn] = len(config['credentials']['usernames'])
+    return counts
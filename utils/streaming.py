@@ -0,0 +1,57 @@
+import re
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+
+def word_chunks(text):
+    # Split text into words, keeping the whitespace that follows each word
+    return re.findall(r'\s*\S+\s*|\s+', text)
+
+def replay_text(text, chars_per_second):
+    """
+    Yields the words of a complete text, paced to appear at roughly `chars_per_second`.
+    """
+    start = time.monotonic()
+    num_chars = 0
+    for word in word_chunks(text):
+        num_chars += len(word)
+        delay = start + num_chars / chars_per_second - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        yield word
+
+def render_stream(placeholder, chunks, frame_rate, cursor=' ▌'):
+    """
+    Renders text chunks in a Streamlit placeholder as they arrive.
+
+    The placeholder is redrawn at most `frame_rate` times per second (however small the chunks are)
+    and once more with the complete text at the end.
+
+    Returns:
+        str: The complete text
+    """
+    parts = []
+    frame_time = 1 / frame_rate
+    last_frame = 0
+    for chunk in chunks:
+        parts.append(chunk)
+        now = time.monotonic()
+        if now - last_frame >= frame_time:
+            placeholder.markdown(''.join(parts) + cursor)
+            last_frame = now
+    text = ''.join(parts)
+    placeholder.markdown(text)
+    return text
+
+@contextmanager
+def spinner_progress(message):
+    """
+    Progress callback for TutorChain that shows a spinner (in the chat's spinner container if there is one).
+    """
+    if 'chat_spinner' in st.session_state:
+        with st.session_state.chat_spinner, st.spinner(message):
+            yield
+    else:
+        with st.spinner(message):
+            yield
@@ -0,0 +1,172 @@
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+from utils.config import open_config
+
+# Correlation id of the chat turn being handled and the innermost open span.
+# Context variables follow the request through await and run_in_threadpool (but not plain threads, see `propagate`).
+_trace_id = ContextVar('trace_id', default=None)
+_span_id = ContextVar('span_id', default=None)
+
+def new_id():
+    return uuid.uuid4().hex[:16]
+
+@dataclass
+class Span:
+    """
+    A timed stage of a request.
+
+    Attributes:
+        name (str): The stage (e.g. 'moderator.check').
+        trace_id (str): Correlation id shared by every span of the same chat turn.
+        span_id (str): Id of this span.
+        parent_id (str or None): Id of the span this one ran in.
+        start (float): Wall-clock start time (seconds since the epoch).
+        duration_ms (float): Time the stage took.
+        attributes (dict): Details of the stage (e.g. file name, number of moderations).
+        error (str or None): The exception that ended the stage, if any.
+    """
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start: float
+    duration_ms: float = 0.0
+    attributes: dict = field(default_factory=dict)
+    error: Optional[str] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+class NoSpan:
+    """Stands in for a span when tracing is off, so instrumented code does not need to check"""
+
+    def set(self, **attributes):
+        pass
+
+class RingBufferExporter:
+    """Keeps the last `max_spans` spans in memory (e.g. for tests, benchmarks or a debugging session)"""
+
+    def __init__(self, max_spans=10000):
+        self.lock = threading.Lock()
+        self._spans = deque(maxlen=max_spans)
+
+    def export(self, span):
+        with self.lock:
+            self._spans.append(span)
+
+    def spans(self, trace_id=None):
+        with self.lock:
+            return [span for span in self._spans if trace_id is None or span.trace_id == trace_id]
+
+    def clear(self):
+        with self.lock:
+            self._spans.clear()
+
+class JSONLinesExporter:
+    """Appends each span as one line of JSON to a local file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(asdict(span), default=str)
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+
+class Tracer:
+    """
+    Times the stages of the tutor request path and sends the spans to a local exporter.
+    Without an exporter, spans cost a context manager and nothing is recorded.
+    """
+
+    def __init__(self, exporter=None):
+        self.exporter = exporter
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Times the block as a stage of the current chat turn (or of a new one, if no turn is being traced).
+        Yields the span so that attributes known only at the end can be added with `span.set(...)`.
+        """
+        if self.exporter is None:
+            yield NoSpan()
+            return
+        span = Span(name=name, trace_id=_trace_id.get() or new_id(), span_id=new_id(),
+                    parent_id=_span_id.get(), start=time.time(), attributes=attributes)
+        trace_token = _trace_id.set(span.trace_id)
+        span_token = _span_id.set(span.span_id)
+        start = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.duration_ms = round((time.perf_counter() - start) * 1000, 3)
+            reset(_span_id, span_token)
+            reset(_trace_id, trace_token)
+            self.exporter.export(span)
+
+    @contextmanager
+    def turn(self, name, **attributes):
+        """Traces the block as a new chat turn, with its own correlation id"""
+        token = _trace_id.set(new_id())
+        try:
+            with self.span(name, **attributes) as span:
+                yield span
+        finally:
+            reset(_trace_id, token)
+
+def reset(variable, token):
+    try:
+        variable.reset(token)
+    except ValueError:
+        # A streaming generator closed from another context (e.g. after the client disconnected)
+        # leaves the context it was iterated in behind anyway
+        pass
+
+def create_exporter(tracing_config):
+    exporter = tracing_config.get('exporter') or 'none'
+    if exporter == 'none':
+        return None
+    elif exporter == 'memory':
+        return RingBufferExporter(tracing_config.get('ring_buffer_spans', 10000))
+    elif exporter == 'jsonl':
+        return JSONLinesExporter(tracing_config.get('jsonl_path') or 'traces.jsonl')
+    raise ValueError(f"Unknown tracing exporter: {exporter}")
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+def get_tracer() -> Tracer:
+    """Process-level tracer configured in config/tracing.yaml."""
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer(create_exporter(open_config().get('tracing') or {}))
+        return _tracer
+
+def span(name, **attributes):
+    return get_tracer().span(name, **attributes)
+
+def turn(name, **attributes):
+    return get_tracer().turn(name, **attributes)
+
+def correlation_id():
+    """Correlation id of the chat turn being traced (None outside a traced turn)"""
+    return _trace_id.get()
+
+def propagate(fn):
+    """Wraps a function submitted to a thread pool so that its spans belong to the submitting turn"""
+    context = copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
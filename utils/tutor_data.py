@@ -1,23 +1,48 @@
-import streamlit as st
 import pandas as pd
-import s3fs
 import ast
 
-@st.cache_data(show_spinner=False)
+from utils.config import open_config
+from utils.knowledge_files import save_knowledge, load_knowledge
+from utils.storage import get_storage
+from utils.tracing import span
+
+def load_csv(fn):
+    # Retrieve the table from storage (bypassing the Streamlit cache).
+    # The catalog and access-code index load their tables here, so this is where table reads are timed.
+    with span('storage.load_csv', fn=fn) as load_span:
+        df = get_storage().load_table(fn)
+        load_span.set(rows=len(df))
+        return df
+
 def read_csv(fn):
-    # Create connection object and retrieve file contents.
-    fs = s3fs.S3FileSystem(anon=False)
-    with fs.open(fn, 'rb') as f:
-        return pd.read_csv(f).fillna('')
+    # Up to date table (reads go through the shared object cache)
+    with span('storage.read_csv', fn=fn):
+        return load_csv(fn)
+
+def object_version(fn):
+    # Cheap request (no download) that changes whenever the table is modified
+    return get_storage().table_version(fn)
+
+def table_changed(fn):
+    # Rebuild shared in-memory views of this file (catalog, access code index) on next use
+    from utils.versioned_file import invalidate_path
+    invalidate_path(fn)
 
 def write_csv(fn, df):
-    # Create connection object and write file contents.
-    
-    fs = s3fs.S3FileSystem(anon=False)
-    with fs.open(fn, 'wt') as f:
-        df.to_csv(f, index=False)
-    # Reset cache so that new data gets loaded
-    read_csv.clear()
+    # Replace the whole table
+    with span('storage.write_csv', fn=fn, rows=len(df)):
+        get_storage().save_table(fn, df)
+        table_changed(fn)
+
+def upsert_rows(fn, rows):
+    # Insert new rows and update existing ones (matched on the table's key, e.g. "Name" or "Code")
+    get_storage().upsert_rows(fn, rows)
+    table_changed(fn)
+
+def delete_rows(fn, keys):
+    # Delete the rows with these keys
+    get_storage().delete_rows(fn, keys)
+    table_changed(fn)
 
 def select_instructions(df, tool_name):
     # Select the row where the Name matches the given name
@@ -29,13 +54,35 @@ def select_instructions(df, tool_name):
         introduction = selected_row["Introduction"].values[0]
         instructions = selected_row["Instructions"].values[0]
         guidelines = selected_row["Guidelines"].values[0]
-        knowledge = selected_row["Knowledge Base"].values[0]
+        knowledge = get_knowledge(selected_row)
         availability = selected_row["Availability"].values[0]
 
         return description, introduction, instructions, guidelines, knowledge, availability
     else:
         print(f"No entry found for {tool_name}")
 
+def get_knowledge(selected_row):
+    # Older tutors store their knowledge inline, newer ones store a hash of a separate object
+    knowledge = ''
+    if "Knowledge Base" in selected_row.columns:
+        knowledge = selected_row["Knowledge Base"].values[0]
+    if not knowledge and "Knowledge Hash" in selected_row.columns:
+        knowledge = load_knowledge(selected_row["Knowledge Hash"].values[0])
+    return knowledge
+
+def invalidate_cached_prompt(df, tool_name):
+    # Drop the provider's cached copy of the tutor's old system prompt (edited or deleted tutors)
+    if (open_config()['llm'].get('prefix_cache') or 'none') == 'none':
+        return
+    from llms.models import get_llm
+    from llms.prefix_cache import get_prefix_cache
+    prefix_cache = get_prefix_cache(get_llm())
+    selected_row = df[df["Name"] == tool_name]
+    if prefix_cache is None or selected_row.empty:
+        return
+    prefix_cache.invalidate_tutor(selected_row["Instructions"].values[0], selected_row["Guidelines"].values[0],
+                                  selected_row["Introduction"].values[0], get_knowledge(selected_row))
+
 def get_creator_email(df, tool_name):
     # Select the row where the Name matches the given name
     selected_row = df[df["Name"] == tool_name]
@@ -69,20 +116,6 @@ def available_tutors(df):
     # Zip names, descriptions, and creator emails into a list of tuples
     return list(zip(names, descriptions, creator_emails, grades, subjects, availability))
 
-# Dialog window to ask for overwrite priveleges
-@st.dialog("Overwrite")
-def ask_for_overwrite():
-    st.markdown(f"You already have an AI Tutor with this name.")
-    # Ask for confirmation
-    if st.button(f"Overwrite", type='primary', use_container_width=True):
-        st.session_state["overwrite"] = True
-        st.session_state["overwrite_dialog"] = False
-        st.rerun()
-    if st.button(f"Cancel", use_container_width=True):
-        st.session_state["overwrite"] = False
-        st.session_state["overwrite_dialog"] = False
-        st.rerun()
-
 def create_tutor(fn, new_name, new_descr, new_intro, 
                  new_instr, new_knowledge, new_guide, 
                  selected_grades, selected_subjects, 
@@ -90,13 +123,29 @@ def create_tutor(fn, new_name, new_descr, new_intro,
     # Read current csv
     df = read_csv(fn)
 
+    # Store the knowledge base separately so that the catalog stays small
+    new_knowledge_hash, new_knowledge_size = save_knowledge(new_knowledge)
+
+    # Index the knowledge base now (for the configured retrieval backend) so that the first conversation does not have to
+    llm_config = open_config()['llm']
+    if llm_config.get('knowledge_mode', 'prompt') == 'retrieval':
+        backend = llm_config.get('retrieval_backend', 'vector')
+        if backend == 'bm25':
+            from llms.bm25_index import save_bm25_index
+            save_bm25_index(new_knowledge)
+        elif backend == 'vector':
+            from llms.knowledge_index import save_knowledge_index
+            save_knowledge_index(new_knowledge)
+
     # Create a new row as a DataFrame
     new_row = pd.DataFrame({
         "Name": [new_name], 
         "Description": [new_descr],
         "Introduction": [new_intro],
         "Instructions": [new_instr], 
-        "Knowledge Base": [new_knowledge],
+        "Knowledge Base": [''],
+        "Knowledge Hash": [new_knowledge_hash],
+        "Knowledge Size": [new_knowledge_size],
         "Guidelines": [new_guide],
         "Grades": [selected_grades],
         "Subjects": [selected_subjects],
@@ -104,45 +153,60 @@ def create_tutor(fn, new_name, new_descr, new_intro,
         "Availability": [availability],
     })
     
+    # Add the knowledge columns to catalogs created before knowledge was stored separately
+    for column in ["Knowledge Hash", "Knowledge Size"]:
+        if column not in df.columns:
+            df[column] = ''
+
     if overwrite:
+        invalidate_cached_prompt(df, new_name)
+
         # Find the index of the row with the matching "Name"
         name_match_index = df[df['Name'] == new_name].index[0]
         
         # Overwrite the row with the new data
-        df.loc[name_match_index] = new_row.iloc[0]
+        df.loc[name_match_index, new_row.columns] = new_row.iloc[0]
     else:
         # Concatenate the new row to the DataFrame
         df = pd.concat([df, new_row], ignore_index=True)
     
-    # Write the updated DataFrame to a CSV file
-    write_csv(fn, df)
+    # Save only the new or updated row
+    upsert_rows(fn, new_row)
     
     return df
 
+def migrate_knowledge(fn):
+    """
+    Move knowledge bases stored inline in the tutor catalog into separate content-addressed objects.
+    """
+    df = load_csv(fn)
+    for column in ["Knowledge Hash", "Knowledge Size"]:
+        if column not in df.columns:
+            df[column] = ''
+    if "Knowledge Base" not in df.columns:
+        df["Knowledge Base"] = ''
+
+    num_migrated = 0
+    for i in df.index:
+        knowledge = df.at[i, "Knowledge Base"]
+        if knowledge:
+            df.at[i, "Knowledge Hash"], df.at[i, "Knowledge Size"] = save_knowledge(knowledge)
+            df.at[i, "Knowledge Base"] = ''
+            num_migrated += 1
+
+    if num_migrated > 0:
+        write_csv(fn, df)
+    return num_migrated
+
 def delete_tutor(fn, tool_name):
     # Read current csv
     df = read_csv(fn)
 
     # Check if the tool_name exists in the DataFrame
     if tool_name in df['Name'].values:
+        invalidate_cached_prompt(df, tool_name)
         # Remove the row with the matching 'Name'
         df = df[df['Name'] != tool_name]
-        # Write the updated DataFrame back to the CSV file
-        write_csv(fn, df)
-        st.success("Tutor removed successfully.")
-        return df
-    else:
-        st.error(f"Failed to remove '{tool_name}'.")
-        return df
-
-# Dialog window to confirm and delete Tutor
-@st.dialog("Delete Tutor")
-def delete_tutor_confirm(tutor_name):
-    st.markdown(f"Are you sure you want to delete the tutor '{tutor_name}'?")
-    # Ask for confirmation
-    if st.button(f"Delete", type='primary', use_container_width=True):
-        # Remove the key from the user config
-        st.session_state["df_tutors"] = delete_tutor(st.session_state["ai_tutors_data_fn"], tutor_name)
-        st.rerun()
-    if st.button(f"Cancel", use_container_width=True):
-        st.rerun()
\ No newline at end of file
+        # Delete the row from storage
+        delete_rows(fn, [tool_name])
+    return df
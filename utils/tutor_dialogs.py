@@ -0,0 +1,34 @@
+import streamlit as st
+
+from utils.tutor_data import delete_tutor
+
+# Dialog window to ask for overwrite priveleges
+@st.dialog("Overwrite")
+def ask_for_overwrite():
+    st.markdown(f"You already have an AI Tutor with this name.")
+    # Ask for confirmation
+    if st.button(f"Overwrite", type='primary', use_container_width=True):
+        st.session_state["overwrite"] = True
+        st.session_state["overwrite_dialog"] = False
+        st.rerun()
+    if st.button(f"Cancel", use_container_width=True):
+        st.session_state["overwrite"] = False
+        st.session_state["overwrite_dialog"] = False
+        st.rerun()
+
+# Dialog window to confirm and delete Tutor
+@st.dialog("Delete Tutor")
+def delete_tutor_confirm(tutor_name):
+    st.markdown(f"Are you sure you want to delete the tutor '{tutor_name}'?")
+    # Ask for confirmation
+    if st.button(f"Delete", type='primary', use_container_width=True):
+        # Remove the key from the user config
+        removed = tutor_name in st.session_state["df_tutors"]['Name'].values
+        st.session_state["df_tutors"] = delete_tutor(st.session_state["ai_tutors_data_fn"], tutor_name)
+        if removed:
+            st.success("Tutor removed successfully.")
+        else:
+            st.error(f"Failed to remove '{tutor_name}'.")
+        st.rerun()
+    if st.button(f"Cancel", use_container_width=True):
+        st.rerun()
\ No newline at end of file
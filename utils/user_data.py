@@ -1,7 +1,5 @@
 import streamlit as st
 
-import yaml
-from yaml.loader import SafeLoader
 import streamlit_authenticator as stauth
 from streamlit_authenticator.utilities import (CredentialsError,
                                                ForgotError,
@@ -11,29 +9,15 @@ from streamlit_authenticator.utilities import (CredentialsError,
                                                ResetError,
                                                UpdateError)
 
-#from st_files_connection import FilesConnection
-import s3fs
+from utils.storage import get_storage
 
 def hash_passwords(config):
     # Pre-hashing all plain text passwords once
     stauth.Hasher.hash_passwords(config['credentials'])
 
-@st.cache_data(show_spinner=False)
 def read_yaml(fn):
-    # Create connection object and retrieve file contents.
-    #conn = st.connection('s3', type=FilesConnection, ttl=0)
-    fs = s3fs.S3FileSystem(anon=False)
-
-    # Read the YAML file from S3 as a string
-    with fs.open(fn, 'r') as f:
-        yaml_content = f.read()
-
-    # Return pandas dataframe
-    return yaml.load(yaml_content, Loader=SafeLoader)
-
-    #with open(fn) as file:
-    #    config = yaml.load(file, Loader=SafeLoader)
-    #return config
+    # Retrieve the users config from storage (reads go through the shared object cache)
+    return get_storage().load_users(fn)
 
 def read_users(fn):
 
@@ -100,21 +84,12 @@ def delete_api_key(config, username, key_name):
         return False
 
 def save_yaml(fn, config):
-    # Saving config file
-    #with open(fn, 'w', encoding='utf-8') as file:
-    #    yaml.dump(config, file, default_flow_style=False)
-
-    # Convert the config dictionary into a YAML string
-    yaml_content = yaml.dump(config, default_flow_style=False)
-
-    #conn = st.connection('s3', type=FilesConnection, ttl=0)
-    fs = s3fs.S3FileSystem(anon=False)
+    # Save the whole users config
+    get_storage().save_users(fn, config)
 
-    # Open the connection and write the YAML content to S3
-    with fs.open(fn, "wt") as file:
-        file.write(yaml_content)
-    # Reset cache so that new data gets loaded
-    read_yaml.clear()
+def save_user(fn, config, username):
+    # Save only the entry of one user
+    get_storage().upsert_user(fn, config, username)
 
 
 def reset_password(authenticator):
@@ -0,0 +1,79 @@
+import threading
+import time
+import weakref
+
+from utils.tutor_data import object_version
+from utils.config import open_config
+
+# Seconds between checks for a new version of a file
+VERSION_CHECK_INTERVAL = open_config()['storage']['cache_revalidate_seconds']
+
+# Version of a value that has not been built yet
+_NOT_BUILT = object()
+
+class VersionedFile:
+    """
+    A value built from a stored file that is rebuilt only when the file changes.
+
+    The file's version (S3 ETag or mtime) is checked at most once every `check_interval` seconds,
+    so most calls to `get` return the current value without any request at all.
+    Writers call `invalidate_path` so that changes made in this process are picked up immediately.
+    """
+
+    def __init__(self, fn, build, check_interval=VERSION_CHECK_INTERVAL):
+        self.fn = fn
+        self.build = build
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self._value = None
+        self._version = _NOT_BUILT
+        self._last_check = None
+        _register(self)
+
+    @property
+    def version(self):
+        self._refresh_if_stale()
+        return self._version
+
+    def _is_fresh(self, now):
+        return self._last_check is not None and now - self._last_check < self.check_interval
+
+    def _refresh_if_stale(self):
+        now = time.monotonic()
+        if self._is_fresh(now):
+            return
+        with self.lock:
+            # Another thread may have refreshed the value while we were waiting
+            if self._is_fresh(now):
+                return
+            version = object_version(self.fn)
+            # After `invalidate` the value is only rebuilt if the file has actually changed
+            if version != self._version:
+                self._value = self.build()
+                self._version = version
+            self._last_check = time.monotonic()
+
+    def get(self):
+        """Return the current value, rebuilding it first if the file has changed"""
+        self._refresh_if_stale()
+        return self._value
+
+    def invalidate(self):
+        """Force the file's version to be checked on the next call to `get` (the value is rebuilt if it changed)"""
+        with self.lock:
+            self._last_check = None
+
+# All versioned files in this process, so that writers can invalidate them by path
+_registry = weakref.WeakSet()
+_registry_lock = threading.Lock()
+
+def _register(versioned_file):
+    with _registry_lock:
+        _registry.add(versioned_file)
+
+def invalidate_path(fn):
+    """Invalidate every versioned value built from this file"""
+    with _registry_lock:
+        versioned_files = [vf for vf in _registry if vf.fn == fn]
+    for versioned_file in versioned_files:
+        versioned_file.invalidate()